@@ -0,0 +1,536 @@
+import gc
+import os
+import sys
+import json
+import random
+import argparse
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+
+from clang_support import (PARSE_FULL, PARSE_DECLARATIONS, get_index, parse_options,
+                           configure_libclang, cursor_kinds)
+from new_parser import SOFModuleAnalyzer, SYMBOL_KINDS
+from parser import KernelCodeAnalyzer
+from symbol_index import SymbolIndex, ModuleView
+from symbol_table import REFS_NAME
+from symbol_store import SymbolStore, write_store
+from symbol_search import SymbolSearch
+
+# 解析模式基准：(名称, 解析模式, 是否提取宏)
+PARSE_MODES = [
+    ('full', PARSE_FULL, False),
+    ('full+macros', PARSE_FULL, True),
+    ('declarations', PARSE_DECLARATIONS, False),
+]
+
+
+def _open_symbols(directory):
+    """直接打开目录中的符号表（不经过 load_index 的进程内缓存）"""
+    for name, cls in (('symbols.bin', SymbolStore), ('symbols.json', SymbolIndex)):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return cls(path)
+    return None
+
+
+def _read_symbols(output_dir):
+    """读取所有模块的符号表，用于比较不同运行的结果"""
+    symbols = {}
+    table = _open_symbols(output_dir)
+    for mod in sorted(os.listdir(output_dir)):
+        mod_dir = os.path.join(output_dir, mod)
+        refs_path = os.path.join(mod_dir, REFS_NAME)
+        if table is not None and os.path.exists(refs_path):
+            symbols[mod] = ModuleView(table, refs_path).to_dict()
+        elif os.path.isdir(mod_dir):
+            index = _open_symbols(mod_dir)
+            if index is not None:
+                symbols[mod] = index.to_dict()
+    return symbols
+
+
+def synthetic_symbols(n_symbols, n_files=500):
+    """生成与分析器输出结构相同的符号表，用于存储格式基准"""
+    categories = ['functions', 'structures', 'enums', 'typedefs', 'macros']
+    symbols = {c: [] for c in categories}
+    for i in range(n_symbols):
+        category = categories[i % len(categories)]
+        item = {
+            'name': f'sof_symbol_{i}',
+            'file': f'sound/soc/sof/intel/file_{i % n_files}.c',
+            'line': i % 4000 + 1
+        }
+        if category == 'functions':
+            item['return_type'] = 'int'
+        symbols[category].append(item)
+    return symbols
+
+
+def bench_symbol_store(n_symbols=100000, lookups=10000):
+    """比较 indent-2 JSON 与二进制符号表的文件大小、加载时间和查询时间"""
+    symbols = synthetic_symbols(n_symbols)
+    names = [f'sof_symbol_{i}' for i in range(0, n_symbols, max(1, n_symbols // lookups))]
+    tmp_dir = tempfile.mkdtemp(prefix='sof_store_')
+    try:
+        json_path = os.path.join(tmp_dir, 'symbols.json')
+        bin_path = os.path.join(tmp_dir, 'symbols.bin')
+        with open(json_path, 'w') as f:
+            json.dump(symbols, f, indent=2)
+        write_store(bin_path, symbols)
+
+        results = {}
+        for name, path, cls in (('json', json_path, SymbolIndex), ('bin', bin_path, SymbolStore)):
+            gc.collect()
+            start = time.perf_counter()
+            index = cls(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            for symbol in names:
+                index.lookup(symbol)
+            lookup_us = (time.perf_counter() - start) * 1e6 / len(names)
+            results[name] = {
+                'bytes': os.path.getsize(path),
+                'load_ms': round(load_ms, 2),
+                'lookup_us': round(lookup_us, 2)
+            }
+            if cls is SymbolStore:
+                assert index.to_dict() == symbols
+                index.close()
+            del index  # 释放放在计时之外
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+NAME_WORDS = ('sof', 'hda', 'ipc', 'dsp', 'pcm', 'dai', 'widget', 'pipeline', 'stream', 'core',
+              'reset', 'power', 'probe', 'remove', 'trace', 'debug', 'fw', 'load', 'boot', 'ctrl',
+              'msg', 'tx', 'rx', 'irq', 'thread', 'setup', 'free', 'alloc', 'get', 'set', 'init',
+              'suspend', 'resume', 'route', 'tplg', 'comp', 'buffer', 'host', 'link', 'codec')
+
+
+def kernel_like_names(n_names, seed=0):
+    """生成形如 sof_ipc_tx_message3 的不重复符号名"""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < n_names:
+        words = rng.sample(NAME_WORDS, rng.randint(2, 5))
+        suffix = str(rng.randint(0, 99)) if rng.random() < 0.3 else ''
+        names.add('_'.join(words) + suffix)
+    return sorted(names)
+
+
+def _mutate(name, rng):
+    """对名称做一次随机的替换、删除或插入"""
+    i = rng.randrange(len(name))
+    op = rng.choice('sdi')
+    if op == 's':
+        return name[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + name[i + 1:]
+    if op == 'd':
+        return name[:i] + name[i + 1:]
+    return name[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + name[i:]
+
+
+def bench_search(n_symbols=100000, queries=2000, seed=0):
+    """符号搜索的建立时间和各类查询（精确、编译器后缀、前缀、编辑距离）的单次耗时"""
+    rng = random.Random(seed)
+    names = kernel_like_names(n_symbols, seed)
+    symbols = {'functions': [{'name': name, 'file': f'sound/soc/sof/file_{i % 500}.c',
+                              'line': i % 4000 + 1, 'return_type': 'int'}
+                             for i, name in enumerate(names)]}
+    tmp_dir = tempfile.mkdtemp(prefix='sof_search_')
+    try:
+        path = os.path.join(tmp_dir, 'symbols.bin')
+        write_store(path, symbols)
+        store = SymbolStore(path)
+        start = time.perf_counter()
+        search = SymbolSearch(store)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        sample = [rng.choice(names) for _ in range(queries)]
+        workloads = {
+            'exact': [(q, q) for q in sample],
+            'suffix': [(q + rng.choice(('.isra.0', '.constprop.0', '.part.1')), q) for q in sample],
+            'prefix': [(q[:max(4, len(q) * 2 // 3)], q) for q in sample],
+            'fuzzy': [(_mutate(q, rng), q) for q in sample],
+        }
+        results = {'symbols': n_symbols, 'build_ms': round(build_ms, 1)}
+        for kind, pairs in workloads.items():
+            found = 0
+            start = time.perf_counter()
+            for query, expected in pairs:
+                hits = search.search(query, limit=20)
+                # 前缀查询的结果超过 limit 时，结果全为前缀匹配也算命中
+                found += any(hit['name'] == expected for hit in hits) or (
+                    kind == 'prefix' and len(hits) == 20
+                    and all(hit['name'].startswith(query) for hit in hits))
+            elapsed = time.perf_counter() - start
+            results[kind] = {'us': round(elapsed * 1e6 / len(pairs), 1),
+                             'recall': round(found / len(pairs), 3)}
+        store.close()
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# 合成源码树的 .config：COMPRESS 未启用，对应的源文件存在但不应被解析
+SYNTHETIC_CONFIG = """\
+CONFIG_SND_SOC_SOF=m
+CONFIG_SND_SOC_SOF_PCI=m
+CONFIG_SND_SOC_SOF_IPC3=y
+CONFIG_SND_SOC_SOF_DEBUG=y
+# CONFIG_SND_SOC_SOF_COMPRESS is not set
+CONFIG_SND_SOC_SOF_INTEL_TOPLEVEL=y
+CONFIG_SND_SOC_SOF_INTEL_HDA=m
+"""
+
+
+def _objs(names):
+    """Kbuild 风格的对象列表，每行 4 个，用续行连接"""
+    objs = [f'{name}.o' for name in names]
+    return ' \\\n\t\t'.join(' '.join(objs[i:i + 4]) for i in range(0, len(objs), 4))
+
+
+def make_synthetic_tree(root, n_sources=40, header_depth=8, functions_per_file=5):
+    """生成类似内核的合成源码树
+
+    包括 .config、带续行和条件的 Kbuild 风格 SOF Makefile（含 intel/ 子目录）、
+    n_sources 个源文件和 header_depth 层逐级包含的公共头文件。snd-sof 的第一个文件
+    用 EXPORT_SYMBOL 导出接口，其他模块调用这些接口，形成真实的模块依赖。
+    返回 {'modules': {模块: [源文件]}, 'functions': [(模块, 函数名)], 'disabled': [源文件]}。
+    """
+    sof = os.path.join(root, 'sound', 'soc', 'sof')
+    include = os.path.join(root, 'include', 'linux', 'bench')
+    for d in (os.path.join(sof, 'intel'), include):
+        os.makedirs(d, exist_ok=True)
+    with open(os.path.join(root, '.config'), 'w') as f:
+        f.write(SYNTHETIC_CONFIG)
+
+    # 逐级包含的公共头文件
+    for i in range(header_depth):
+        nxt = f'#include <linux/bench/hdr{i + 1}.h>\n' if i + 1 < header_depth else ''
+        with open(os.path.join(include, f'hdr{i}.h'), 'w') as f:
+            f.write(f'#ifndef BENCH_HDR{i}\n#define BENCH_HDR{i}\n{nxt}'
+                    f'struct bench_s{i} {{ int a; long b; }};\n'
+                    f'typedef struct bench_s{i} bench_t{i};\n'
+                    f'enum bench_e{i} {{ BENCH_E{i}_A, BENCH_E{i}_B }};\n'
+                    f'int hfunc{i}(int x);\n'
+                    f'static inline int hinline{i}(int x) {{ return hfunc{i}(x) + {i}; }}\n'
+                    f'#endif\n')
+    with open(os.path.join(include, 'export.h'), 'w') as f:
+        f.write('#ifndef BENCH_EXPORT\n#define BENCH_EXPORT\n'
+                '#define EXPORT_SYMBOL(sym) extern typeof(sym) sym\n'
+                '#define EXPORT_SYMBOL_GPL(sym) extern typeof(sym) sym\n#endif\n')
+    with open(os.path.join(sof, 'sof-priv.h'), 'w') as f:
+        f.write('#ifndef SOF_PRIV_H\n#define SOF_PRIV_H\n#include <linux/bench/hdr0.h>\n'
+                '#include <linux/bench/export.h>\nstruct snd_sof_dev { int id; };\n'
+                + ''.join(f'int sof_core_api{k}(int x);\n' for k in range(4)) + '#endif\n')
+
+    # 源文件分配：snd-sof（普通 / ipc3 条件 / debug 条件）、snd-sof-pci、intel/ 子目录模块
+    n_core = max(2, n_sources // 2)
+    n_pci = max(1, n_sources // 5)
+    n_intel = max(1, n_sources - n_core - n_pci)
+    layout = {
+        'snd-sof': [f'core{i}' for i in range(n_core)],
+        'snd-sof-pci': [f'pci{i}' for i in range(n_pci)],
+        'snd-sof-intel-hda': [f'intel/hda{i}' for i in range(n_intel)],
+    }
+    disabled = [f'compress{i}' for i in range(max(1, n_sources // 20))]
+
+    info = {'modules': {}, 'functions': [], 'disabled': []}
+    for module, names in list(layout.items()) + [(None, disabled)]:
+        for i, name in enumerate(names):
+            path = os.path.join(sof, name + '.c')
+            lines = ['#include "sof-priv.h"\n' if module != 'snd-sof-intel-hda'
+                     else '#include "../sof-priv.h"\n']
+            if module == 'snd-sof' and i == 0:
+                for k in range(4):
+                    lines.append(f'int sof_core_api{k}(int x) {{ return hinline{k % header_depth}(x); }}\n'
+                                 f'EXPORT_SYMBOL(sof_core_api{k});\n')
+            stem = name.replace('/', '_').replace('-', '_')
+            for j in range(functions_per_file):
+                fn = f'sof_{stem}_fn{j}'
+                call = f'sof_core_api{j % 4}(x)' if module != 'snd-sof' else f'hfunc{j % header_depth}(x)'
+                lines.append(f'static int {fn}_helper(int x) {{ struct bench_s{j % header_depth} s = {{ x, 0 }}; '
+                             f'return s.a + {j}; }}\n'
+                             f'int {fn}(int x) {{ return {fn}_helper(x) + {call}; }}\n')
+                if module:
+                    info['functions'].append((module, fn))
+            with open(path, 'w') as f:
+                f.writelines(lines)
+            if module:
+                info['modules'].setdefault(module, []).append(path)
+            else:
+                info['disabled'].append(path)
+
+    core = layout['snd-sof']
+    third = max(1, len(core) // 3)
+    with open(os.path.join(sof, 'Makefile'), 'w') as f:
+        f.write('# SPDX-License-Identifier: GPL-2.0\n\n'
+                f'snd-sof-objs := {_objs(core[:third])}\n\n'
+                'ifneq ($(CONFIG_SND_SOC_SOF_IPC3),)\n'
+                f'snd-sof-objs += {_objs(core[third:2 * third])}\n'
+                'endif\n\n'
+                f'snd-sof-$(CONFIG_SND_SOC_SOF_DEBUG) += {_objs(core[2 * third:])}\n'
+                f'snd-sof-$(CONFIG_SND_SOC_SOF_COMPRESS) += {_objs(disabled)}\n\n'
+                f'PCI_OBJS := {_objs(layout["snd-sof-pci"])}\n'
+                'snd-sof-pci-objs := $(PCI_OBJS)\n\n'
+                'obj-$(CONFIG_SND_SOC_SOF) += snd-sof.o\n'
+                'obj-$(CONFIG_SND_SOC_SOF_PCI) += snd-sof-pci.o\n'
+                'obj-$(CONFIG_SND_SOC_SOF_INTEL_TOPLEVEL) += intel/\n')
+    with open(os.path.join(sof, 'intel', 'Makefile'), 'w') as f:
+        hda = [os.path.basename(n) for n in layout['snd-sof-intel-hda']]
+        f.write('ifdef CONFIG_SND_SOC_SOF_INTEL_HDA\n'
+                f'snd-sof-intel-hda-objs := {_objs(hda)}\n'
+                'endif\n'
+                'obj-$(CONFIG_SND_SOC_SOF_INTEL_HDA) += snd-sof-intel-hda.o\n')
+    return info
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+_STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {package!r})
+from new_parser import SOFModuleAnalyzer
+analyzer = SOFModuleAnalyzer({root!r}, lookup_only={lookup_only}, output_dir={output_dir!r})
+analyzer.find_symbol_definition({symbol!r}, 'functions')
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def bench_startup(kernel_root, output_dir, symbol, repeat=3):
+    """新进程中从导入到第一次查询完成的耗时（毫秒）：普通模式与 lookup_only 模式"""
+    package = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for mode, lookup_only in (('full', False), ('lookup_only', True)):
+        script = _STARTUP_SCRIPT.format(package=package, root=kernel_root, output_dir=output_dir,
+                                        symbol=symbol, lookup_only=lookup_only)
+        runs = [float(subprocess.check_output([sys.executable, '-c', script]))
+                for _ in range(repeat)]
+        results[mode] = round(min(runs), 1)
+    return results
+
+
+def bench_scaling(sizes=(20, 80, 320), jobs=1, queries=1000, header_depth=8, seed=0):
+    """在不同规模的合成源码树上计时两个分析器的主要入口，得到可跟踪回归的扩展曲线
+
+    每个规模计时：generate_all_units（冷启动和无变化的增量运行）、generate_code_units、
+    find_symbol_definition 和 match_dmesg（单次查询的平均微秒数）。
+    """
+    rng = random.Random(seed)
+    rows = []
+    for n in sizes:
+        root = tempfile.mkdtemp(prefix=f'sof_tree_{n}_')
+        try:
+            info = make_synthetic_tree(root, n, header_depth)
+            units_dir = os.path.join(root, 'out_units')
+            code_dir = os.path.join(root, 'out_code')
+
+            analyzer = SOFModuleAnalyzer(kernel_root=root)
+            cold, _ = _timed(analyzer.generate_all_units, units_dir, jobs=jobs)
+            warm, _ = _timed(SOFModuleAnalyzer(kernel_root=root).generate_all_units,
+                             units_dir, jobs=jobs)
+            parsed = sum(len(analyzer.get_module_sources(m)) for m in analyzer.modules)
+
+            kernel = KernelCodeAnalyzer(kernel_root=root)
+            kernel.build_module_map()
+            code, _ = _timed(kernel.generate_code_units, code_dir)
+
+            samples = [rng.choice(info['functions']) for _ in range(queries)]
+            found = 0
+            start = time.perf_counter()
+            for module, fn in samples:
+                found += bool(analyzer.find_symbol_definition(fn, 'functions'))
+            find_us = (time.perf_counter() - start) * 1e6 / queries
+
+            lines = [f"[ {i}.000] {module.replace('-', '_')}: error: {fn}: timeout at x.c:1"
+                     for i, (module, fn) in enumerate(samples)]
+            matched = 0
+            start = time.perf_counter()
+            for line in lines:
+                matched += kernel.match_dmesg(line, code_dir) is not None
+            match_us = (time.perf_counter() - start) * 1e6 / queries
+            startup = bench_startup(root, units_dir, samples[0][1])
+
+            rows.append({
+                'sources': n,
+                'parsed': parsed,
+                'generate_all_units_s': round(cold, 3),
+                'incremental_s': round(warm, 3),
+                'generate_code_units_s': round(code, 3),
+                'find_symbol_us': round(find_us, 2),
+                'match_dmesg_us': round(match_us, 2),
+                'startup_ms': startup['full'],
+                'lookup_startup_ms': startup['lookup_only'],
+                'found': found / queries,
+                'matched': matched / queries
+            })
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    return rows
+
+
+def _parse_one(args):
+    """在全新的子进程中解析一个 TU，返回 (耗时毫秒, 峰值 RSS KB)"""
+    src_file, compile_args, options = args
+    start = time.perf_counter()
+    tu = get_index().parse(src_file, args=compile_args, options=options)
+    elapsed = (time.perf_counter() - start) * 1000
+    del tu
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_parse_modes(kernel_root, source_files):
+    """比较各解析模式下每个 TU 的解析耗时和峰值 RSS"""
+    analyzer = SOFModuleAnalyzer(kernel_root=kernel_root)
+    results = []
+    for name, mode, macros in PARSE_MODES:
+        options = parse_options(mode, macros)
+        tasks = [(f, analyzer.compile_args, options) for f in source_files]
+        # 每个 TU 使用新进程，峰值 RSS 才能对应单个 TU
+        with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+            samples = pool.map(_parse_one, tasks, chunksize=1)
+        for src_file, (ms, rss_kb) in zip(source_files, samples):
+            results.append({
+                'mode': name,
+                'file': os.path.relpath(src_file, kernel_root),
+                'parse_ms': round(ms, 2),
+                'peak_rss_kb': rss_kb
+            })
+    return results
+
+
+def _recursive_symbols(cursor, kernel_root, symbols, kinds=None):
+    """改写前的递归遍历，仅作为遍历基准的对照"""
+    if kinds is None:
+        kinds = cursor_kinds(SYMBOL_KINDS)
+    if cursor.location.file is None:
+        return
+    file_path = cursor.location.file.name
+    if not file_path.startswith(kernel_root):
+        return
+    key = kinds.get(cursor.kind)
+    if key:
+        symbols.append((key, cursor.spelling, os.path.relpath(file_path, kernel_root)))
+    for child in cursor.get_children():
+        _recursive_symbols(child, kernel_root, symbols, kinds)
+
+
+def bench_traversal(kernel_root, source_files, symbol_scope=None, repeat=3):
+    """比较递归遍历与显式栈遍历的耗时（同一批已解析的 TU）"""
+    analyzer = SOFModuleAnalyzer(kernel_root=kernel_root, symbol_scope=symbol_scope)
+    cursors = [c for c in (analyzer.parse_file_ast(f) for f in source_files) if c]
+
+    def recursive():
+        for cursor in cursors:
+            symbols = []
+            for child in cursor.get_children():
+                _recursive_symbols(child, analyzer.kernel_root, symbols)
+
+    def iterative():
+        for cursor in cursors:
+            analyzer.extract_symbols(cursor)
+
+    results = {}
+    for name, fn in (('recursive', recursive), ('iterative', iterative)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = round(best * 1000, 2)
+    results['speedup'] = round(results['recursive'] / results['iterative'], 2)
+    return results
+
+
+def bench_parallel(kernel_root, worker_counts=(1, 4, 16)):
+    """比较不同 worker 数下 generate_all_units 的墙钟时间，并校验结果一致"""
+    results = []
+    baseline = None
+    for jobs in worker_counts:
+        output_dir = tempfile.mkdtemp(prefix=f'sof_bench_j{jobs}_')
+        try:
+            analyzer = SOFModuleAnalyzer(kernel_root=kernel_root)
+            start = time.perf_counter()
+            analyzer.generate_all_units(output_dir, jobs=jobs)
+            elapsed = time.perf_counter() - start
+            symbols = _read_symbols(output_dir)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        if baseline is None:
+            baseline = symbols
+        results.append({
+            'jobs': jobs,
+            'seconds': round(elapsed, 3),
+            'speedup': round(results[0]['seconds'] / elapsed, 2) if results else 1.0,
+            'identical': symbols == baseline
+        })
+    return results
+
+
+def _print_scaling(rows):
+    print(f"{'源文件':>6} {'解析':>6} {'generate_all_units':>19} {'增量':>8} "
+          f"{'generate_code_units':>20} {'查找符号':>10} {'匹配日志':>10} {'启动':>9} {'查询模式启动':>9}")
+    for row in rows:
+        print(f"{row['sources']:>8} {row['parsed']:>8} {row['generate_all_units_s']:>18.3f}s "
+              f"{row['incremental_s']:>9.3f}s {row['generate_code_units_s']:>19.3f}s "
+              f"{row['find_symbol_us']:>9.1f}us {row['match_dmesg_us']:>9.1f}us "
+              f"{row['startup_ms']:>9.1f}ms {row['lookup_startup_ms']:>9.1f}ms")
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description='分析器基准测试')
+    cli.add_argument('kernel_root', nargs='?', default="/path/to/linux-kernel",
+                     help='真实内核源码树（不使用 --synthetic 时）')
+    cli.add_argument('--synthetic', metavar='SIZES',
+                     help='在合成源码树上测扩展曲线，逗号分隔的源文件数，如 20,80,320')
+    cli.add_argument('--jobs', type=int, default=1, help='generate_all_units 的 worker 数')
+    cli.add_argument('--libclang', help='libclang 库文件（默认自动查找，见 clang_support.find_libclang）')
+    cli.add_argument('--json', help='把合成基准结果写入 JSON 文件，便于跟踪回归')
+    opts = cli.parse_args()
+    configure_libclang(opts.libclang)
+
+    if opts.synthetic:
+        rows = bench_scaling([int(n) for n in opts.synthetic.split(',')], jobs=opts.jobs)
+        _print_scaling(rows)
+        if opts.json:
+            with open(opts.json, 'w') as f:
+                json.dump(rows, f, indent=2)
+        sys.exit(0)
+
+    KERNEL_ROOT = opts.kernel_root
+
+    for row in bench_parallel(KERNEL_ROOT):
+        print(f"jobs={row['jobs']:>3}  {row['seconds']:>8.3f}s  "
+              f"加速比 {row['speedup']:>5.2f}  结果一致: {row['identical']}")
+
+    analyzer = SOFModuleAnalyzer(kernel_root=KERNEL_ROOT)
+    analyzer.parse_makefile(os.path.join(analyzer.sof_path, 'Makefile'))
+    sources = [f for mod in analyzer.modules for f in analyzer.get_module_sources(mod)
+               if os.path.exists(f)]
+    for row in bench_parse_modes(KERNEL_ROOT, sources):
+        print(f"{row['mode']:<14} {row['file']:<50} {row['parse_ms']:>9.2f} ms  "
+              f"{row['peak_rss_kb']:>8} KB")
+
+    for fmt, row in bench_symbol_store().items():
+        print(f"符号表 {fmt:<5} {row['bytes']:>12} 字节  加载 {row['load_ms']:>9.2f} ms  "
+              f"查询 {row['lookup_us']:>7.2f} us")
+
+    row = bench_search()
+    print(f"符号搜索 ({row['symbols']} 个符号, 建立 {row['build_ms']} ms): " + ", ".join(
+        f"{kind} {row[kind]['us']} us" for kind in ('exact', 'suffix', 'prefix', 'fuzzy')))
+
+    for scope in (None, analyzer.sof_path):
+        row = bench_traversal(KERNEL_ROOT, sources, symbol_scope=scope)
+        print(f"遍历 (范围 {scope or KERNEL_ROOT}): 递归 {row['recursive']} ms, "
+              f"显式栈 {row['iterative']} ms, 加速比 {row['speedup']}")
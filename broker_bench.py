@@ -0,0 +1,254 @@
+"""Benchmarks of the dispatcher, workers, publisher and codecs against LocalBroker
+
+Run with `python test.py bench`; no RabbitMQ needed.
+"""
+
+import sys
+import time
+import json
+import pika
+import threading
+
+from contextlib import contextmanager
+from threading import Event
+
+from codec import JSON_CODEC, PACKED_CODEC, decode
+from dispatch import dispatcher, worker, pipeline
+from local_broker import LocalBroker
+from publisher import Publisher
+from routing import RoundRobin, LeastOutstanding, SharedQueue
+
+
+class _Discard(object):
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+@contextmanager
+def _quiet():
+    """Silence the per-message prints of all threads while benchmarking"""
+    stdout, sys.stdout = sys.stdout, _Discard()
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def bench_worker(n_jobs=200, prefetch=4, concurrency=2, job_units=(1, 5, 10),
+                 time_scale=0.001):
+    """Throughput and latency of one worker against a LocalBroker
+
+    Jobs of job_units (cycled) are published at once, each unit taking time_scale
+    seconds; latency is publish -> result received. prefetch=0 means unlimited.
+    """
+    broker = LocalBroker()
+    w = worker("bench_worker", 2, prefetch=prefetch, concurrency=concurrency,
+               connect=broker.connect, time_scale=time_scale)
+    conn = broker.connect()
+    channel = conn.channel()
+    channel.queue_declare(queue="bench_worker")
+    channel.queue_declare(queue="result")
+    sent = {}
+    latencies = []
+
+    def on_result(ch, method, properties, body):
+        r = decode(properties, body)
+        latencies.append(time.time() - sent[r["id"]])
+        if len(latencies) == n_jobs:
+            ch.stop_consuming()
+    channel.basic_consume(on_result, queue="result", no_ack=True)
+
+    with _quiet():
+        w.start()
+        start = time.time()
+        for i in range(n_jobs):
+            sent[i] = time.time()
+            channel.basic_publish(exchange='', routing_key="bench_worker",
+                                  body=json.dumps({"job": job_units[i % len(job_units)], "id": i}))
+        channel.start_consuming()
+        elapsed = time.time() - start
+        w.stop()
+        w.join(5)
+    return {"prefetch": prefetch, "concurrency": concurrency, "jobs": n_jobs,
+            "jobs_per_sec": round(n_jobs / elapsed, 1),
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1)}
+
+
+def bench_routing(policy_class, n_workers=4, n_events=200, sizes=(1,) * 9 + (40,),
+                  time_scale=0.002):
+    """Latency of listener -> dispatcher -> workers with skewed job sizes
+
+    Every tenth job is 40x longer; each worker runs one job at a time.
+    """
+    broker = LocalBroker()
+    policy = policy_class()
+    sent = {}
+    latencies = []
+    finished = Event()
+
+    def on_result(record):
+        latencies.append(time.time() - sent[record["id"]])
+        if len(latencies) == n_events:
+            finished.set()
+
+    with _quiet():
+        d = dispatcher(policy=policy, connect=broker.connect, on_result=on_result)
+        d.start()
+        workers = [worker("bench_worker_%d" % i, 1, prefetch=1, concurrency=1,
+                          connect=broker.connect, time_scale=time_scale, queue=policy.queue)
+                   for i in range(n_workers)]
+        for w in workers:
+            w.start()
+        while len(policy.names) < n_workers:
+            time.sleep(0.01)
+        threads = threading.active_count()
+        conn = broker.connect()
+        channel = conn.channel()
+        start = time.time()
+        for i in range(n_events):
+            sent[i] = time.time()
+            channel.basic_publish(exchange='', routing_key='gerrit_event',
+                                  body=json.dumps({"value": sizes[i % len(sizes)], "id": i}))
+        finished.wait(120)
+        elapsed = time.time() - start
+        for w in workers:
+            w.stop()
+        d.stop()
+        for t in workers + [d]:
+            t.join(5)
+    return {"policy": policy_class.__name__, "events": n_events, "workers": n_workers,
+            "threads": threads, "connections": broker.connections,
+            "seconds": round(elapsed, 2),
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1)}
+
+
+def bench_pipeline(n_workers=4, n_events=200, sizes=(1,) * 9 + (40,), time_scale=0.002,
+                   cpu=False, processes=2):
+    """bench_routing's workload through pipeline: one connection, one thread
+
+    cpu=True runs crunch() on a process pool of `processes` instead of sleeping.
+    """
+    broker = LocalBroker()
+    sent = {}
+    latencies = []
+
+    def on_result(record):
+        latencies.append(time.time() - sent[record["id"]])
+
+    with _quiet():
+        p = pipeline(connect=broker.connect, on_result=on_result,
+                     processes=processes if cpu else 0)
+        p.start()
+        for i in range(n_workers):
+            p.add_worker("bench_worker_%d" % i, 1, prefetch=1, time_scale=time_scale, cpu=cpu)
+        p.run(until=lambda: len(p.policy.names) == n_workers, timeout=5)
+        threads = threading.active_count()
+        start = time.time()
+        for i in range(n_events):
+            sent[i] = time.time()
+            p.publish_event(sizes[i % len(sizes)], i)
+        p.run(until=lambda: len(latencies) == n_events, timeout=120)
+        elapsed = time.time() - start
+        p.stop()
+    return {"pipeline": "cpu" if cpu else "sleep", "events": n_events, "workers": n_workers,
+            "threads": threads, "connections": broker.connections,
+            "seconds": round(elapsed, 2),
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1)}
+
+
+def bench_publisher(n_messages=20000, mode="batched", nack_rate=0.0):
+    """Publish rate into a LocalBroker queue, counted until the last message arrived
+
+    mode: "naive" builds properties and publishes per message without confirms,
+    "confirm_each" waits for each confirm before the next publish, "batched" uses
+    Publisher (pipelined confirms, retries of nacked messages).
+    """
+    broker = LocalBroker(nack_rate=nack_rate)
+    conn = broker.connect()
+    channel = conn.channel()
+    channel.queue_declare(queue="bench_publish")
+    received = []
+    consumer = broker.connect()
+    consumer.channel().basic_consume(lambda ch, method, properties, body: received.append(body),
+                                     queue="bench_publish", no_ack=True)
+    confirmed = []
+    failed = 0
+    start = time.time()
+    if mode == "batched":
+        publisher = Publisher(conn, channel)
+        for i in range(n_messages):
+            publisher.publish("bench_publish", {"value": i}, confirmed.append)
+        publisher.drain(60)
+        failed = publisher.failed
+    else:
+        acks = []
+        if mode == "confirm_each":
+            channel.confirm_delivery(acks.append)
+        for i in range(n_messages):
+            _prop = pika.BasicProperties(content_type='application/json',)
+            channel.basic_publish(exchange='', routing_key="bench_publish",
+                                  properties=_prop, body=json.dumps({"value": i}))
+            if mode == "confirm_each":
+                while not acks:
+                    conn.process_data_events(time_limit=0.01)
+                confirmed.append(acks.pop().method.NAME == 'Basic.Ack')
+    while len(received) < n_messages - failed and time.time() - start < 60:
+        consumer.process_data_events(time_limit=0.01)
+    elapsed = time.time() - start
+    return {"mode": mode, "messages": n_messages, "nack_rate": nack_rate,
+            "received": len(received), "confirmed": sum(1 for ok in confirmed if ok),
+            "msgs_per_sec": round(n_messages / elapsed)}
+
+
+def bench_codec(n=100000, codecs=(JSON_CODEC, PACKED_CODEC)):
+    """Per-message encode/decode cost and body size of each codec on the
+    messages this pipeline sends"""
+    messages = [("event", {"value": 8, "id": 12345}), ("job", {"job": 8, "id": 12345}),
+                ("result", {"worker": "worker_far", "result": 16, "id": 12345}),
+                ("register", {"register": "worker_far"})]
+    rows = []
+    for codec in codecs:
+        for label, message in messages:
+            properties, body = codec.encode(message)
+            assert decode(properties, body) == message
+            start = time.time()
+            for _ in xrange(n):
+                codec.encode(message)
+            encode_s = time.time() - start
+            start = time.time()
+            for _ in xrange(n):
+                decode(properties, body)
+            decode_s = time.time() - start
+            rows.append({"codec": codec.content_type, "message": label,
+                         "bytes": len(body),
+                         "encode_us": round(encode_s / n * 1e6, 2),
+                         "decode_us": round(decode_s / n * 1e6, 2)})
+    return rows
+
+
+def main():
+    """Run every benchmark and print one row per configuration"""
+    for prefetch, concurrency in ((0, 1), (1, 1), (4, 2), (8, 4), (16, 8)):
+        print bench_worker(prefetch=prefetch, concurrency=concurrency)
+    for policy in (RoundRobin, LeastOutstanding, SharedQueue):
+        print bench_routing(policy)
+    for n_workers in (4, 16):
+        print bench_routing(LeastOutstanding, n_workers=n_workers)
+        print bench_pipeline(n_workers=n_workers)
+    print bench_pipeline(cpu=True)
+    for mode in ("naive", "confirm_each", "batched"):
+        print bench_publisher(mode=mode)
+    print bench_publisher(mode="batched", nack_rate=0.01)
+    for row in bench_codec():
+        print row
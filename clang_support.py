@@ -0,0 +1,403 @@
+import os
+import re
+import glob
+import json
+
+# 解析模式
+PARSE_FULL = 'full'                  # 完整解析，包括函数体
+PARSE_DECLARATIONS = 'declarations'  # 只需要声明：跳过函数体
+
+# 系统中 libclang 的常见安装位置，同时存在多个版本时取版本号最高的
+LIBCLANG_PATTERNS = (
+    '/usr/lib/llvm-*/lib/libclang.so*',
+    '/usr/lib/llvm*/lib/libclang.so*',
+    '/usr/lib64/libclang.so*',
+    '/usr/lib/x86_64-linux-gnu/libclang-*.so*',
+    '/usr/local/opt/llvm/lib/libclang.dylib',
+)
+
+_cindex = None
+_index = None
+_index_pid = None
+
+
+def cindex():
+    """按需导入 clang.cindex：只查询已生成的符号表时不导入 libclang 绑定"""
+    global _cindex
+    if _cindex is None:
+        import clang.cindex
+        _cindex = clang.cindex
+    return _cindex
+
+
+def cursor_kinds(kinds):
+    """{游标类型名: 值} -> {CursorKind: 值}，遍历时直接按 node.kind 查表"""
+    return {getattr(cindex().CursorKind, name): value for name, value in kinds.items()}
+
+
+def _version_key(path):
+    return tuple(int(n) for n in re.findall(r'\d+', path))
+
+
+def find_libclang(path=None):
+    """查找 libclang 库文件
+
+    顺序：显式路径、LIBCLANG_PATH 环境变量、clang 绑定自带的库（libclang wheel）、
+    系统常见安装位置。都找不到时返回 None，由 clang 绑定按默认规则加载。
+    """
+    for candidate in (path, os.environ.get('LIBCLANG_PATH')):
+        if candidate:
+            return candidate
+    # library_path 为 None 时不能拼成相对路径，否则会匹配当前目录下的文件
+    library_path = cindex().Config.library_path
+    if library_path and glob.glob(os.path.join(library_path, 'libclang*')):
+        return None
+    # libclang-cpp 是 C++ 接口库，clang 绑定需要的是 C 接口的 libclang
+    found = [p for pattern in LIBCLANG_PATTERNS for p in glob.glob(pattern)
+             if not os.path.basename(p).startswith('libclang-cpp')]
+    return max(found, key=_version_key) if found else None
+
+
+def configure_libclang(path=None):
+    """首次使用 libclang 之前设置库文件
+
+    libclang 已加载后不能再更换；已经显式设置过库文件时，不带 path 的调用不会覆盖它。
+    """
+    config = cindex().Config
+    if config.loaded or (config.library_file and path is None):
+        return
+    path = find_libclang(path)
+    if path:
+        config.set_library_file(path)
+
+
+def get_index():
+    """返回当前进程共享的 libclang Index，fork 出的子进程会重新创建自己的实例"""
+    global _index, _index_pid
+    if _index is None or _index_pid != os.getpid():
+        _index = cindex().Index.create()
+        _index_pid = os.getpid()
+    return _index
+
+
+def parse_options(mode=PARSE_FULL, macros=False):
+    """根据解析模式计算 TranslationUnit 解析选项
+
+    只有需要提取宏定义时才开启详细预处理记录。
+    """
+    if mode not in (PARSE_FULL, PARSE_DECLARATIONS):
+        raise ValueError(f"未知的解析模式: {mode}")
+    tu = cindex().TranslationUnit
+    options = 0
+    if mode == PARSE_DECLARATIONS:
+        options |= tu.PARSE_SKIP_FUNCTION_BODIES | tu.PARSE_INCOMPLETE
+    if macros:
+        options |= tu.PARSE_DETAILED_PROCESSING_RECORD
+    return options
+
+
+def walk_in_scope(root, base, scope=None, relpaths=None):
+    """以显式栈先序遍历 root 的子树，只访问位于 scope 目录内的游标
+
+    位于范围外文件（或没有文件）的游标连同其子树一起跳过，不再下探。
+    生成 (游标, 位置, 相对 base 的文件路径)。
+    relpaths 用于跨调用记忆化 文件名 -> 相对路径（范围外为 None）。
+    """
+    scope = scope or base
+    prefix = scope.rstrip(os.sep) + os.sep
+    if relpaths is None:
+        relpaths = {}
+
+    stack = list(root.get_children())
+    stack.reverse()
+    while stack:
+        cursor = stack.pop()
+        location = cursor.location
+        loc_file = location.file
+        if loc_file is None:
+            continue
+        file_name = loc_file.name
+        try:
+            rel_path = relpaths[file_name]
+        except KeyError:
+            in_scope = file_name.startswith(prefix)
+            rel_path = os.path.relpath(file_name, base) if in_scope else None
+            relpaths[file_name] = rel_path
+        if rel_path is None:
+            continue
+
+        yield cursor, location, rel_path
+
+        children = list(cursor.get_children())
+        children.reverse()
+        stack.extend(children)
+
+
+# 参与模块间链接的声明
+LINK_KINDS = ('FUNCTION_DECL', 'VAR_DECL')
+_link_kinds = None
+
+
+def _link_cursor_kinds():
+    global _link_kinds
+    if _link_kinds is None:
+        _link_kinds = tuple(cursor_kinds(dict.fromkeys(LINK_KINDS)))
+    return _link_kinds
+
+
+def exported_symbols(tu):
+    """主文件中 EXPORT_SYMBOL*(name) 导出的符号名
+
+    按词法记号扫描，不依赖宏展开的结果（不同内核版本展开方式不同）。
+    """
+    exports = []
+    tokens = list(tu.cursor.get_tokens())
+    for i, token in enumerate(tokens[:-2]):
+        if (token.spelling.startswith('EXPORT_SYMBOL') and tokens[i + 1].spelling == '('
+                and (i == 0 or tokens[i - 1].spelling != 'define')):
+            exports.append(tokens[i + 2].spelling)
+    return exports
+
+
+def link_reference(cursor):
+    """游标引用的外部链接函数/变量名，不是这种引用时返回 None"""
+    clang = cindex()
+    if cursor.kind != clang.CursorKind.DECL_REF_EXPR:
+        return None
+    ref = cursor.referenced
+    if (ref is None or ref.kind not in _link_cursor_kinds()
+            or ref.linkage != clang.LinkageKind.EXTERNAL):
+        return None
+    return ref.spelling
+
+
+def link_definition(cursor):
+    """游标定义的外部链接函数/变量名，不是这种定义时返回 None"""
+    if (cursor.kind in _link_cursor_kinds() and cursor.linkage == cindex().LinkageKind.EXTERNAL
+            and cursor.is_definition()):
+        return cursor.spelling
+    return None
+
+
+SYSTEM_INCLUDE_PATTERN = re.compile(r'#\s*include\s*<([^>]+)>')
+COMMENT_PATTERN = re.compile(r'/\*.*?\*/|//[^\n]*', re.DOTALL)
+
+
+def leading_includes(src_file):
+    """源文件开头连续的 <...> 头文件（之前只能有注释和空行）
+
+    第一个 #include 之前有 #define 等其他指令或代码时返回 None：这类文件
+    （pr_fmt、CREATE_TRACE_POINTS、DEBUG）包含头文件时的宏状态与 PCH 不同。
+    """
+    with open(src_file, 'r', errors='replace') as f:
+        text = COMMENT_PATTERN.sub(' ', f.read())
+    headers = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = SYSTEM_INCLUDE_PATTERN.fullmatch(line)
+        if match:
+            headers.append(match.group(1))
+            continue
+        if not headers and not line.replace(' ', '').startswith('#include'):
+            return None
+        break
+    return headers
+
+
+def common_includes(source_files):
+    """选出可共享预编译头的头文件和使用它的源文件，返回 (头文件列表, 源文件列表)
+
+    PCH 相当于在文件开头强制包含这些头文件，所以只取各文件开头连续 <...> 头文件的
+    公共前缀：以最多文件共有的第一个头文件为准，其余文件（以及开头有宏定义的文件）
+    不使用 PCH，按原样解析。
+    """
+    prefixes = {}
+    for src_file in source_files:
+        headers = leading_includes(src_file)
+        if headers:
+            prefixes[src_file] = headers
+    if not prefixes:
+        return [], []
+    firsts = {}
+    for headers in prefixes.values():
+        firsts[headers[0]] = firsts.get(headers[0], 0) + 1
+    first = max(firsts, key=firsts.get)
+    users = [f for f, headers in prefixes.items() if headers[0] == first]
+    common = prefixes[users[0]]
+    for src_file in users[1:]:
+        headers = prefixes[src_file]
+        n = 0
+        while n < min(len(common), len(headers)) and common[n] == headers[n]:
+            n += 1
+        common = common[:n]
+    return list(dict.fromkeys(common)), users
+
+
+# 每个文件或模块各不相同、但头文件不依赖的宏；分组共享 PCH 时忽略
+PER_FILE_DEFINES = ('-DKBUILD_BASENAME=', '-DKBUILD_MODFILE=', '-DKBUILD_MODNAME=',
+                    '-D__KBUILD_MODNAME=')
+
+
+def pch_key(args):
+    """可共享同一个 PCH 的编译参数分组键（去掉逐文件的宏定义）"""
+    return tuple(arg for arg in args if not arg.startswith(PER_FILE_DEFINES))
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def build_pch(cache_dir, headers, compile_args, config_path=None, max_entries=8):
+    """为公共头文件构建（或复用）预编译头
+
+    键由 .config 内容、编译参数和头文件列表计算，任一变化都会生成新的 PCH；
+    PCH 旁的清单记录其包含的全部头文件及 (mtime, size)，头文件变化时原地重建。
+    返回 (PCH 路径, 包含的头文件列表)，构建失败返回 None。
+    """
+    if not headers:
+        return None
+    import hashlib
+    os.makedirs(cache_dir, exist_ok=True)
+
+    h = hashlib.sha256()
+    if config_path and os.path.exists(config_path):
+        with open(config_path, 'rb') as f:
+            h.update(f.read())
+    for item in list(compile_args) + ['--'] + list(headers):
+        h.update(item.encode() + b'\0')
+    key = h.hexdigest()[:32]
+    prefix_path = os.path.join(cache_dir, key + '.h')
+    pch_path = os.path.join(cache_dir, key + '.pch')
+    manifest_path = os.path.join(cache_dir, key + '.json')
+
+    # 清单中的头文件都未变化时直接复用
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if os.path.exists(pch_path) and all(
+                _stamp(path) == stamp for path, stamp in manifest.items()):
+            os.utime(pch_path)
+            return pch_path, list(manifest)
+    except (OSError, ValueError):
+        pass
+
+    with open(prefix_path, 'w') as f:
+        f.write(''.join(f'#include <{header}>\n' for header in headers))
+    clang = cindex()
+    tu = get_index().parse(prefix_path, args=list(compile_args) + ['-x', 'c-header'],
+                           options=clang.TranslationUnit.PARSE_INCOMPLETE)
+    if any(d.severity >= clang.Diagnostic.Error for d in tu.diagnostics):
+        return None
+
+    includes = [inc.include.name for inc in tu.get_includes()]
+    tmp_path = pch_path + f'.{os.getpid()}.tmp'
+    tu.save(tmp_path)
+    os.replace(tmp_path, pch_path)
+    with open(manifest_path, 'w') as f:
+        json.dump({path: _stamp(path) for path in includes}, f)
+
+    _prune_pch(cache_dir, max_entries)
+    return pch_path, includes
+
+
+def _prune_pch(cache_dir, max_entries):
+    """只保留最近使用的 max_entries 个 PCH（.config 或编译参数变化后旧的 PCH 不再使用）"""
+    pchs = sorted((os.path.getmtime(os.path.join(cache_dir, name)), name[:-4])
+                  for name in os.listdir(cache_dir) if name.endswith('.pch'))
+    for _, key in pchs[:-max_entries]:
+        for ext in ('.pch', '.h', '.json'):
+            try:
+                os.remove(os.path.join(cache_dir, key + ext))
+            except OSError:
+                pass
+
+
+def read_kernel_config(config_path):
+    """读取 .config，返回 {CONFIG_X: 值}；跳过注释和 '# CONFIG_X is not set'"""
+    config = {}
+    if not os.path.exists(config_path):
+        return config
+    with open(config_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith('CONFIG_'):
+                continue
+            key, _, value = line.partition('=')
+            config[key] = value
+    return config
+
+
+def config_defines(config):
+    """把 .config 转换为 -D 参数（与 Kconfig 生成的 autoconf.h 一致）"""
+    flags = []
+    for key, value in config.items():
+        if value == 'y':
+            flags.append(f'-D{key}=1')
+        elif value == 'm':
+            flags.append(f'-D{key}_MODULE=1')
+        elif value and value != 'n':
+            flags.append(f'-D{key}={value}')
+    return flags
+
+
+# compile_commands.json 中与解析无关的参数：(参数, 是否带一个值)
+_DROP_ARGS = {'-c': False, '-o': True, '-MF': True, '-MT': True, '-MQ': True,
+              '-MD': False, '-MMD': False, '-MP': False}
+# 带路径的参数，值可以是下一个参数或直接相连（-Ifoo）；-include-pch 须排在 -include 之前
+_PATH_ARGS = ('-I', '-include-pch', '-include', '-isystem', '-iquote', '-idirafter', '-imacros',
+              '-L')
+
+
+def _clean_compile_args(arguments, directory, filename):
+    """去掉编译器、输出和依赖文件参数，并把相对路径转换为绝对路径"""
+    args = []
+    it = iter(arguments[1:])
+    for arg in it:
+        if arg in _DROP_ARGS:
+            if _DROP_ARGS[arg]:
+                next(it, None)
+            continue
+        if arg.startswith('-Wp,-M') or os.path.join(directory, arg) == filename:
+            continue
+        for opt in _PATH_ARGS:
+            if arg == opt:
+                value = next(it, '')
+                args.extend([opt, os.path.normpath(os.path.join(directory, value))])
+                break
+            if arg.startswith(opt):
+                args.append(opt + os.path.normpath(os.path.join(directory, arg[len(opt):])))
+                break
+        else:
+            args.append(arg)
+    return args
+
+
+def load_compile_commands(build_dir, under=None):
+    """通过 CompilationDatabase 读取 compile_commands.json
+
+    返回 {源文件绝对路径: 解析参数}，under 用于只保留某个目录下的源文件。
+    """
+    db = cindex().CompilationDatabase.fromDirectory(build_dir)
+    prefix = under.rstrip(os.sep) + os.sep if under else None
+    commands = {}
+    for cmd in db.getAllCompileCommands():
+        filename = os.path.normpath(os.path.join(cmd.directory, cmd.filename))
+        if prefix and not filename.startswith(prefix):
+            continue
+        commands[filename] = _clean_compile_args(list(cmd.arguments), cmd.directory, filename)
+    return commands
+
+
+MODNAME_PATTERN = re.compile(r'^-DKBUILD_MODNAME=["\']*([\w-]+)')
+
+
+def module_of(args):
+    """从 -DKBUILD_MODNAME 参数中取得源文件所属的模块名"""
+    for arg in args:
+        m = MODNAME_PATTERN.match(arg)
+        if m:
+            return m.group(1)
+    return None
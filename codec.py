@@ -0,0 +1,98 @@
+"""Message codecs, negotiated by the AMQP content type"""
+
+import json
+import pika
+import struct
+
+
+JSON_TYPE = 'application/json'
+PACKED_TYPE = 'application/x-gerrit-packed'
+
+
+class JsonCodec(object):
+    """JSON bodies, the fallback for every message and content type"""
+    content_type = JSON_TYPE
+
+    def __init__(self):
+        # built once and shared by every message instead of one BasicProperties per publish
+        self.properties = pika.BasicProperties(content_type=self.content_type)
+
+    def encode(self, message):
+        """-> (properties, body)"""
+        return self.properties, json.dumps(message)
+
+    def decode(self, body):
+        return json.loads(body)
+
+
+class PackedCodec(JsonCodec):
+    """struct-packed bodies for the fixed message shapes of this pipeline
+
+    One kind byte selects the shape, followed by its integers as signed 32-bit
+    big-endian values and, for shapes with a name, a length byte and the UTF-8
+    name. Messages of another shape, or whose values do not fit, are sent as JSON
+    (content type application/json), so consumers always decode by content type.
+    """
+    content_type = PACKED_TYPE
+    # (integer fields, name field or None); the index is the kind byte
+    SHAPES = ((('value',), None), (('value', 'id'), None),
+              (('job',), None), (('job', 'id'), None),
+              (('result',), 'worker'), (('result', 'id'), 'worker'),
+              (('at',), 'register'), ((), 'register'), ((), 'unregister'),
+              (('at',), 'heartbeat'))
+    INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+    def __init__(self):
+        JsonCodec.__init__(self)
+        self.fallback = JsonCodec()
+        self.kinds = {}   # frozenset of keys -> (kind, ints, name, struct)
+        self.shapes = []  # kind -> (ints, name, struct)
+        for kind, (ints, name) in enumerate(self.SHAPES):
+            packer = struct.Struct('>B' + 'i' * len(ints))
+            keys = frozenset(ints + ((name,) if name else ()))
+            self.kinds[keys] = (kind, ints, name, packer)
+            self.shapes.append((ints, name, packer))
+
+    def encode(self, message):
+        shape = self.kinds.get(frozenset(message))
+        if shape is None:
+            return self.fallback.encode(message)
+        kind, ints, name, packer = shape
+        values = [message[k] for k in ints]
+        for v in values:
+            if type(v) not in (int, long) or not self.INT_MIN <= v <= self.INT_MAX:
+                return self.fallback.encode(message)
+        body = packer.pack(kind, *values)
+        if name is not None:
+            text = message[name]
+            if not isinstance(text, basestring):
+                return self.fallback.encode(message)
+            if isinstance(text, unicode):
+                text = text.encode('utf-8')
+            if len(text) > 255:
+                return self.fallback.encode(message)
+            body += chr(len(text)) + text
+        return self.properties, body
+
+    def decode(self, body):
+        ints, name, packer = self.shapes[ord(body[0])]
+        values = packer.unpack_from(body)
+        message = dict(zip(ints, values[1:]))
+        if name is not None:
+            start = packer.size + 1
+            message[name] = body[start:start + ord(body[packer.size])].decode('utf-8')
+        return message
+
+
+JSON_CODEC = JsonCodec()
+PACKED_CODEC = PackedCodec()
+# content type -> codec; unknown or missing content types are read as JSON
+CODECS = {JSON_TYPE: JSON_CODEC, PACKED_TYPE: PACKED_CODEC}
+# what Publisher sends when not given a codec; consumers accept both
+PUBLISH_CODEC = PACKED_CODEC
+
+
+def decode(properties, body):
+    """Decode a delivered body according to its content type"""
+    content_type = getattr(properties, 'content_type', None)
+    return CODECS.get(content_type, JSON_CODEC).decode(body)
@@ -0,0 +1,85 @@
+"""Generator coroutines driven by a pika connection's callbacks and timers"""
+
+
+class Future(object):
+    """Result of an asynchronous operation, completed on the connection thread"""
+    def __init__(self):
+        self.done = False
+        self.result = None
+        self.error = None
+        self.callbacks = []
+
+    def add_done_callback(self, callback):
+        if self.done:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, error):
+        self._finish(None, error)
+
+    def _finish(self, result, error):
+        self.done, self.result, self.error = True, result, error
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class Return(Exception):
+    """raise Return(value) ends a coroutine with a value (a Python 2 generator cannot return one)"""
+    def __init__(self, value=None):
+        Exception.__init__(self, value)
+        self.value = value
+
+
+def spawn(coroutine):
+    """Run a generator coroutine, returns a Future of its value
+
+    Each Future the coroutine yields resumes it with the Future's result, or
+    raises the Future's error inside it.
+    """
+    future = Future()
+    def step(value=None, error=None):
+        try:
+            if error is not None:
+                yielded = coroutine.throw(error)
+            else:
+                yielded = coroutine.send(value)
+        except Return as r:
+            future.set_result(r.value)
+        except StopIteration:
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            yielded.add_done_callback(lambda f: step(f.result, f.error))
+    step()
+    return future
+
+
+def sleep_async(conn, seconds):
+    """Future completed after `seconds` by a timer of conn"""
+    future = Future()
+    conn.add_timeout(seconds, lambda: future.set_result(None))
+    return future
+
+
+def _call(func, *args):
+    try:
+        return True, func(*args)
+    except Exception as e:
+        return False, e
+
+
+def run_in_pool(conn, pool, func, *args):
+    """Run func(*args) on a process pool, the Future completes on conn's thread"""
+    future = Future()
+    def done(outcome):
+        ok, value = outcome
+        conn.add_callback_threadsafe(
+            lambda: future.set_result(value) if ok else future.set_exception(value))
+    pool.apply_async(_call, (func,) + args, callback=done)
+    return future
@@ -0,0 +1,436 @@
+"""Dispatcher and workers: gerrit events -> jobs -> results"""
+
+import time
+import pika
+import multiprocessing
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from threading import Thread, Event
+
+from codec import decode
+from coroutine import Return, spawn, sleep_async, run_in_pool
+from publisher import Publisher
+from routing import LeastOutstanding
+
+
+# Workers announce themselves here: {"register": name, "at": unix time} when they
+# start, {"heartbeat": name, "at": unix time} while running, {"unregister": name}
+REGISTER_QUEUE = 'worker_register'
+# Registered workers send a heartbeat this often; the dispatcher drops a worker
+# (and ignores queued registrations) not heard from for WORKER_EXPIRY seconds
+WORKER_HEARTBEAT = 5.0
+WORKER_EXPIRY = 3 * WORKER_HEARTBEAT
+
+
+class dispatcher(Thread):
+    """Routes gerrit events to registered workers and collects their results
+
+    Workers register and unregister themselves through REGISTER_QUEUE and send
+    heartbeats while registered; a worker silent for `expiry` seconds is dropped,
+    and registrations older than that (left in the queue by workers that died) are
+    ignored. Only "register" adds a worker: heartbeats of a worker that unregistered
+    or expired are ignored. Jobs still in the queue of a worker that is dropped go
+    back to `pending`. Events the policy cannot place yet (no worker registered,
+    or all at their limit) wait in `pending` and go out as workers register or
+    results come back. Failed jobs come back as {"worker", "id", "error"} records,
+    so the worker's slot is released either way.
+    """
+    def __init__(self, broker="localhost", policy=None, connect=None, on_result=None,
+                 expiry=WORKER_EXPIRY):
+        """policy: RoundRobin, LeastOutstanding (default) or SharedQueue
+        on_result: optional callable(record) for every result or failure received"""
+        Thread.__init__(self)
+        print "Init dispatcher with broker: %s" %str(broker)
+        self.broker = broker
+        self.results = []
+        self.failures = []
+        self.expiry = expiry
+        self.last_seen = {}  # worker name -> time of its latest registration
+        self.policy = policy or LeastOutstanding()
+        self.pending = deque()
+        self.on_result = on_result
+        self.connect = connect or (lambda: pika.BlockingConnection(
+            pika.ConnectionParameters(host=self.broker)))
+        self.conn = None
+
+    def run(self):
+        print "Start dispatcher"
+        self.attach(self.connect())
+        self.channel.start_consuming()
+
+    def attach(self, conn):
+        """Declare the queues and start consuming on a new channel of conn"""
+        self.conn = conn
+        print "Connection setup done!"
+        self.channel = self.conn.channel()
+        for queue in ('gerrit_event', 'result', REGISTER_QUEUE, self.policy.queue):
+            if queue:
+                self.channel.queue_declare(queue=queue)
+        self.publisher = Publisher(self.conn, self.channel)
+        print "All Queue declared!"
+        self.channel.basic_consume(self.process_result,
+                                   queue='result', no_ack=True)
+        self.channel.basic_consume(self.register_worker,
+                                   queue=REGISTER_QUEUE, no_ack=True)
+        self.channel.basic_consume(self.dispatch_event,
+                                   queue='gerrit_event', no_ack=True)
+        self.conn.add_timeout(self.expiry / 3.0, self.expire_workers)
+
+    def stop(self):
+        if self.conn is not None:
+            self.conn.add_callback_threadsafe(self.channel.stop_consuming)
+
+    def register_worker(self, ch, method, properties, body):
+        msg = decode(properties, body)
+        if "register" in msg:
+            name = msg["register"]
+            # "at" is the worker's clock; hosts are assumed to be roughly in sync
+            seen = msg.get("at", time.time())
+            if time.time() - seen > self.expiry:
+                print "Ignore stale registration of %s" %name
+                return
+            if name not in self.last_seen:
+                print "Worker registered: %s" %name
+                self.policy.add(name)
+            self.last_seen[name] = max(seen, self.last_seen.get(name, seen))
+            self.flush_pending()
+        elif "heartbeat" in msg:
+            name = msg["heartbeat"]
+            if name in self.last_seen:
+                self.last_seen[name] = max(msg["at"], self.last_seen[name])
+            else:
+                print "Ignore heartbeat of unregistered worker %s" %name
+        elif "unregister" in msg:
+            print "Worker unregistered: %s" %msg["unregister"]
+            self.remove_worker(msg["unregister"])
+
+    def expire_workers(self):
+        """Drop workers whose heartbeat stopped, then check again later"""
+        now = time.time()
+        for name, seen in self.last_seen.items():
+            if now - seen > self.expiry:
+                print "Worker expired: %s" %name
+                self.remove_worker(name)
+        self.conn.add_timeout(self.expiry / 3.0, self.expire_workers)
+
+    def remove_worker(self, name):
+        """Stop routing to the worker and route the jobs left in its queue again
+
+        A worker hands its unfinished jobs back before unregistering, and the broker
+        requeues the unacked jobs of a worker whose connection died, so whatever is
+        in its queue now would otherwise never be consumed.
+        """
+        self.last_seen.pop(name, None)
+        self.policy.remove(name)
+        if self.policy.queue is not None:
+            return  # one shared queue: the other workers consume what is left
+        reclaimed = []
+        while True:
+            method, properties, body = self.channel.basic_get(queue=name, no_ack=True)
+            if method is None:
+                break
+            j = decode(properties, body)
+            event = {"value": j["job"]}
+            if "id" in j:
+                event["id"] = j["id"]
+            reclaimed.append(event)
+        if reclaimed:
+            print "Route %d jobs of %s again" %(len(reclaimed), name)
+            self.pending.extendleft(reversed(reclaimed))
+            self.flush_pending()
+
+    def flush_pending(self):
+        while self.pending and self.route(self.pending[0]):
+            self.pending.popleft()
+
+    def dispatch_event(self, ch, method, properties, event):
+        e = decode(properties, event)
+        print "Dispatcher get event: %s" %str(e)
+        if self.pending or not self.route(e):
+            self.pending.append(e)
+
+    def route(self, e):
+        """Publish the event as a job, False when no worker can take it yet"""
+        queue = self.policy.route(e)
+        if queue is None:
+            return False
+        print "Dispatch to %s!" %queue
+        self.publish_job(e["value"], queue, e.get("id"))
+        return True
+
+    def process_result(self, ch, method, properties, job_record):
+        job_result = decode(properties, job_record)
+        print "Raw job result: %s" %str(job_result)
+        worker = job_result["worker"]
+        self.policy.done(worker)
+        self.flush_pending()
+        if "error" in job_result:
+            self.failures.append((worker, job_result.get("id"), job_result["error"]))
+            print "Dispatcher get failure: %s, %s" %(str(worker), job_result["error"])
+        else:
+            self.results.append((worker, job_result["result"]))
+            print "Dispatcher get result: %s, %s" %(str(worker), str(job_result["result"]))
+        if self.on_result is not None:
+            self.on_result(job_result)
+        return
+
+    def publish_job(self, job, worker_name, job_id=None):
+        task = {"job":job}
+        if job_id is not None:
+            task["id"] = job_id
+        self.publisher.publish(worker_name, task)
+
+class worker(Thread):
+    """Worker Thread base class
+
+    The broker pushes at most `prefetch` unacked jobs to this worker, and up to
+    `concurrency` of them run at once on a thread pool. The connection thread only
+    receives jobs and, once a job is done, publishes its result and acks it, so the
+    connection keeps being serviced (heartbeats, deliveries) while jobs run.
+    """
+    def __init__(self, name, multiply, prefetch=4, concurrency=2, connect=None,
+                 time_scale=1.0, queue=None, heartbeat=WORKER_HEARTBEAT):
+        """connect: returns a new connection, defaults to BlockingConnection
+        time_scale: seconds slept per job unit
+        queue: queue to consume, defaults to the worker's own queue (SHARED_QUEUE
+        when the dispatcher routes with SharedQueue)
+        heartbeat: seconds between repeated registrations"""
+        Thread.__init__(self)
+        self.name = name
+        self.multiply = multiply
+        self.daemon = True
+        self._stop = Event()
+        self.broker = "localhost"
+        self.prefetch = prefetch
+        self.concurrency = concurrency
+        self.time_scale = time_scale
+        self.queue = queue or name
+        self.heartbeat = heartbeat
+        self.connect = connect or (lambda: pika.BlockingConnection(
+            pika.ConnectionParameters(host=self.broker)))
+        self.conn = None
+        self.pool = None
+        self.in_flight = set()  # delivery tags of jobs received and not finished
+
+    def stop(self):
+        """Stop worker thread"""
+        self._stop.set()
+        if self.conn is not None:
+            self.conn.add_callback_threadsafe(self.leave)
+        print "%s stopped as required." %self.name
+
+    def leave(self):
+        """Runs on the connection thread: stop taking jobs, hand the unfinished ones
+        back to the queue and unregister, so the dispatcher routes them again"""
+        self._stop.set()
+        self.channel.stop_consuming()
+        for tag in sorted(self.in_flight):
+            self.channel.basic_nack(delivery_tag=tag, requeue=True)
+        self.in_flight.clear()
+        self.announce("unregister")
+
+    def run(self, block=True, timeout=None):
+        """"""
+        try:
+            self.pool = ThreadPool(self.concurrency)
+            self.attach(self.connect())
+            self.channel.start_consuming()
+        except Exception as e:
+            print "%s : Error when run: %s" %(self.name, str(e))
+        finally:
+            if self.pool is not None:
+                self.pool.terminate()
+            if self.conn is not None and self.conn.is_open:
+                self.conn.close()  # the broker requeues jobs this worker did not ack
+
+    def attach(self, conn):
+        """Consume jobs on a new channel of conn and register with the dispatcher"""
+        self.conn = conn
+        self.channel = self.conn.channel()
+        self.channel.queue_declare(queue=self.queue)
+        self.channel.queue_declare(queue=REGISTER_QUEUE)
+        self.channel.basic_qos(prefetch_count=self.prefetch)
+        self.publisher = Publisher(self.conn, self.channel)
+        self.channel.basic_consume(self.act,
+                                   queue=self.queue, no_ack=False)
+        self.announce("register")
+        self.conn.add_timeout(self.heartbeat, self.beat)
+
+    def beat(self):
+        """Send a heartbeat so the dispatcher knows this worker is alive"""
+        if self._stop.is_set():
+            return
+        self.announce("heartbeat")
+        self.conn.add_timeout(self.heartbeat, self.beat)
+
+    def announce(self, action):
+        """Tell the dispatcher this worker joined ("register"), is alive ("heartbeat")
+        or left ("unregister")"""
+        message = {action: self.name}
+        if action != "unregister":
+            message["at"] = int(time.time())
+        # through the publisher: once the channel is in confirm mode every publish
+        # takes a delivery tag, so none may bypass it
+        self.publisher.publish(REGISTER_QUEUE, message)
+        self.publisher.flush()
+
+    def act(self, ch, method, properties, job):
+        """Runs on the connection thread: hand the job to the pool and return"""
+        j = decode(properties, job)
+        tag = method.delivery_tag
+        self.in_flight.add(tag)
+        def done(outcome):
+            # pool thread -> connection thread; pika channels are not thread safe
+            self.conn.add_callback_threadsafe(lambda: self.finish(tag, j, *outcome))
+        self.pool.apply_async(self.run_job, (j,), callback=done)
+
+    def run_job(self, j):
+        """Runs on a pool thread, returns (True, result) or (False, error message)"""
+        try:
+            print "%s : Sleep %s seconds, start" %(self.name, j["job"])
+            time.sleep(int(j["job"]) * self.time_scale)
+            print "%s : End of sleep, return %s * %s" %(self.name, self.multiply, j["job"])
+            return True, int(j["job"])*self.multiply
+        except Exception as e:
+            print "%s : Job %s failed: %s" %(self.name, j, str(e))
+            return False, str(e)
+
+    def finish(self, delivery_tag, j, ok, result):
+        """Runs on the connection thread: publish the result (or the failure, so the
+        dispatcher releases this worker's slot) and settle the job once the broker
+        confirmed it: ack a result, drop a failed job, requeue the job if nothing
+        could be published. Jobs already handed back by leave() are not answered."""
+        if delivery_tag not in self.in_flight:
+            return
+        self.in_flight.discard(delivery_tag)
+        def settle(confirmed):
+            if not confirmed:
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+            elif ok:
+                self.channel.basic_ack(delivery_tag=delivery_tag)
+            else:
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=False)
+        if ok:
+            self.publish_result(result, j.get("id"), settle)
+        else:
+            self.publish_failure(result, j.get("id"), settle)
+
+    def publish_result(self, result, job_id=None, on_confirm=None):
+        record = {"worker": self.name, "result":result}
+        if job_id is not None:
+            record["id"] = job_id
+        print "%s : Publish result: %s" %(self.name, result)
+        self.publisher.publish("result", record, on_confirm)
+
+    def publish_failure(self, error, job_id=None, on_confirm=None):
+        record = {"worker": self.name, "error": error}
+        if job_id is not None:
+            record["id"] = job_id
+        print "%s : Publish failure: %s" %(self.name, error)
+        self.publisher.publish("result", record, on_confirm)
+
+
+def crunch(units, multiply):
+    """CPU-bound job: busy arithmetic proportional to units"""
+    total = 0
+    for i in xrange(units * 20000):
+        total += i % 7
+    return units * multiply
+
+
+class async_worker(worker):
+    """Worker whose jobs are coroutines on a shared connection
+
+    Runs no thread of its own: up to `prefetch` jobs are in progress at once,
+    sleeping jobs wait on a connection timer and, with cpu_pool, the job runs
+    crunch() on the process pool while the connection keeps being serviced.
+    """
+    def __init__(self, name, multiply, prefetch=4, time_scale=1.0, queue=None,
+                 cpu_pool=None):
+        worker.__init__(self, name, multiply, prefetch=prefetch, concurrency=prefetch,
+                        time_scale=time_scale, queue=queue)
+        self.cpu_pool = cpu_pool
+
+    def act(self, ch, method, properties, job):
+        j = decode(properties, job)
+        tag = method.delivery_tag
+        self.in_flight.add(tag)
+        def done(future):
+            if future.error is not None:
+                print "%s : Job %s failed: %s" %(self.name, j, str(future.error))
+                self.finish(tag, j, False, str(future.error))
+            else:
+                self.finish(tag, j, True, future.result)
+        spawn(self.handle(j)).add_done_callback(done)
+
+    def handle(self, j):
+        units = int(j["job"])
+        if self.cpu_pool is not None:
+            result = yield run_in_pool(self.conn, self.cpu_pool, crunch, units, self.multiply)
+        else:
+            print "%s : Sleep %s seconds, start" %(self.name, j["job"])
+            yield sleep_async(self.conn, units * self.time_scale)
+            result = units * self.multiply
+        raise Return(result)
+
+
+class pipeline(object):
+    """listener -> dispatcher -> workers -> result on one connection and one thread
+
+    The dispatcher, every worker and the event publisher each use their own
+    channel of a single connection, driven by the thread calling run(). Adding
+    workers adds channels, not connections or threads; CPU-bound jobs go to a
+    process pool of `processes` processes.
+    """
+    def __init__(self, broker="localhost", policy=None, connect=None, on_result=None,
+                 processes=0):
+        self.policy = policy or LeastOutstanding()
+        self.connect = connect or (lambda: pika.BlockingConnection(
+            pika.ConnectionParameters(host=broker)))
+        self.on_result = on_result
+        self.cpu_pool = multiprocessing.Pool(processes) if processes else None
+        self.workers = []
+        self.running = False
+        self.conn = None
+
+    def start(self):
+        self.conn = self.connect()
+        self.dispatcher = dispatcher(policy=self.policy, connect=self.connect,
+                                     on_result=self.on_result)
+        self.dispatcher.attach(self.conn)
+        self.channel = self.conn.channel()
+        self.channel.queue_declare(queue='gerrit_event')
+        self.publisher = Publisher(self.conn, self.channel)
+
+    def add_worker(self, name, multiply, prefetch=4, time_scale=1.0, cpu=False):
+        w = async_worker(name, multiply, prefetch=prefetch, time_scale=time_scale,
+                         queue=self.policy.queue, cpu_pool=self.cpu_pool if cpu else None)
+        w.attach(self.conn)
+        self.workers.append(w)
+        return w
+
+    def publish_event(self, value, event_id=None):
+        task = {"value": value}
+        if event_id is not None:
+            task["id"] = event_id
+        self.publisher.publish('gerrit_event', task)
+
+    def run(self, until=None, timeout=None):
+        """Service the connection until until() is true, timeout passed or stop()"""
+        deadline = time.time() + timeout if timeout is not None else None
+        self.running = True
+        while self.running and not (until and until()):
+            if deadline is not None and time.time() >= deadline:
+                break
+            self.conn.process_data_events(time_limit=0.1)
+
+    def stop(self):
+        """Unregister the workers and close the connection, from the run() thread"""
+        for w in self.workers:
+            w.leave()
+        self.publisher.drain()
+        self.running = False
+        if self.cpu_pool is not None:
+            self.cpu_pool.terminate()
+        self.conn.close()
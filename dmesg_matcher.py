@@ -0,0 +1,141 @@
+import os
+import re
+import sys
+import gzip
+import json
+
+from symbol_index import load_module_index
+from symbol_search import strip_suffix
+
+# dmesg / journal 日志行语法：
+#   [    0.483] snd_sof: error: sof_ipc_tx_message: timeout at ops.c:215
+#   Oct 17 10:00:00 host kernel: snd_sof_pci 0000:00:1f.3: hda_dsp_core_reset: timeout at hda-dsp.c:52
+# 函数名取位置信息之前最后一个 "标识符: "
+DMESG_PATTERN = re.compile(
+    r'^(?:<\d+>)?'                                   # syslog 优先级
+    r'(?:\w{3}\s+\d+\s+[\d:]+\s+\S+\s+kernel:\s*)?'  # journal 前缀
+    r'(?:\[\s*[\d.]+\]\s*)?'                         # dmesg 时间戳
+    r'(?P<module>[A-Za-z_][\w-]*)(?:\s\S+)?:\s'       # 模块名及可选设备名
+    r'(?:.*\s)?(?P<function>[A-Za-z_][\w.]*):\s'       # 函数名
+    r'(?:.*?(?P<file>[\w./-]+\.[ch]):(?P<line>\d+))?'  # 源码位置
+)
+
+MATCH_CATEGORIES = ['functions', 'structures', 'variables']
+
+
+def parse_line(log_line):
+    """用预编译的语法解析一行日志，返回 (模块, 函数, 位置) 或 None"""
+    m = DMESG_PATTERN.match(log_line)
+    if not m:
+        return None
+    location = f"{m.group('file')}:{m.group('line')}" if m.group('file') else ''
+    return m.group('module'), m.group('function'), location
+
+
+def resolve(mod_dir, func_name, location):
+    """在模块的符号索引中查找函数，返回匹配结果或 None
+
+    日志中的函数名可能带有编译器后缀（foo.isra.0），精确匹配失败时去掉后缀再查。
+    """
+    index = load_module_index(mod_dir)
+    if index is None:
+        return None
+    matches = index.lookup(func_name, MATCH_CATEGORIES)
+    if not matches and strip_suffix(func_name) != func_name:
+        matches = index.lookup(strip_suffix(func_name), MATCH_CATEGORIES)
+    if not matches:
+        return None
+    _, symbol = matches[0]
+    return {
+        'symbol': symbol['name'],
+        'defined_at': f"{symbol['file']}:{symbol['line']}",
+        'log_location': location,
+        'code_path': os.path.join(mod_dir, 'src', symbol['file'])
+    }
+
+
+def module_dirs(output_dir):
+    """日志中的模块名（下划线）到输出目录名（Makefile 中的连字符）的映射"""
+    dirs = {}
+    for name in os.listdir(output_dir):
+        if os.path.isdir(os.path.join(output_dir, name)):
+            dirs[name] = name
+            dirs.setdefault(name.replace('-', '_'), name)
+    return dirs
+
+
+def read_lines(path):
+    """以生成器方式逐行读取日志文件，'-' 表示标准输入，支持 .gz"""
+    if path == '-':
+        yield from sys.stdin
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', errors='replace') as f:
+        yield from f
+
+
+def match_stream(lines, output_dir, batch_size=10000):
+    """流式匹配日志行
+
+    按批读取日志，批内按模块分组查找，每个模块的符号表只加载一次。
+    按输入顺序生成匹配结果字典（只输出匹配成功的行）。
+    """
+    dirs = module_dirs(output_dir)
+    batch = []
+    for line_no, line in enumerate(lines, 1):
+        parsed = parse_line(line)
+        if parsed:
+            batch.append((line_no, parsed))
+        if len(batch) >= batch_size:
+            yield from _match_batch(batch, output_dir, dirs)
+            batch = []
+    if batch:
+        yield from _match_batch(batch, output_dir, dirs)
+
+
+def _match_batch(batch, output_dir, dirs):
+    by_module = {}
+    for line_no, (module, func_name, location) in batch:
+        by_module.setdefault(module, []).append((line_no, func_name, location))
+
+    results = []
+    for module, entries in by_module.items():
+        mod_name = dirs.get(module)
+        if mod_name is None:
+            continue
+        mod_dir = os.path.join(output_dir, mod_name)
+        resolved = {}  # 同一批内相同函数只查一次
+        for line_no, func_name, location in entries:
+            if func_name not in resolved:
+                resolved[func_name] = resolve(mod_dir, func_name, None)
+            match = resolved[func_name]
+            if match:
+                results.append(dict(match, line_no=line_no, module=mod_name,
+                                    log_location=location))
+
+    results.sort(key=lambda r: r['line_no'])
+    return results
+
+
+def main(argv=None):
+    import argparse  # 只有命令行入口用到，作为库导入时不加载
+    parser = argparse.ArgumentParser(description='将 dmesg / journal 日志匹配到代码位置')
+    parser.add_argument('output_dir', help='generate_code_units 的输出目录')
+    parser.add_argument('logs', nargs='*', default=['-'], help="日志文件，'-' 表示标准输入")
+    parser.add_argument('-o', '--output', default='-', help='JSON Lines 输出文件')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        for path in args.logs:
+            for match in match_stream(read_lines(path), args.output_dir, args.batch_size):
+                match['log'] = path
+                out.write(json.dumps(match) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
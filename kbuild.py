@@ -0,0 +1,450 @@
+import os
+import re
+import copy
+import json
+import hashlib
+import tempfile
+
+from clang_support import read_kernel_config
+
+# Kbuild 只关心的 make 语法子集：变量赋值、条件、$(VAR) 展开和少量文本函数
+ASSIGN_PATTERN = re.compile(r'^(?:override\s+|export\s+)?([^:#=\s][^:#=]*?)\s*(::=|:=|\+=|\?=|=)\s*(.*)$')
+CONDITIONAL_PATTERN = re.compile(r'^(ifdef|ifndef|ifeq|ifneq)(?:\s+|(?=\())(.*)$')
+CONFIG_PATTERN = re.compile(r'CONFIG_\w+')
+KBUILD_FILES = ('Kbuild', 'Makefile')
+
+
+def _split_args(text):
+    """按顶层逗号切分函数参数（括号内的逗号不切分）"""
+    args, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch in '({':
+            depth += 1
+        elif ch in ')}':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            args.append(text[start:i])
+            start = i + 1
+    args.append(text[start:])
+    return args
+
+
+def _matching_paren(text, start):
+    """text[start] 为开括号，返回与之匹配的闭括号下标"""
+    open_ch = text[start]
+    close_ch = ')' if open_ch == '(' else '}'
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == open_ch:
+            depth += 1
+        elif text[i] == close_ch:
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(text)
+
+
+def _pattern_regex(pattern):
+    """make 的 % 模式转换为正则"""
+    head, _, tail = pattern.partition('%')
+    if '%' not in pattern:
+        return re.compile(re.escape(pattern) + r'\Z')
+    return re.compile(re.escape(head) + r'(.*)' + re.escape(tail) + r'\Z')
+
+
+def _patsubst(pattern, replacement, words):
+    regex = _pattern_regex(pattern)
+    out = []
+    for word in words.split():
+        m = regex.match(word)
+        if not m:
+            out.append(word)
+        elif '%' in pattern:
+            out.append(replacement.replace('%', m.group(1), 1))
+        else:
+            out.append(replacement)
+    return ' '.join(out)
+
+
+def _logical_lines(text):
+    """合并续行、去掉注释和规则的命令行"""
+    text = re.sub(r'\\\n', ' ', text)
+    for line in text.split('\n'):
+        if line.startswith('\t'):
+            continue
+        line = re.sub(r'(?<!\\)#.*', '', line).strip()
+        if line:
+            yield line
+
+
+class KbuildEvaluator:
+    """Kbuild Makefile 的小型求值器
+
+    按 .config 求值 ifdef/ifndef/ifeq/ifneq（可嵌套、支持 else if），展开 $(VAR)、
+    ${VAR}、替换引用和常用文本函数，合并续行，并递归进入 obj-y/obj-m 中的子目录和
+    subdir-y/subdir-m。每个目录使用独立的变量作用域（与 Kbuild 对每个目录单独调用
+    make 一致）。没有 .config 时所有 CONFIG_ 选项视为 y。
+    """
+
+    FUNCTIONS = ('subst', 'patsubst', 'addprefix', 'addsuffix', 'strip', 'filter',
+                 'filter-out', 'if', 'or', 'and', 'sort', 'firstword', 'words', 'notdir',
+                 'dir', 'basename', 'suffix', 'wildcard', 'foreach', 'shell', 'call',
+                 'error', 'warning', 'info')
+
+    def __init__(self, kernel_root, config=None):
+        self.kernel_root = kernel_root
+        self.config = config
+        self.makefiles = {}  # 求值过的 Makefile -> sha256
+        self.dirs = {}  # 求值过的目录 -> 目录列表的哈希（新增的 Kbuild / Makefile 也能发现）
+
+    # ---- 展开 ----
+
+    def _lookup(self, name):
+        if name in self.vars:
+            flavor, value = self.vars[name]
+            return self.expand(value) if flavor == 'recursive' else value
+        if name.startswith('CONFIG_'):
+            if self.config is None:
+                return 'y'
+            value = self.config.get(name, '')
+            return '' if value == 'n' else value.strip('"')
+        return self.builtins.get(name, '')
+
+    def expand(self, text):
+        out = []
+        i = 0
+        n = len(text)
+        while i < n:
+            ch = text[i]
+            if ch != '$':
+                j = text.find('$', i)
+                j = n if j < 0 else j
+                out.append(text[i:j])
+                i = j
+                continue
+            if i + 1 >= n:
+                break
+            nxt = text[i + 1]
+            if nxt == '$':
+                out.append('$')
+                i += 2
+            elif nxt in '({':
+                end = _matching_paren(text, i + 1)
+                out.append(self._reference(text[i + 2:end]))
+                i = end + 1
+            else:
+                out.append(self._lookup(nxt))
+                i += 2
+        return ''.join(out)
+
+    def _reference(self, body):
+        """$(...) 的内容：函数调用、替换引用或变量引用"""
+        m = re.match(r'([\w-]+)[ \t]+(.*)\Z', body, re.DOTALL)
+        if m and m.group(1) in self.FUNCTIONS:
+            return self._function(m.group(1), m.group(2))
+        name = body
+        subst = None
+        if ':' in body and '=' in body.partition(':')[2]:
+            name, _, ref = body.partition(':')
+            subst = ref.split('=', 1)
+        value = self._lookup(self.expand(name).strip())
+        if subst:
+            src, dst = (self.expand(s) for s in subst)
+            if '%' not in src:
+                src, dst = '%' + src, '%' + dst
+            value = _patsubst(src, dst, value)
+        return value
+
+    def _function(self, name, raw):
+        if name == 'if':
+            args = _split_args(raw) + ['', '']
+            return self.expand(args[1] if self.expand(args[0]).strip() else args[2])
+        if name == 'foreach':
+            var, words, body = (_split_args(raw) + ['', ''])[:3]
+            var = self.expand(var).strip()
+            saved = self.vars.get(var)
+            out = []
+            for word in self.expand(words).split():
+                self.vars[var] = ('simple', word)
+                out.append(self.expand(body))
+            if saved is None:
+                self.vars.pop(var, None)
+            else:
+                self.vars[var] = saved
+            return ' '.join(w for w in out if w)
+        args = [self.expand(a) for a in _split_args(raw)]
+        if name == 'subst':
+            return args[2].replace(args[0], args[1]) if len(args) >= 3 else ''
+        if name == 'patsubst':
+            return _patsubst(args[0].strip(), args[1].strip(), args[2]) if len(args) >= 3 else ''
+        if name == 'addprefix':
+            return ' '.join(args[0].strip() + w for w in args[1].split()) if len(args) >= 2 else ''
+        if name == 'addsuffix':
+            return ' '.join(w + args[0].strip() for w in args[1].split()) if len(args) >= 2 else ''
+        if name in ('filter', 'filter-out'):
+            if len(args) < 2:
+                return ''
+            regexes = [_pattern_regex(p) for p in args[0].split()]
+            keep = name == 'filter'
+            return ' '.join(w for w in args[1].split()
+                            if any(r.match(w) for r in regexes) == keep)
+        if name == 'strip':
+            return ' '.join(args[0].split())
+        if name == 'or':
+            return next((a.strip() for a in args if a.strip()), '')
+        if name == 'and':
+            return args[-1].strip() if all(a.strip() for a in args) else ''
+        if name == 'sort':
+            return ' '.join(sorted(set(args[0].split())))
+        if name == 'firstword':
+            words = args[0].split()
+            return words[0] if words else ''
+        if name == 'words':
+            return str(len(args[0].split()))
+        if name == 'notdir':
+            return ' '.join(os.path.basename(w) for w in args[0].split())
+        if name == 'dir':
+            return ' '.join((os.path.dirname(w) or '.') + '/' for w in args[0].split())
+        if name == 'basename':
+            return ' '.join(os.path.splitext(w)[0] for w in args[0].split())
+        if name == 'suffix':
+            return ' '.join(os.path.splitext(w)[1] for w in args[0].split()
+                            if os.path.splitext(w)[1])
+        # wildcard / shell / call / error 等与模块组成无关，按空处理
+        return ''
+
+    # ---- 条件 ----
+
+    def _condition(self, directive, arg):
+        if directive in ('ifdef', 'ifndef'):
+            defined = bool(self._lookup(self.expand(arg).strip()))
+            return defined if directive == 'ifdef' else not defined
+        arg = arg.strip()
+        if arg.startswith('('):
+            parts = _split_args(arg[1:_matching_paren(arg, 0)])
+            left, right = (parts + [''])[:2]
+        else:
+            quoted = re.findall(r'"([^"]*)"|\'([^\']*)\'', arg)
+            left, right = ([a or b for a, b in quoted] + ['', ''])[:2]
+        equal = self.expand(left).strip() == self.expand(right).strip()
+        return equal if directive == 'ifeq' else not equal
+
+    @staticmethod
+    def _guard_of(text):
+        m = CONFIG_PATTERN.search(text)
+        return m.group(0) if m else None
+
+    # ---- 求值 ----
+
+    def _read(self, directory):
+        self.dirs[directory] = _listing_sha256(directory)
+        for name in KBUILD_FILES:
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self.makefiles[path] = hashlib.sha256(data).hexdigest()
+                return data.decode(errors='replace')
+        return None
+
+    def _evaluate_dir(self, directory):
+        """求值一个目录的 Makefile，返回 (变量, 保护条件, 子目录)"""
+        self.vars = {}
+        self.guards = {}  # (变量名, 单词) -> 使其生效的 CONFIG_ 选项
+        rel = os.path.relpath(directory, self.kernel_root)
+        self.builtins = {'src': rel, 'obj': rel, 'srctree': self.kernel_root,
+                         'objtree': self.kernel_root}
+        text = self._read(directory)
+        if text is None:
+            return
+
+        # 条件栈：每层为 [外层是否生效, 是否已有分支生效, 当前分支是否生效, 保护条件]
+        stack = []
+        in_define = False
+        for line in _logical_lines(text):
+            word = line.split(None, 1)[0]
+            if in_define:
+                in_define = word != 'endef'
+                continue
+            if word == 'define':
+                in_define = True
+                continue
+            m = CONDITIONAL_PATTERN.match(line)
+            if m:
+                outer = all(frame[2] for frame in stack)
+                taken = outer and self._condition(m.group(1), m.group(2))
+                stack.append([outer, taken, taken, self._guard_of(m.group(2))])
+                continue
+            if word == 'else':
+                if not stack:
+                    continue
+                frame = stack[-1]
+                rest = line[4:].strip()
+                m = CONDITIONAL_PATTERN.match(rest)
+                if frame[1] or not frame[0]:
+                    frame[2] = False
+                elif m:
+                    frame[2] = self._condition(m.group(1), m.group(2))
+                    frame[3] = self._guard_of(m.group(2))
+                else:
+                    frame[2] = True
+                frame[1] = frame[1] or frame[2]
+                continue
+            if word == 'endif':
+                if stack:
+                    stack.pop()
+                continue
+            if not all(frame[2] for frame in stack):
+                continue
+
+            m = ASSIGN_PATTERN.match(line)
+            if not m:
+                continue  # include、规则和其他指令与模块组成无关
+            raw_name, op, value = m.groups()
+            name = self.expand(raw_name).strip()
+            guard = self._guard_of(raw_name)
+            if guard is None:
+                guard = next((f[3] for f in reversed(stack) if f[3]), None)
+            self._assign(name, op, value)
+            if guard:
+                for w in self.expand(value).split():
+                    self.guards.setdefault((name, w), guard)
+
+    def _assign(self, name, op, value):
+        current = self.vars.get(name)
+        if op == '?=':
+            if current is None:
+                self.vars[name] = ('recursive', value)
+        elif op == '+=':
+            if current is None:
+                self.vars[name] = ('recursive', value)
+            elif current[0] == 'simple':
+                self.vars[name] = ('simple', (current[1] + ' ' + self.expand(value)).strip())
+            else:
+                self.vars[name] = ('recursive', (current[1] + ' ' + value).strip())
+        elif op in (':=', '::='):
+            self.vars[name] = ('simple', self.expand(value))
+        else:
+            self.vars[name] = ('recursive', value)
+
+    def _words(self, name):
+        return self._lookup(name).split()
+
+    def evaluate(self, directory, base=None):
+        """求值 directory 及其子目录，返回模块字典
+
+        {模块名: {'config': CONFIG_X, 'sources': [相对 base 的 .c],
+                  'conditional_sources': {CONFIG_Y: [相对 base 的 .c]}}}
+        """
+        base = base or directory
+        modules = {}
+        pending = [directory]
+        seen = set()
+        while pending:
+            current = pending.pop(0)
+            if current in seen:
+                continue
+            seen.add(current)
+            self._evaluate_dir(current)
+
+            subdirs = self._words('subdir-y') + self._words('subdir-m')
+            for list_name in ('obj-y', 'obj-m'):
+                for obj in self._words(list_name):
+                    if obj.endswith('/'):
+                        subdirs.append(obj)
+                    elif obj.endswith('.o'):
+                        self._add_module(modules, current, base, list_name, obj)
+            for sub in subdirs:
+                pending.append(os.path.normpath(os.path.join(current, sub)))
+        return modules
+
+    def _add_module(self, modules, directory, base, list_name, obj):
+        mod_name = os.path.basename(obj[:-2])
+        entry = modules.setdefault(mod_name, {
+            'config': self.guards.get((list_name, obj)),
+            'sources': [],
+            'conditional_sources': {}
+        })
+        parts = []
+        for suffix in ('-objs', '-y', '-m'):
+            var = obj[:-2] + suffix
+            parts.extend((var, part) for part in self._words(var))
+        if not parts:
+            parts = [(list_name, obj)]  # 单文件模块
+
+        for var, part in parts:
+            if not part.endswith('.o'):
+                continue
+            stem = os.path.join(directory, part[:-2])
+            if not os.path.exists(stem + '.c') and os.path.exists(stem + '.S'):
+                continue  # 汇编源文件不参与解析
+            src = os.path.relpath(stem + '.c', base)
+            guard = self.guards.get((var, part)) if var != list_name else None
+            if guard:
+                sources = entry['conditional_sources'].setdefault(guard, [])
+            else:
+                sources = entry['sources']
+            if src not in sources:
+                sources.append(src)
+
+
+_results = {}  # 进程内缓存：键 -> 缓存条目
+
+
+def _file_sha256(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _listing_sha256(directory):
+    """目录中文件名列表的哈希，目录不存在时为 None"""
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return None
+    return hashlib.sha256('\0'.join(names).encode()).hexdigest()
+
+
+def evaluate_kbuild(directory, kernel_root, config_path=None, cache_dir=None):
+    """求值目录的 Kbuild 文件，结果按 (Makefile 哈希, .config 哈希) 缓存
+
+    缓存条目记录求值过的全部 Makefile（含子目录）及其哈希，以及求值过的各目录的
+    文件列表；任一 Makefile 变化、目录中增删文件（如新增 Kbuild）或 .config 变化时
+    重新求值。cache_dir 为 None 时只在进程内缓存。
+    """
+    config_path = config_path or os.path.join(kernel_root, '.config')
+    config_hash = _file_sha256(config_path)
+    h = hashlib.sha256()
+    for item in (os.path.abspath(directory), os.path.abspath(kernel_root), config_hash or ''):
+        h.update(item.encode() + b'\0')
+    key = h.hexdigest()
+    path = os.path.join(cache_dir, 'kbuild', key + '.json') if cache_dir else None
+
+    entry = _results.get(key)
+    if entry is None and path:
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+    if entry is not None and 'dirs' in entry and all(
+            _file_sha256(mk) == digest for mk, digest in entry['makefiles'].items()) and all(
+            _listing_sha256(d) == digest for d, digest in entry['dirs'].items()):
+        _results[key] = entry
+        return copy.deepcopy(entry['modules'])
+
+    config = read_kernel_config(config_path) if config_hash else None
+    evaluator = KbuildEvaluator(kernel_root, config)
+    modules = evaluator.evaluate(directory)
+    entry = {'makefiles': evaluator.makefiles, 'dirs': evaluator.dirs, 'modules': modules}
+    _results[key] = entry
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    return copy.deepcopy(modules)
@@ -0,0 +1,251 @@
+"""In-process stand-in for RabbitMQ, for benchmarks and tests"""
+
+import time
+import heapq
+import random
+import Queue
+import threading
+
+from collections import deque
+
+
+class _Confirm(object):
+    """Publisher confirm frame (pika's frame.Method carrying Basic.Ack / Basic.Nack)"""
+    def __init__(self, name, delivery_tag, multiple=False):
+        self.method = self
+        self.NAME = name
+        self.delivery_tag = delivery_tag
+        self.multiple = multiple
+
+
+class _Method(object):
+    """Delivery metadata passed to consumer callbacks (pika's Basic.Deliver)"""
+    def __init__(self, delivery_tag, routing_key, redelivered=False):
+        self.delivery_tag = delivery_tag
+        self.routing_key = routing_key
+        self.redelivered = redelivered
+
+
+class LocalBroker(object):
+    """In-process stand-in for the RabbitMQ broker, for benchmarks and tests
+
+    Implements the subset of pika's BlockingConnection API used by the dispatcher
+    and workers: queue_declare, basic_qos, basic_consume, basic_get, basic_publish,
+    basic_ack/basic_nack, start_consuming/stop_consuming, add_callback_threadsafe,
+    add_timeout, sleep and asynchronous publisher confirms (confirm_delivery(callback),
+    as on SelectConnection). Like pika, each connection runs its callbacks on the
+    thread that consumes. Messages to undeclared queues are dropped, as the default
+    exchange does; stop_consuming cancels the channel's consumers and closing a
+    connection requeues its unacked messages, as RabbitMQ does.
+    """
+    def __init__(self, nack_rate=0.0, seed=0):
+        """nack_rate: fraction of confirmed publishes to nack (and drop), to exercise
+        publisher retries"""
+        self.lock = threading.RLock()
+        self.nack_rate = nack_rate
+        self.random = random.Random(seed)
+        self.queues = {}     # queue -> deque of (body, properties, redelivered)
+        self.consumers = {}  # queue -> [(channel, callback, no_ack)], rotated round robin
+        self.connections = 0
+
+    def connect(self):
+        self.connections += 1
+        return LocalConnection(self)
+
+    def declare(self, queue):
+        with self.lock:
+            self.queues.setdefault(queue, deque())
+
+    def publish(self, routing_key, body, properties, redelivered=False, front=False):
+        with self.lock:
+            messages = self.queues.get(routing_key)
+            if messages is None:
+                return False
+            if front:
+                messages.appendleft((body, properties, redelivered))
+            else:
+                messages.append((body, properties, redelivered))
+            self.dispatch(routing_key)
+            return True
+
+    def dispatch(self, queue):
+        """Push ready messages to consumers that still have prefetch window"""
+        with self.lock:
+            messages = self.queues.get(queue)
+            consumers = self.consumers.get(queue, [])
+            while messages and consumers:
+                for i in range(len(consumers)):
+                    channel, callback, no_ack = consumers[0]
+                    consumers.append(consumers.pop(0))
+                    if no_ack or not channel.prefetch or len(channel.unacked) < channel.prefetch:
+                        break
+                else:
+                    return
+                body, properties, redelivered = messages.popleft()
+                channel.deliver(queue, callback, no_ack, body, properties, redelivered)
+
+
+class LocalConnection(object):
+    """One connection to a LocalBroker; callbacks run in process_data_events"""
+    def __init__(self, broker):
+        self.broker = broker
+        self.events = Queue.Queue()
+        self.timers = []  # heap of (deadline, seq, callback)
+        self.seq = 0
+        self.is_open = True
+        self.channels = []
+
+    def channel(self):
+        channel = LocalChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        self.events.put(callback)
+
+    def add_timeout(self, deadline, callback):
+        """Run callback after `deadline` seconds on the connection thread"""
+        self.seq += 1
+        heapq.heappush(self.timers, (time.time() + deadline, self.seq, callback))
+        return self.seq
+
+    def remove_timeout(self, timeout_id):
+        self.timers = [t for t in self.timers if t[1] != timeout_id]
+        heapq.heapify(self.timers)
+
+    def process_data_events(self, time_limit=0):
+        """Run due timers and queued callbacks, waiting at most time_limit for one"""
+        while self.timers and self.timers[0][0] <= time.time():
+            heapq.heappop(self.timers)[2]()
+        wait = time_limit
+        if self.timers:
+            wait = max(0, min(wait, self.timers[0][0] - time.time()))
+        try:
+            callback = self.events.get(timeout=wait) if wait else self.events.get_nowait()
+        except Queue.Empty:
+            return
+        callback()
+        while True:
+            try:
+                callback = self.events.get_nowait()
+            except Queue.Empty:
+                return
+            callback()
+
+    def sleep(self, duration):
+        """Like BlockingConnection.sleep: keep processing events while waiting"""
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            self.process_data_events(time_limit=min(0.1, deadline - time.time()))
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        for channel in self.channels:
+            channel.stop_consuming()
+            if channel.unacked:
+                channel.basic_nack(delivery_tag=max(channel.unacked), multiple=True)
+
+
+class LocalChannel(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.prefetch = 0
+        self.unacked = {}  # delivery tag -> (queue, body, properties)
+        self.next_tag = 0
+        self.consuming = False
+        self.on_confirm = None
+        self.published = 0
+        self.ack = None  # Basic.Ack not yet delivered, extended while publishes keep coming
+
+    def confirm_delivery(self, callback=None):
+        self.on_confirm = callback
+
+    def queue_declare(self, queue, **kwargs):
+        self.broker.declare(queue)
+
+    def basic_qos(self, prefetch_size=0, prefetch_count=0, all_channels=False):
+        self.prefetch = prefetch_count
+
+    def basic_consume(self, consumer_callback, queue, no_ack=False, **kwargs):
+        with self.broker.lock:
+            self.broker.declare(queue)
+            self.broker.consumers.setdefault(queue, []).append((self, consumer_callback, no_ack))
+            self.broker.dispatch(queue)
+
+    def basic_get(self, queue, no_ack=False):
+        """-> (method, properties, body), (None, None, None) when the queue is empty"""
+        with self.broker.lock:
+            messages = self.broker.queues.get(queue)
+            if not messages:
+                return None, None, None
+            body, properties, redelivered = messages.popleft()
+            self.next_tag += 1
+            if not no_ack:
+                self.unacked[self.next_tag] = (queue, body, properties)
+            return _Method(self.next_tag, queue, redelivered), properties, body
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.published += 1
+        # only a channel in confirm mode can learn that a publish was lost
+        nack = (self.on_confirm is not None and self.broker.nack_rate
+                and self.broker.random.random() < self.broker.nack_rate)
+        if not nack:
+            self.broker.publish(routing_key, body, properties)
+        if self.on_confirm is None:
+            return not nack
+        if not nack and self.ack is not None:
+            # like RabbitMQ, acknowledge a run of publishes with one multiple ack
+            self.ack.delivery_tag, self.ack.multiple = self.published, True
+            return True
+        frame = _Confirm('Basic.Nack' if nack else 'Basic.Ack', self.published)
+        self.ack = None if nack else frame
+        def confirm():
+            if self.ack is frame:
+                self.ack = None
+            self.on_confirm(frame)
+        self.connection.add_callback_threadsafe(confirm)
+        return not nack
+
+    def deliver(self, queue, callback, no_ack, body, properties, redelivered):
+        """Called by the broker with its lock held"""
+        self.next_tag += 1
+        tag = self.next_tag
+        if not no_ack:
+            self.unacked[tag] = (queue, body, properties)
+        method = _Method(tag, queue, redelivered)
+        self.connection.add_callback_threadsafe(
+            lambda: callback(self, method, properties, body))
+
+    def _settle(self, delivery_tag, multiple):
+        with self.broker.lock:
+            tags = [t for t in self.unacked if t <= delivery_tag] if multiple else [delivery_tag]
+            settled = [self.unacked.pop(t) for t in sorted(tags) if t in self.unacked]
+            return settled
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        with self.broker.lock:
+            for queue, _, _ in self._settle(delivery_tag, multiple):
+                self.broker.dispatch(queue)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        with self.broker.lock:
+            for queue, body, properties in self._settle(delivery_tag, multiple):
+                if requeue:
+                    self.broker.publish(queue, body, properties, redelivered=True, front=True)
+                else:
+                    self.broker.dispatch(queue)
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming and self.connection.is_open:
+            self.connection.process_data_events(time_limit=0.1)
+
+    def stop_consuming(self):
+        """Cancel this channel's consumers and leave start_consuming"""
+        with self.broker.lock:
+            for consumers in self.broker.consumers.values():
+                consumers[:] = [c for c in consumers if c[0] is not self]
+        self.consuming = False
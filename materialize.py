@@ -0,0 +1,118 @@
+import os
+import errno
+import fcntl
+import shutil
+
+# linux/fs.h: FICLONE = _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# 按优先级排列的放置方式；前两种不写入文件数据
+METHODS = ('reflink', 'hardlink', 'copy_range', 'copy')
+ZERO_COPY = ('reflink', 'hardlink')
+# 表示某种方式在这对设备之间不可用的错误；其他错误（如 EMLINK、ENOSPC）只影响当前文件
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP,
+                      errno.ENOSYS, errno.ENOTTY}
+
+
+def _reflink(src, dest):
+    """写时复制克隆（btrfs、XFS 等），与源文件共享数据块"""
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _copy_range(src, dest):
+    """在内核中复制数据（copy_file_range，不支持时用 sendfile），不经过用户态缓冲区"""
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        copy = getattr(os, 'copy_file_range', None)
+        while remaining > 0:
+            if copy is not None:
+                n = copy(fsrc.fileno(), fdst.fileno(), remaining)
+            else:
+                n = os.sendfile(fdst.fileno(), fsrc.fileno(), None, remaining)
+            if n == 0:
+                raise OSError(errno.EIO, "复制提前结束", src)
+            remaining -= n
+
+
+def _copy(src, dest):
+    shutil.copyfile(src, dest)
+
+
+_PLACERS = {
+    'reflink': _reflink,
+    'hardlink': os.link,
+    'copy_range': _copy_range,
+    'copy': _copy,
+}
+
+
+class Materializer:
+    """把源文件和头文件放到代码单元目录中
+
+    依次尝试 reflink、硬链接、内核内复制，最后才用缓冲复制。
+    目标已与源文件一致（同一文件，或大小和修改时间相同）时不做任何事；
+    同一次运行中同一目标只处理一次。某种方式在一对设备之间不受支持时不再重试，
+    其他失败只让当前文件改用下一种方式。
+    """
+
+    def __init__(self, hardlink=True):
+        self.methods = [m for m in METHODS if hardlink or m != 'hardlink']
+        self.bytes_copied = 0   # 实际写入的字节数
+        self.bytes_avoided = 0  # 通过 reflink、硬链接或目标已一致而省下的字节数
+        self.counts = dict.fromkeys(METHODS + ('unchanged',), 0)
+        self._placed = set()
+        self._unsupported = set()  # (方式, 源设备, 目标设备)
+
+    def place(self, src, dest):
+        """放置一个文件，返回使用的方式；本次运行已处理过的目标返回 None"""
+        if dest in self._placed:
+            return None
+        self._placed.add(dest)
+
+        st = os.stat(src)
+        try:
+            dst = os.lstat(dest)
+        except FileNotFoundError:
+            dst = None
+        if dst is not None:
+            if (dst.st_ino, dst.st_dev) == (st.st_ino, st.st_dev) or (
+                    dst.st_size == st.st_size and dst.st_mtime_ns == st.st_mtime_ns):
+                self.counts['unchanged'] += 1
+                self.bytes_avoided += st.st_size
+                return 'unchanged'
+            # 先删除再写入：目标可能是指向旧源文件的硬链接
+            os.remove(dest)
+
+        dest_dev = os.stat(os.path.dirname(dest) or '.').st_dev
+        for method in self.methods:
+            key = (method, st.st_dev, dest_dev)
+            if key in self._unsupported:
+                continue
+            try:
+                _PLACERS[method](src, dest)
+            except OSError as e:
+                if method == 'copy':
+                    raise
+                if e.errno in UNSUPPORTED_ERRNOS:
+                    self._unsupported.add(key)
+                if os.path.lexists(dest):
+                    os.remove(dest)
+                continue
+            if method != 'hardlink':
+                shutil.copystat(src, dest)
+            self.counts[method] += 1
+            if method in ZERO_COPY:
+                self.bytes_avoided += st.st_size
+            else:
+                self.bytes_copied += st.st_size
+            return method
+
+    def report(self):
+        return {'bytes_copied': self.bytes_copied, 'bytes_avoided': self.bytes_avoided,
+                'counts': dict(self.counts)}
+
+    def summary(self):
+        placed = ', '.join(f"{m} {n}" for m, n in self.counts.items() if n)
+        return (f"文件放置: 写入 {self.bytes_copied} 字节, 避免 {self.bytes_avoided} 字节"
+                + (f" ({placed})" if placed else ''))
@@ -1,18 +1,109 @@
 import os
-import re
 import json
-import shutil
-import clang.cindex
-from clang.cindex import Index, Config, CursorKind, TranslationUnit
+
+from clang_support import (PARSE_FULL, cindex, cursor_kinds, get_index, parse_options,
+                           walk_in_scope, common_includes, build_pch, read_kernel_config,
+                           config_defines, load_compile_commands, module_of, pch_key,
+                           exported_symbols, link_reference, link_definition, configure_libclang)
+from symbol_index import find_definitions, search_definitions, indexed_modules
+from symbol_table import SymbolTable, dedupe_symbols, symbol_key
+from profiler import Profiler, now, MAKEFILE, FLAGS, PARSE, TRAVERSAL, HEADER_COPY, WRITE
+# 只在生成代码单元时使用的模块（symbol_cache、unit_manifest、materialize、kbuild、multiprocessing、argparse）
+# 在用到的地方导入，lookup_only 的启动只加载查询所需的模块
+
+# libclang 库文件；None 时自动查找（LIBCLANG_PATH 环境变量、libclang wheel、/usr/lib/llvm-*）
+LIBCLANG_PATH = None
+
+# 游标类型名 -> 符号类别（用 clang_support.cursor_kinds 转换为 CursorKind）
+SYMBOL_KINDS = {
+    'FUNCTION_DECL': 'functions',
+    'STRUCT_DECL': 'structures',
+    'ENUM_DECL': 'enums',
+    'TYPEDEF_DECL': 'typedefs',
+    'MACRO_DEFINITION': 'macros',
+}
+
+# 并行解析时每个 worker 进程持有的分析器（Index 由 get_index 按进程创建）
+_worker_analyzer = None
+
+
+def _init_parse_worker(analyzer):
+    """worker 进程初始化"""
+    global _worker_analyzer
+    configure_libclang(analyzer.libclang_path)
+    _worker_analyzer = analyzer
+
+
+def _parse_worker(src_file):
+    """在 worker 进程中解析单个源文件，只返回普通的符号字典和头文件列表（不返回 cursor）
+
+    同时返回本次的缓存命中/未命中数，由主进程累加（worker 中的 SymbolCache 计数不会回传）。
+    """
+    cache = _worker_analyzer.cache
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    result = _worker_analyzer.parse_source(src_file)
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    return src_file, result, (hits, misses)
+
 
 class SOFModuleAnalyzer:
-    def __init__(self, kernel_root, sof_path="sound/soc/sof"):
-        # 配置 Clang
-        Config.set_library_file('/usr/lib/llvm-15/lib/libclang.so')  # 根据您的系统调整
+    def __init__(self, kernel_root, sof_path="sound/soc/sof", cache_dir=None,
+                 cache_max_bytes=512 * 1024 * 1024, parse_mode=PARSE_FULL,
+                 extract_macros=False, symbol_scope=None, pch_dir=None, compile_db=None,
+                 symbol_format='bin', header_scope=None, profile=False, libclang_path=None,
+                 lookup_only=False, output_dir=None):
         self.kernel_root = os.path.abspath(kernel_root)
         self.sof_path = os.path.join(self.kernel_root, sof_path)
-        self.compile_args = self._get_kernel_flags()
+        # 各阶段计时和每个文件的计数器（profile=False 时为空操作）
+        self.profiler = Profiler(profile)
         self.modules = {}  # 存储模块信息
+        self.output_dir = output_dir  # 最近一次 generate_all_units 的输出目录，查询时默认使用
+        # 只查询已生成的输出：不导入和加载 libclang，不读取 .config，不构建编译参数
+        self.lookup_only = lookup_only
+        self.cache = None
+        if lookup_only:
+            return
+        from symbol_cache import SymbolCache
+        from materialize import Materializer
+        # 配置 Clang（libclang 加载后不能再次设置）
+        self.libclang_path = libclang_path or LIBCLANG_PATH
+        configure_libclang(self.libclang_path)
+        with self.profiler.phase(FLAGS):
+            self.compile_args = self._get_kernel_flags()
+            # compile_commands.json 模式：每个文件使用构建时的真实参数，并以数据库为准确定源文件
+            self.compile_commands = load_compile_commands(compile_db, self.kernel_root) if compile_db else None
+        # 解析模式：PARSE_DECLARATIONS 跳过函数体；只有 extract_macros 时才记录宏
+        self.parse_mode = parse_mode
+        self.extract_macros = extract_macros
+        self.parse_options = parse_options(parse_mode, extract_macros)
+        # 符号提取范围（相对内核根目录），范围外文件的子树在遍历时直接跳过
+        self.symbol_scope = os.path.join(self.kernel_root, symbol_scope) if symbol_scope else self.kernel_root
+        self._relpaths = {}  # 文件名 -> 相对路径，跨 TU 复用
+        # 公共内核头文件的预编译头：{源文件: (PCH 路径, 其包含的头文件)}，只含可以使用 PCH 的文件
+        self.pch_dir = pch_dir
+        self.pchs = {}
+        # 符号表输出格式：'bin'（紧凑二进制）、'json'（缩进 JSON）或 'both'
+        self.symbol_format = symbol_format
+        # 复制到代码单元中的头文件范围（相对内核根目录，默认为 SOF 目录；'' 表示整个内核树）
+        header_root = self.sof_path if header_scope is None else os.path.join(self.kernel_root, header_scope)
+        self._header_prefix = header_root.rstrip(os.sep) + os.sep
+        # 源文件和头文件的放置（reflink / 硬链接优先），每次 generate_all_units 重新统计
+        self.materializer = Materializer()
+        # 符号缓存：源文件、头文件和编译参数均未变化时跳过 libclang；
+        # 变体区分分析器、符号类别和提取范围，避免读到形状或范围不同的条目
+        self.cache = SymbolCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.cache_variant = json.dumps(['sof', sorted(SYMBOL_KINDS.values()),
+                                         self.symbol_scope, header_root])
+        # 影响单元内容但不在编译参数中的设置；记入清单，变化时单元视为过期
+        self.unit_settings = [f'parse_options={self.parse_options}',
+                              f'extract_macros={self.extract_macros}',
+                              f'symbol_scope={self.symbol_scope}',
+                              f'header_scope={header_root}']
+
+    def _require_parser(self):
+        if self.lookup_only:
+            raise RuntimeError("lookup_only 模式下只能查询已生成的输出，不能解析源码")
 
     def _get_kernel_flags(self):
         """提取内核编译参数"""
@@ -40,79 +131,27 @@ class SOFModuleAnalyzer:
         ]
         
         # 从 .config 添加配置标志
-        config_path = os.path.join(self.kernel_root, '.config')
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                for line in f:
-                    if line.startswith('CONFIG_'):
-                        key, _, value = line.partition('=')
-                        if value.strip() == 'y':
-                            flags.append(f'-D{key}=1')
-                        elif value.strip() == 'm':
-                            flags.append(f'-D{key}_MODULE=1')
+        flags.extend(config_defines(read_kernel_config(os.path.join(self.kernel_root, '.config'))))
         
         return flags
 
+    def file_args(self, src_file):
+        """源文件的编译参数：优先使用 compile_commands.json 中的参数"""
+        if self.compile_commands is not None:
+            return self.compile_commands.get(src_file, self.compile_args)
+        return self.compile_args
+
     def parse_makefile(self, makefile_path):
-        """解析 SOF Makefile 构建模块映射"""
-        with open(makefile_path, 'r') as f:
-            makefile_content = f.read()
-        
-        # 解析模块定义
-        module_pattern = re.compile(r'obj-\$\(([^)]+)\)\s*\+=\s*([^\s]+)\.o')
-        module_matches = module_pattern.findall(makefile_content)
-        
-        # 解析模块组成
-        obj_pattern = re.compile(r'(\w+-sof[-\w]*)-([ym])\s*:?=\s*([^\\]+)', re.MULTILINE)
-        obj_matches = obj_pattern.findall(makefile_content)
-        
-        # 解析条件编译块
-        conditional_pattern = re.compile(r'ifneq \(\$\(([^)]+)\),\)\s*(.+?)endif', re.DOTALL)
-        conditional_matches = conditional_pattern.findall(makefile_content)
-        
-        # 构建模块字典
-        modules = {}
-        for config_var, mod_name in module_matches:
-            if mod_name not in modules:
-                modules[mod_name] = {
-                    'config': config_var,
-                    'sources': [],
-                    'conditional_sources': {}
-                }
-        
-        # 添加普通源文件
-        for mod_prefix, _, sources in obj_matches:
-            mod_name = mod_prefix.replace('-y', '').replace('-m', '')
-            if mod_name not in modules:
-                continue
-                
-            # 分割源文件列表
-            source_list = [s.strip() for s in sources.split() if s.endswith('.o')]
-            source_list = [s[:-2] + '.c' for s in source_list]  # 转换为 .c 文件
-            
-            # 添加到模块
-            modules[mod_name]['sources'].extend(source_list)
-        
-        # 添加条件编译的源文件
-        for config_var, content in conditional_matches:
-            # 在条件块中查找源文件定义
-            cond_obj_matches = obj_pattern.findall(content)
-            for mod_prefix, _, sources in cond_obj_matches:
-                mod_name = mod_prefix.replace('-y', '').replace('-m', '')
-                if mod_name not in modules:
-                    continue
-                    
-                # 分割源文件列表
-                source_list = [s.strip() for s in sources.split() if s.endswith('.o')]
-                source_list = [s[:-2] + '.c' for s in source_list]  # 转换为 .c 文件
-                
-                # 添加到条件源
-                if config_var not in modules[mod_name]['conditional_sources']:
-                    modules[mod_name]['conditional_sources'][config_var] = []
-                modules[mod_name]['conditional_sources'][config_var].extend(source_list)
-        
-        self.modules = modules
-        return modules
+        """求值 SOF Makefile（含子目录）构建模块映射
+
+        变量、续行、条件和 subdir 由 KbuildEvaluator 按 .config 求值，
+        结果按 (Makefile 哈希, .config 哈希) 缓存在符号缓存目录中。
+        """
+        from kbuild import evaluate_kbuild
+        cache_dir = self.cache.cache_dir if self.cache else None
+        self.modules = evaluate_kbuild(os.path.dirname(makefile_path), self.kernel_root,
+                                       cache_dir=cache_dir)
+        return self.modules
 
     def get_module_sources(self, module_name):
         """获取模块的所有源文件（包括条件编译）"""
@@ -123,15 +162,55 @@ class SOFModuleAnalyzer:
         for config_var, sources in self.modules[module_name]['conditional_sources'].items():
             conditional_sources.extend(sources)
         
-        # 转换为绝对路径
-        all_sources = list(set(base_sources + conditional_sources))
-        return [os.path.join(self.sof_path, src) for src in all_sources]
+        # 去重并保持顺序，保证串行与并行运行的输出一致
+        all_sources = list(dict.fromkeys(base_sources + conditional_sources))
+        all_sources = [os.path.join(self.sof_path, src) for src in all_sources]
+        
+        # compile_commands.json 是实际参与构建的源文件的权威列表
+        if self.compile_commands is not None:
+            modname = module_name.replace('-', '_')
+            built = [f for f, args in self.compile_commands.items() if module_of(args) == modname]
+            return built or [f for f in all_sources if f in self.compile_commands]
+        return all_sources
+
+    def group_by_args(self, source_files):
+        """按编译参数分组源文件，同组文件共享同一个预编译头（忽略逐文件的宏）"""
+        groups = {}
+        for src_file in dict.fromkeys(source_files):
+            groups.setdefault(pch_key(self.file_args(src_file)), []).append(src_file)
+        return groups
 
-    def parse_file_ast(self, file_path):
+    def prepare_pch(self, source_files):
+        """为每组编译参数下源文件开头共同包含的内核头文件构建预编译头（见 common_includes）"""
+        if not self.pch_dir:
+            return self.pchs
+        config_path = os.path.join(self.kernel_root, '.config')
+        for args, files in self.group_by_args(f for f in source_files if os.path.exists(f)).items():
+            headers, users = common_includes(files)
+            pch = build_pch(self.pch_dir, headers, args, config_path)
+            if pch:
+                self.pchs.update(dict.fromkeys(users, pch))
+            elif headers:
+                print(f"预编译头构建失败，{len(files)} 个文件按普通方式解析")
+            else:
+                print(f"{len(files)} 个文件开头没有共同的 <...> 头文件，不使用预编译头")
+        return self.pchs
+
+    def parse_file_ast(self, file_path, index=None):
         """解析单个文件的 AST"""
         try:
-            index = Index.create()
-            tu = index.parse(file_path, args=self.compile_args)
+            if index is None:
+                index = get_index()
+            args = self.file_args(file_path)
+            pch = self.pchs.get(file_path)
+            try:
+                tu = index.parse(file_path, args=args + ['-include-pch', pch[0]] if pch else args,
+                                 options=self.parse_options)
+            except cindex().TranslationUnitLoadError:
+                if not pch:
+                    raise
+                # PCH 与该文件的参数不兼容时退回普通解析
+                tu = index.parse(file_path, args=args, options=self.parse_options)
             if not tu:
                 print(f"解析失败: {file_path}")
                 return None
@@ -140,8 +219,14 @@ class SOFModuleAnalyzer:
             print(f"解析 {file_path} 时出错: {str(e)}")
             return None
 
-    def extract_symbols(self, cursor):
-        """从 AST 中提取符号定义"""
+    def extract_symbols(self, cursor, links=None, stats=None):
+        """从 AST 中提取符号定义
+
+        使用显式栈遍历，不受递归深度限制；范围外文件的子树不再下探。
+        同一声明（USR 加位置相同）只记录一次。
+        links: 可选的 {'defines': set, 'refs': set}，同一遍遍历中收集外部链接的定义和引用。
+        stats: 可选的字典，写入访问的游标数 'cursors' 和提取的符号数 'symbols'。
+        """
         symbols = {
             'functions': [],
             'structures': [],
@@ -149,145 +234,371 @@ class SOFModuleAnalyzer:
             'typedefs': [],
             'macros': []
         }
+        kinds = cursor_kinds(SYMBOL_KINDS)
+        seen = set()
+        visited = 0
         
-        def traverse(cursor):
-            if cursor.location.file is None:
-                return
-                
-            file_path = cursor.location.file.name
-            if not file_path.startswith(self.kernel_root):
-                return
-                
-            # 记录符号定义
-            if cursor.kind == CursorKind.FUNCTION_DECL:
-                symbols['functions'].append({
-                    'name': cursor.spelling,
-                    'file': os.path.relpath(file_path, self.kernel_root),
-                    'line': cursor.location.line,
-                    'return_type': cursor.result_type.spelling if cursor.result_type else ''
-                })
-            elif cursor.kind == CursorKind.STRUCT_DECL:
-                symbols['structures'].append({
-                    'name': cursor.spelling,
-                    'file': os.path.relpath(file_path, self.kernel_root),
-                    'line': cursor.location.line
-                })
-            elif cursor.kind == CursorKind.ENUM_DECL:
-                symbols['enums'].append({
-                    'name': cursor.spelling,
-                    'file': os.path.relpath(file_path, self.kernel_root),
-                    'line': cursor.location.line
-                })
-            elif cursor.kind == CursorKind.TYPEDEF_DECL:
-                symbols['typedefs'].append({
-                    'name': cursor.spelling,
-                    'file': os.path.relpath(file_path, self.kernel_root),
-                    'line': cursor.location.line
-                })
-            elif cursor.kind == CursorKind.MACRO_DEFINITION:
-                symbols['macros'].append({
-                    'name': cursor.spelling,
-                    'file': os.path.relpath(file_path, self.kernel_root),
-                    'line': cursor.location.line
-                })
+        for node, location, rel_path in walk_in_scope(cursor, self.kernel_root,
+                                                      self.symbol_scope, self._relpaths):
+            visited += 1
+            if links is not None:
+                ref = link_reference(node)
+                if ref is not None:
+                    links['refs'].add(ref)
+                    continue
+                defined = link_definition(node)
+                if defined is not None:
+                    links['defines'].add(defined)
+            key = kinds.get(node.kind)
+            if key is None:
+                continue
             
-            # 递归遍历子节点
-            for child in cursor.get_children():
-                traverse(child)
+            # 记录符号定义
+            item = {
+                'name': node.spelling,
+                'usr': node.get_usr(),
+                'file': rel_path,
+                'line': location.line
+            }
+            ident = (key,) + symbol_key(item)
+            if ident in seen:
+                continue
+            seen.add(ident)
+            if key == 'functions':
+                item['return_type'] = node.result_type.spelling if node.result_type else ''
+            symbols[key].append(item)
         
-        traverse(cursor)
+        if stats is not None:
+            stats['cursors'] = visited
+            stats['symbols'] = len(seen)
         return symbols
 
-    def generate_module_unit(self, module_name, output_dir):
-        """为单个模块生成代码单元"""
+    def parse_source(self, src_file, index=None):
+        """解析源文件，优先使用符号缓存
+
+        返回 {'symbols': 符号字典, 'includes': [头文件],
+              'links': {'exports': [...], 'defines': [...], 'refs': [...]}}
+        实际解析时还带有 'stats'：进程号、解析和遍历的起止时间、游标数和符号数，
+        由调用方记入 profiler（worker 进程中测得的计时也能合并）。
+        """
+        self._require_parser()
+        args = self.file_args(src_file)
+        if self.cache:
+            cached = self.cache.lookup(src_file, args, self.parse_options, self.cache_variant)
+            if cached is not None:
+                return cached
+        
+        stats = {'pid': os.getpid(), 'parse_start': now()}
+        ast = self.parse_file_ast(src_file, index=index)
+        stats['parse_end'] = now()
+        if not ast:
+            return None
+        found = {'defines': set(), 'refs': set()}
+        symbols = self.extract_symbols(ast, found, stats)
+        stats['traversal_end'] = now()
+        links = {
+            'exports': sorted(set(exported_symbols(ast.translation_unit))),
+            'defines': sorted(found['defines']),
+            'refs': sorted(found['refs'] - found['defines'])
+        }
+        includes = [inc.include.name for inc in ast.translation_unit.get_includes()]
+        pch = self.pchs.get(src_file)
+        if pch:
+            includes.extend(pch[1])  # PCH 中的头文件不会出现在 get_includes 中
+        
+        if self.cache:
+            self.cache.store(src_file, args, includes, symbols, self.parse_options, links,
+                             self.cache_variant)
+        return {'symbols': symbols, 'includes': includes, 'links': links, 'stats': stats}
+
+    def _record_parse(self, src_file, result):
+        """把 parse_source 结果中的计时和计数记入 profiler"""
+        stats = result.get('stats')
+        if stats is None:
+            self.profiler.count(src_file, cache_hits=1)
+            return
+        self.profiler.span(PARSE, stats['parse_start'], stats['parse_end'], src_file, stats['pid'])
+        self.profiler.span(TRAVERSAL, stats['parse_end'], stats['traversal_end'], src_file,
+                           stats['pid'])
+        self.profiler.count(src_file, cursors=stats['cursors'], symbols=stats['symbols'])
+
+    def parse_symbols(self, src_file, index=None):
+        """解析源文件并提取符号，优先使用符号缓存"""
+        result = self.parse_source(src_file, index=index)
+        return result['symbols'] if result else None
+
+    def stale_sources(self, source_files, manifest, force=False):
+        """返回需要重新处理的源文件：输出缺失、或源文件/头文件/参数有变化"""
+        existing = [f for f in source_files if os.path.exists(f)]
+        if force or not manifest.outputs_present():
+            return existing
+        return [f for f in existing if manifest.is_stale(f, self.unit_args(f))]
+
+    def unit_args(self, src_file):
+        """清单中记录的源文件参数：编译参数加上解析设置"""
+        return self.file_args(src_file) + self.unit_settings
+
+    def _build_info(self, module_name, source_files):
+        build_info = {
+            'module': module_name,
+            'config': self.modules[module_name]['config'],
+            'sources': [os.path.relpath(f, self.kernel_root) for f in source_files],
+            'conditional_sources': {
+                config: [os.path.relpath(os.path.join(self.sof_path, f), self.kernel_root)
+                         for f in sources]
+                for config, sources in self.modules[module_name]['conditional_sources'].items()
+            },
+            'compiler_flags': self.compile_args
+        }
+        if self.compile_commands is not None:
+            build_info['file_flags'] = {
+                os.path.relpath(f, self.kernel_root): self.file_args(f) for f in source_files
+            }
+        return build_info
+
+    def generate_module_unit(self, module_name, output_dir, parsed=None, manifest=None,
+                             force=False):
+        """为单个模块生成代码单元
+
+        模块目录中的 manifest.json 记录所有输入（源文件、头文件）和输出；
+        重新运行时只处理有变化的源文件，其余文件的符号直接取自清单。
+        parsed: 可选的 {源文件: 解析结果}，由并行解析预先生成。
+        """
+        from unit_manifest import UnitManifest, args_hash
+        self._require_parser()
         mod_dir = os.path.join(output_dir, module_name)
         src_dir = os.path.join(mod_dir, 'src')
         os.makedirs(src_dir, exist_ok=True)
         
-        # 1. 获取模块的所有源文件
+        # 1. 获取模块的所有源文件，找出需要重新处理的文件
         source_files = self.get_module_sources(module_name)
+        if manifest is None:
+            manifest = UnitManifest.load(mod_dir)
+        stale = set(self.stale_sources(source_files, manifest, force))
+        removed = manifest.prune(source_files)
+        build_info = self._build_info(module_name, source_files)
+        build_hash = args_hash([json.dumps(build_info, sort_keys=True), self.symbol_format,
+                                *self.unit_settings])
+        if not stale and not removed and manifest.build_hash == build_hash:
+            print(f"模块未变化，跳过: {module_name}")
+            self.modules[module_name]['symbols'] = self._module_symbols(manifest, source_files)
+            self.modules[module_name]['links'] = self._module_links(manifest, source_files)
+            return mod_dir
         
-        # 2. 复制源文件和头文件
-        all_symbols = {'functions': [], 'structures': [], 'enums': [], 'typedefs': [], 'macros': []}
+        # 2. 复制有变化的源文件和头文件
+        outputs = ['build_info.json']
         
         for src_file in source_files:
             if not os.path.exists(src_file):
                 print(f"警告: 源文件不存在 {src_file}")
                 continue
-            
-            # 复制源文件
             rel_path = os.path.relpath(src_file, self.kernel_root)
-            dest_path = os.path.join(src_dir, rel_path)
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-            shutil.copy2(src_file, dest_path)
+            outputs.append(os.path.join('src', rel_path))
             
-            # 3. 解析 AST 并提取符号
-            ast = self.parse_file_ast(src_file)
-            if ast:
-                file_symbols = self.extract_symbols(ast)
-                for key in all_symbols:
-                    all_symbols[key].extend(file_symbols[key])
-            
-            # 4. 复制包含的头文件
-            self._copy_included_headers(src_file, src_dir)
+            if src_file in stale:
+                copied = self.materializer.bytes_copied
+                
+                # 复制源文件
+                dest_path = os.path.join(src_dir, rel_path)
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                with self.profiler.phase(HEADER_COPY, src_file):
+                    self.materializer.place(src_file, dest_path)
+                
+                # 3. 解析 AST 并提取符号
+                if parsed is not None and src_file in parsed:
+                    result = parsed[src_file]
+                else:
+                    result = self.parse_source(src_file)
+                if result is not None:
+                    self._record_parse(src_file, result)
+                    manifest.record_file(src_file, self.unit_args(src_file),
+                                         result['includes'], result['symbols'], result['links'])
+                    
+                    # 4. 复制包含的头文件（TU 的传递闭包）
+                    with self.profiler.phase(HEADER_COPY, src_file):
+                        self._copy_included_headers(result['includes'], src_dir)
+                self.profiler.count(src_file, bytes_copied=self.materializer.bytes_copied - copied)
         
-        # 5. 保存符号表
-        with open(os.path.join(mod_dir, 'symbols.json'), 'w') as f:
-            json.dump(all_symbols, f, indent=2)
-        
-        # 6. 保存构建信息
-        build_info = {
-            'module': module_name,
-            'config': self.modules[module_name]['config'],
-            'sources': [os.path.relpath(f, self.kernel_root) for f in source_files],
-            'conditional_sources': {
-                config: [os.path.relpath(f, self.kernel_root) for f in sources]
-                for config, sources in self.modules[module_name]['conditional_sources'].items()
-            },
-            'compiler_flags': self.compile_args
-        }
-        with open(os.path.join(mod_dir, 'build_info.json'), 'w') as f:
-            json.dump(build_info, f, indent=2)
+        # 5. 按文件合并符号（去重），由 generate_all_units 写入全局符号表
+        self.modules[module_name]['symbols'] = self._module_symbols(manifest, source_files)
+        self.modules[module_name]['links'] = self._module_links(manifest, source_files)
         
+        with self.profiler.phase(WRITE):
+            # 6. 保存构建信息
+            with open(os.path.join(mod_dir, 'build_info.json'), 'w') as f:
+                json.dump(build_info, f, indent=2)
+            
+            # 7. 更新清单
+            manifest.outputs = outputs
+            manifest.build_hash = build_hash
+            manifest.save()
         return mod_dir
 
-    def _copy_included_headers(self, src_file, dest_dir):
-        """复制源文件中包含的头文件"""
-        with open(src_file, 'r') as f:
-            content = f.read()
-        
-        # 查找所有本地包含的头文件
-        include_pattern = re.compile(r'#include\s+"([^"]+)"')
-        headers = include_pattern.findall(content)
-        
-        for header in headers:
-            # 在 SOF 目录中查找头文件
-            header_path = os.path.join(os.path.dirname(src_file), header)
-            if os.path.exists(header_path):
-                rel_path = os.path.relpath(header_path, self.kernel_root)
-                dest_path = os.path.join(dest_dir, rel_path)
-                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                shutil.copy2(header_path, dest_path)
+    def _module_symbols(self, manifest, source_files):
+        """从清单中按文件合并模块的符号，共享头文件中的声明只保留一份"""
+        symbols = {'functions': [], 'structures': [], 'enums': [], 'typedefs': [], 'macros': []}
+        for src_file in source_files:
+            entry = manifest.files.get(src_file)
+            if entry and entry['symbols']:
+                dedupe_symbols(entry['symbols'], symbols)
+        return symbols
+
+    def _module_links(self, manifest, source_files):
+        """合并模块内各文件的链接信息；模块内已定义的符号不算外部引用"""
+        exports, defines, refs = set(), set(), set()
+        for src_file in source_files:
+            entry = manifest.files.get(src_file)
+            links = entry and entry.get('links')
+            if links:
+                exports.update(links['exports'])
+                defines.update(links['defines'])
+                refs.update(links['refs'])
+        return {'exports': sorted(exports), 'unresolved': sorted(refs - defines)}
+
+    def _symbol_outputs(self):
+        """symbol_format 对应的符号表文件名"""
+        return {'bin': ['symbols.bin'], 'json': ['symbols.json'],
+                'both': ['symbols.bin', 'symbols.json']}[self.symbol_format]
+
+    def write_symbol_table(self, output_dir):
+        """把各模块的符号写入全局符号表，模块目录中只保存引用"""
+        table = SymbolTable()
+        for module_name, data in self.modules.items():
+            table.add(module_name, data.get('symbols', {}))
+        table.write(output_dir, self._symbol_outputs(), self.modules)
+        return table
+
+    def _copy_included_headers(self, headers, dest_dir):
+        """放置 TU 包含的头文件（来自 get_includes 的传递闭包）
+
+        只处理 header_scope 内的头文件；同一次运行中每个目标只放置一次，
+        尽量不复制数据（见 Materializer）。
+        """
+        for header_path in headers:
+            if not header_path.startswith(self._header_prefix):
+                continue
+            rel_path = os.path.relpath(header_path, self.kernel_root)
+            dest_path = os.path.join(dest_dir, rel_path)
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            self.materializer.place(header_path, dest_path)
 
-    def generate_all_units(self, output_dir):
-        """为所有模块生成代码单元"""
+    def parse_sources_parallel(self, source_files, jobs):
+        """使用进程池并行解析源文件
+
+        每个 worker 拥有自己的 libclang Index，只回传符号字典和头文件列表；
+        worker 中的缓存命中/未命中数累加到 self.cache，性能报告中的统计与串行一致。
+        返回 {源文件: 解析结果}，解析失败的文件对应 None。
+        """
+        # 参数相同的文件排在一起，同一个 worker 连续解析时共享预编译头
+        groups = self.group_by_args(f for f in source_files if os.path.exists(f))
+        pending = [f for files in groups.values() for f in files]
+        if not pending:
+            return {}
+        import multiprocessing
+        chunksize = max(1, len(pending) // (jobs * 4))
+        parsed = {}
+        with multiprocessing.Pool(jobs, initializer=_init_parse_worker,
+                                  initargs=(self,)) as pool:
+            for src_file, result, (hits, misses) in pool.imap_unordered(_parse_worker, pending,
+                                                                        chunksize):
+                parsed[src_file] = result
+                if self.cache:
+                    self.cache.hits += hits
+                    self.cache.misses += misses
+        return parsed
+
+    def generate_all_units(self, output_dir, jobs=1, force=False):
+        """为所有模块生成代码单元
+
+        jobs: 解析源文件的 worker 进程数，1 表示在当前进程中串行解析。
+        force: 忽略各模块的清单，全部重新生成。
+        """
+        from materialize import Materializer
+        from unit_manifest import UnitManifest
+        self._require_parser()
+        self.output_dir = output_dir
+        self.materializer = Materializer()
+        
         # 解析 Makefile
         makefile_path = os.path.join(self.sof_path, 'Makefile')
-        self.parse_makefile(makefile_path)
+        with self.profiler.phase(MAKEFILE):
+            self.parse_makefile(makefile_path)
+        
+        # 根据各模块的清单找出需要重新解析的源文件
+        all_sources = []
+        stale_sources = []
+        manifests = {}
+        for module_name in self.modules:
+            sources = self.get_module_sources(module_name)
+            manifests[module_name] = UnitManifest.load(os.path.join(output_dir, module_name))
+            all_sources.extend(sources)
+            stale_sources.extend(self.stale_sources(sources, manifests[module_name], force))
+        
+        # 构建公共头文件的预编译头（需在启动 worker 之前）
+        if stale_sources:
+            self.prepare_pch(all_sources)
+        
+        # 并行模式：先在进程池中解析有变化的源文件
+        parsed = None
+        if jobs > 1 and stale_sources:
+            parsed = self.parse_sources_parallel(stale_sources, jobs)
         
         # 为每个模块生成单元
         results = {}
         for module_name in self.modules:
             print(f"生成模块单元: {module_name}")
-            mod_dir = self.generate_module_unit(module_name, output_dir)
+            mod_dir = self.generate_module_unit(module_name, output_dir, parsed,
+                                                manifests[module_name], force)
             results[module_name] = mod_dir
         
-        # 生成模块关系图
-        self._generate_module_graph(output_dir)
+        # 全局符号表（每次运行都重建，模块目录中的引用随之更新）
+        with self.profiler.phase(WRITE):
+            self.write_symbol_table(output_dir)
+            
+            # 生成模块关系图
+            self._generate_module_graph(output_dir)
+        print(self.materializer.summary())
+        
+        if self.cache:
+            self.cache.evict()
         return results
 
+    def write_profile(self, report_path, trace_path=None):
+        """写出 profiler 的 JSON 报告（以及可选的 Chrome trace）"""
+        extra = {'materialize': self.materializer.report()}
+        if self.cache:
+            extra['cache'] = {'hits': self.cache.hits, 'misses': self.cache.misses}
+        self.profiler.write(report_path, trace_path, **extra)
+        print(f"性能报告已生成: {report_path}")
+
     def _generate_module_graph(self, output_dir):
-        """生成模块依赖关系图（DOT格式）"""
+        """生成模块依赖关系图（DOT 格式和 JSON 邻接表）
+
+        边来自真实的链接关系：模块 A 引用了模块 B 用 EXPORT_SYMBOL* 导出的符号时
+        A -> B。先用所有模块的导出建立全局导出索引，再对每个模块的未解析引用逐个
+        查表，总代价与符号数成线性。索引中找不到的引用来自内核本体或范围外的模块。
+        """
+        exporters = {}  # 符号名 -> 导出它的模块
+        for module, data in self.modules.items():
+            for name in data.get('links', {}).get('exports', []):
+                exporters.setdefault(name, module)
+        
+        graph = {}
+        for module, data in self.modules.items():
+            depends = {}
+            external = 0
+            for name in data.get('links', {}).get('unresolved', []):
+                target = exporters.get(name)
+                if target is None:
+                    external += 1
+                elif target != module:
+                    depends.setdefault(target, []).append(name)
+            graph[module] = {
+                'depends_on': depends,
+                'exports': len(data.get('links', {}).get('exports', [])),
+                'external_refs': external
+            }
+        
         dot_content = ["digraph SOFModules {"]
         dot_content.append('  rankdir=LR;')
         dot_content.append('  node [shape=box, style=filled, color=lightblue];')
@@ -296,17 +607,10 @@ class SOFModuleAnalyzer:
         for module in self.modules:
             dot_content.append(f'  "{module}";')
         
-        # 添加依赖关系
-        for module, data in self.modules.items():
-            # 主模块依赖
-            if module == 'snd-sof':
-                for sub_module in self.modules:
-                    if sub_module != module and sub_module.startswith('snd-sof'):
-                        dot_content.append(f'  "{module}" -> "{sub_module}";')
-            
-            # 条件依赖
-            for config_var in data['conditional_sources']:
-                dot_content.append(f'  "{module}" -> "{config_var}" [style=dashed, color=gray];')
+        # 添加依赖关系，边上标注引用的符号数
+        for module, node in graph.items():
+            for target, names in sorted(node['depends_on'].items()):
+                dot_content.append(f'  "{module}" -> "{target}" [label="{len(names)}"];')
         
         dot_content.append("}")
         
@@ -315,47 +619,55 @@ class SOFModuleAnalyzer:
         with open(dot_path, 'w') as f:
             f.write("\n".join(dot_content))
         
+        # 邻接表：{模块: {'depends_on': {被依赖模块: [符号]}, 'exports': 数量, 'external_refs': 数量}}
+        with open(os.path.join(output_dir, 'module_dependencies.json'), 'w') as f:
+            json.dump(graph, f, indent=2)
+        
         print(f"模块依赖图已生成: {dot_path}")
+        return graph
 
-    def find_symbol_definition(self, symbol_name, symbol_type, module_name=None):
-        """查找符号定义位置"""
-        if module_name:
-            modules = [module_name]
-        else:
-            modules = self.modules.keys()
-        
-        results = []
-        for mod in modules:
-            symbols_path = os.path.join(output_dir, mod, 'symbols.json')
-            if not os.path.exists(symbols_path):
-                continue
-            
-            with open(symbols_path, 'r') as f:
-                symbols = json.load(f)
-            
-            for item in symbols.get(symbol_type, []):
-                if item['name'] == symbol_name:
-                    results.append({
-                        'module': mod,
-                        'file': item['file'],
-                        'line': item['line'],
-                        'symbol': symbol_name,
-                        'type': symbol_type
-                    })
-        
-        return results
+    def find_symbol_definition(self, symbol_name, symbol_type, module_name=None, output_dir=None):
+        """查找符号定义位置
+
+        每个模块的符号表只加载一次（symbols.bin 为内存映射），文件变化时自动重新加载。
+        """
+        output_dir = output_dir or self.output_dir
+        modules = [module_name] if module_name else list(self.modules) or indexed_modules(output_dir)
+        return find_definitions(output_dir, modules, symbol_name, symbol_type)
+
+    def search_symbol(self, query, symbol_type=None, module_name=None, output_dir=None,
+                      limit=20, max_distance=2):
+        """模糊查找符号：忽略 .isra.0 等编译器后缀，并按前缀和编辑距离匹配
+
+        symbol_type 为 None 时搜索所有类别；结果中精确匹配排在前面。
+        """
+        output_dir = output_dir or self.output_dir
+        modules = [module_name] if module_name else list(self.modules) or indexed_modules(output_dir)
+        types = [symbol_type] if symbol_type else None
+        return search_definitions(output_dir, modules, query, types, limit, max_distance)
 
 # 使用示例
 if __name__ == "__main__":
+    import argparse
+
     # 配置参数
     KERNEL_ROOT = "/path/to/linux-kernel"
     OUTPUT_DIR = "/path/to/output/sof_modules"
     
+    cli = argparse.ArgumentParser(description='生成 SOF 模块代码单元')
+    cli.add_argument('--profile', action='store_true',
+                     help='记录各阶段和每个文件的耗时，写入 OUTPUT_DIR/profile.json')
+    cli.add_argument('--trace', help='同时写出 Chrome trace-event 文件')
+    opts = cli.parse_args()
+    
     # 创建分析器
-    analyzer = SOFModuleAnalyzer(kernel_root=KERNEL_ROOT)
+    analyzer = SOFModuleAnalyzer(kernel_root=KERNEL_ROOT, profile=opts.profile or bool(opts.trace))
     
     # 生成所有模块代码单元
     analyzer.generate_all_units(OUTPUT_DIR)
+    if analyzer.profiler.enabled:
+        analyzer.write_profile(os.path.join(OUTPUT_DIR, 'profile.json'), opts.trace)
+        print(analyzer.profiler.summary())
     
     # 示例：查找函数定义
     print("查找函数定义示例:")
@@ -1,83 +1,199 @@
 import os
 import json
-import clang.cindex
-from clang.cindex import Index, Config, CursorKind, TranslationUnit
+
+from clang_support import (PARSE_FULL, cindex, cursor_kinds, get_index, parse_options,
+                           walk_in_scope, common_includes, build_pch, read_kernel_config,
+                           config_defines, load_compile_commands, module_of, pch_key,
+                           configure_libclang)
+from dmesg_matcher import parse_line, resolve
+from symbol_table import SymbolTable, dedupe_symbols
+from profiler import Profiler, MAKEFILE, FLAGS, PARSE, TRAVERSAL, HEADER_COPY, WRITE
+# symbol_cache、kbuild、materialize 和 argparse 只在生成代码单元时用到，在用到的地方导入，
+# lookup_only 的启动只加载匹配所需的模块
+
+# 游标类型名 -> 符号类别（用 clang_support.cursor_kinds 转换为 CursorKind）
+SYMBOL_KINDS = {
+    'FUNCTION_DECL': 'functions',
+    'STRUCT_DECL': 'structures',
+    'VAR_DECL': 'variables',
+    'ENUM_DECL': 'enums',
+}
 
 class KernelCodeAnalyzer:
-    def __init__(self, kernel_root, sof_path="sound/soc/sof"):
-        Config.set_library_file('/usr/lib/llvm-15/lib/libclang.so')
+    def __init__(self, kernel_root, sof_path="sound/soc/sof", cache_dir=None,
+                 cache_max_bytes=512 * 1024 * 1024, parse_mode=PARSE_FULL,
+                 symbol_scope=None, pch_dir=None, compile_db=None, symbol_format='bin',
+                 profile=False, libclang_path=None, lookup_only=False):
         self.kernel_root = kernel_root
         self.sof_path = os.path.join(kernel_root, sof_path)
-        self.compile_args = self._get_kernel_flags()
+        self.profiler = Profiler(profile)  # 各阶段计时和每个文件的计数器
         self.modules = {}  # 存储模块数据：{'snd-sof': {'sources':[...], 'symbols':{...}}}
+        # 只做 match_dmesg 等查询：不导入和加载 libclang，不读取 .config
+        self.lookup_only = lookup_only
+        self.cache = None
+        if lookup_only:
+            return
+        from symbol_cache import SymbolCache
+        # libclang 库文件：显式路径，否则自动查找（见 clang_support.find_libclang）
+        configure_libclang(libclang_path)
+        with self.profiler.phase(FLAGS):
+            self.compile_args = self._get_kernel_flags()
+            # compile_commands.json 模式：每个文件使用构建时的真实参数
+            self.compile_commands = load_compile_commands(compile_db, kernel_root) if compile_db else None
+        # PARSE_DECLARATIONS 跳过函数体，此时不会提取函数内的局部变量
+        self.parse_options = parse_options(parse_mode)
+        # 符号提取范围，范围外文件的子树在遍历时直接跳过
+        self.symbol_scope = os.path.join(kernel_root, symbol_scope) if symbol_scope else kernel_root
+        self._relpaths = {}  # 文件名 -> 相对路径，跨 TU 复用
+        self.pch_dir = pch_dir
+        self.pchs = {}  # {源文件: (PCH 路径, 其包含的头文件)}，只含可以使用 PCH 的文件
+        self.symbol_format = symbol_format  # 'bin'、'json' 或 'both'
+        self.cache = SymbolCache(cache_dir, cache_max_bytes) if cache_dir else None
+        # 与 SOFModuleAnalyzer 的条目区分开（符号类别不同），并按提取范围区分
+        self.cache_variant = json.dumps(['kernel', sorted(SYMBOL_KINDS.values()),
+                                         self.symbol_scope])
+
+    def _require_parser(self):
+        if self.lookup_only:
+            raise RuntimeError("lookup_only 模式下只能匹配已生成的输出，不能解析源码")
 
     def _get_kernel_flags(self):
         """提取内核编译参数"""
-        with open(os.path.join(self.kernel_root, '.config'), 'r') as f:
-            configs = [f'-D{line.strip().replace("=", "")}' for line in f]
+        configs = config_defines(read_kernel_config(os.path.join(self.kernel_root, '.config')))
         
         return [
-            '-nostdinc', '-I./include', '-I./arch/x86/include',
+            '-nostdinc',
+            '-I' + os.path.join(self.kernel_root, 'include'),
+            '-I' + os.path.join(self.kernel_root, 'arch', 'x86', 'include'),
             '-D__KERNEL__', '-DCONFIG_AS_AVX=1', *configs
         ]
 
+    def file_args(self, src_file):
+        """源文件的编译参数：优先使用 compile_commands.json 中的参数"""
+        if self.compile_commands is not None:
+            return self.compile_commands.get(src_file, self.compile_args)
+        return self.compile_args
+
     def build_module_map(self):
-        """建立模块-源文件映射"""
-        makefile = os.path.join(self.sof_path, 'Makefile')
-        with open(makefile, 'r') as f:
-            for line in f:
-                if line.startswith('obj-'):
-                    ko_name = line.split('=')[1].strip()[:-3]
-                    source_files = next(f).split('+=')[1].split()
-                    self.modules[ko_name] = {
-                        'sources': [os.path.join(self.sof_path, f) for f in source_files],
-                        'symbols': {}
-                    }
+        """建立模块-源文件映射（按 .config 求值 Kbuild 文件，含子目录）"""
+        self._require_parser()
+        if self.compile_commands is not None:
+            return self._build_module_map_from_db()
+        from kbuild import evaluate_kbuild
+        cache_dir = self.cache.cache_dir if self.cache else None
+        with self.profiler.phase(MAKEFILE):
+            modules = evaluate_kbuild(self.sof_path, self.kernel_root, cache_dir=cache_dir)
+        for ko_name, data in modules.items():
+            sources = data['sources'] + [f for files in data['conditional_sources'].values()
+                                         for f in files]
+            self.modules[ko_name] = {
+                'sources': [os.path.join(self.sof_path, f) for f in dict.fromkeys(sources)],
+                'symbols': {}
+            }
+
+    def _build_module_map_from_db(self):
+        """以 compile_commands.json 为准：按 KBUILD_MODNAME 对 SOF 目录下实际编译的文件分组"""
+        prefix = self.sof_path.rstrip(os.sep) + os.sep
+        for src_file, args in self.compile_commands.items():
+            modname = module_of(args)
+            if not modname or not src_file.startswith(prefix):
+                continue
+            ko_name = modname.replace('_', '-')
+            self.modules.setdefault(ko_name, {'sources': [], 'symbols': {}})
+            self.modules[ko_name]['sources'].append(src_file)
 
     def parse_ast(self, filename):
         """解析单个文件的AST"""
-        index = Index.create()
-        tu = index.parse(filename, args=self.compile_args)
+        args = self.file_args(filename)
+        pch = self.pchs.get(filename)
+        try:
+            tu = get_index().parse(filename, args=args + ['-include-pch', pch[0]] if pch else args,
+                                   options=self.parse_options)
+        except cindex().TranslationUnitLoadError:
+            if not pch:
+                raise
+            # PCH 与该文件的参数不兼容时退回普通解析
+            tu = get_index().parse(filename, args=args, options=self.parse_options)
         return tu.cursor
 
-    def extract_symbols(self, cursor, module_name):
-        """递归提取符号和位置信息"""
-        if cursor.location.file is None: 
-            return
-            
-        file_path = cursor.location.file.name
-        if not file_path.startswith(self.kernel_root):
-            return
-            
-        # 符号类型处理
-        symbol_key = None
-        if cursor.kind == CursorKind.FUNCTION_DECL:
-            symbol_key = 'functions'
-        elif cursor.kind == CursorKind.STRUCT_DECL:
-            symbol_key = 'structures'
-        elif cursor.kind == CursorKind.VAR_DECL:
-            symbol_key = 'variables'
-        elif cursor.kind == CursorKind.ENUM_DECL:
-            symbol_key = 'enums'
-            
-        if symbol_key:
-            loc = cursor.location
-            symbol_data = {
-                'name': cursor.spelling,
-                'file': os.path.relpath(file_path, self.kernel_root),
-                'line': loc.line,
-                'column': loc.column,
-                'type': cursor.type.spelling
-            }
-            self.modules[module_name]['symbols'].setdefault(symbol_key, []).append(symbol_data)
+    def extract_symbols(self, cursor, module_name, symbols=None):
+        """提取符号和位置信息（显式栈遍历，跳过范围外文件的子树）
+
+        symbols: 结果写入的字典，默认为模块的符号表
+        同一声明（USR 加位置相同）只记录一次。
+        """
+        if symbols is None:
+            symbols = self.modules[module_name]['symbols']
+        
+        kinds = cursor_kinds(SYMBOL_KINDS)
+        found = {}
+        visited = 0
+        for node, loc, rel_path in walk_in_scope(cursor, self.kernel_root,
+                                                 self.symbol_scope, self._relpaths):
+            visited += 1
+            symbol_key = kinds.get(node.kind)
+            if symbol_key:
+                symbol_data = {
+                    'name': node.spelling,
+                    'usr': node.get_usr(),
+                    'file': rel_path,
+                    'line': loc.line,
+                    'column': loc.column,
+                    'type': node.type.spelling
+                }
+                found.setdefault(symbol_key, []).append(symbol_data)
+        dedupe_symbols(found, symbols)
+        return visited
+
+    def parse_symbols(self, src_file, module_name):
+        """解析单个文件并返回其符号，优先使用符号缓存"""
+        self._require_parser()
+        args = self.file_args(src_file)
+        if self.cache:
+            cached = self.cache.lookup(src_file, args, self.parse_options, self.cache_variant)
+            if cached is not None:
+                self.profiler.count(src_file, cache_hits=1)
+                return cached['symbols']
+        
+        with self.profiler.phase(PARSE, src_file):
+            cursor = self.parse_ast(src_file)
+        symbols = {}
+        with self.profiler.phase(TRAVERSAL, src_file):
+            visited = self.extract_symbols(cursor, module_name, symbols)
+        self.profiler.count(src_file, cursors=visited,
+                            symbols=sum(len(items) for items in symbols.values()))
         
-        # 递归遍历子节点
-        for child in cursor.get_children():
-            self.extract_symbols(child, module_name)
+        if self.cache:
+            includes = [inc.include.name for inc in cursor.translation_unit.get_includes()]
+            pch = self.pchs.get(src_file)
+            if pch:
+                includes.extend(pch[1])
+            self.cache.store(src_file, args, includes, symbols,
+                             self.parse_options, variant=self.cache_variant)
+        return symbols
 
     def generate_code_units(self, output_dir):
         """生成代码单元和符号表"""
+        from materialize import Materializer
+        self._require_parser()
         os.makedirs(output_dir, exist_ok=True)
+        self.materializer = Materializer()
+        table = SymbolTable()  # 全局符号表，模块目录中只保存引用
+        
+        # 公共内核头文件按编译参数分组，每组只预编译一次
+        if self.pch_dir:
+            groups = {}
+            for data in self.modules.values():
+                for src_file in data['sources']:
+                    groups.setdefault(pch_key(self.file_args(src_file)), []).append(src_file)
+            config_path = os.path.join(self.kernel_root, '.config')
+            for args, sources in groups.items():
+                headers, users = common_includes(sources)
+                pch = build_pch(self.pch_dir, headers, args, config_path)
+                if pch:
+                    self.pchs.update(dict.fromkeys(users, pch))
+                else:
+                    print(f"未生成预编译头（{len(sources)} 个文件），按普通方式解析")
         
         for mod_name, data in self.modules.items():
             mod_dir = os.path.join(output_dir, mod_name)
@@ -88,59 +204,81 @@ class KernelCodeAnalyzer:
                 rel_path = os.path.relpath(src_file, self.kernel_root)
                 dest_path = os.path.join(mod_dir, 'src', rel_path)
                 os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                os.link(src_file, dest_path)  # 硬链接避免复制
+                copied = self.materializer.bytes_copied
+                with self.profiler.phase(HEADER_COPY, src_file):
+                    self.materializer.place(src_file, dest_path)  # reflink / 硬链接避免复制
+                self.profiler.count(src_file, bytes_copied=self.materializer.bytes_copied - copied)
                 
-                # 解析AST并提取符号
-                self.extract_symbols(self.parse_ast(src_file), mod_name)
+                # 解析AST并提取符号（缓存命中时跳过 libclang）
+                for key, items in self.parse_symbols(src_file, mod_name).items():
+                    data['symbols'].setdefault(key, []).extend(items)
             
-            # 2. 保存符号表
-            with open(os.path.join(mod_dir, 'symbols.json'), 'w') as f:
-                json.dump(data['symbols'], f, indent=2)
+            # 2. 加入全局符号表（按 USR 加位置去重）
+            table.add(mod_name, data['symbols'])
             
             # 3. 保存编译信息
-            with open(os.path.join(mod_dir, 'build_info.txt'), 'w') as f:
-                f.write(f"Module: {mod_name}\nSources:\n")
-                f.write("\n".join(data['sources']))
-                f.write("\n\nCompiler flags:\n" + " ".join(self.compile_args))
+            with self.profiler.phase(WRITE):
+                with open(os.path.join(mod_dir, 'build_info.txt'), 'w') as f:
+                    f.write(f"Module: {mod_name}\nSources:\n")
+                    f.write("\n".join(data['sources']))
+                    if self.compile_commands is None:
+                        f.write("\n\nCompiler flags:\n" + " ".join(self.compile_args))
+                    else:
+                        # compile_commands.json 模式：记录每个文件实际使用的参数
+                        f.write("\n\nCompiler flags (compile_commands.json):\n")
+                        f.write("\n".join(f"{os.path.relpath(src, self.kernel_root)}: "
+                                          + " ".join(self.file_args(src))
+                                          for src in data['sources']))
+        
+        # 4. 保存全局符号表和各模块的引用
+        formats = {'bin': ['symbols.bin'], 'json': ['symbols.json'],
+                   'both': ['symbols.bin', 'symbols.json']}[self.symbol_format]
+        with self.profiler.phase(WRITE):
+            table.write(output_dir, formats, self.modules)
+        
+        print(self.materializer.summary())
+        if self.cache:
+            self.cache.evict()
+
+    def write_profile(self, report_path, trace_path=None):
+        """写出 profiler 的 JSON 报告（以及可选的 Chrome trace）"""
+        extra = {'materialize': self.materializer.report()}
+        if self.cache:
+            extra['cache'] = {'hits': self.cache.hits, 'misses': self.cache.misses}
+        self.profiler.write(report_path, trace_path, **extra)
+        print(f"性能报告已生成: {report_path}")
 
     def match_dmesg(self, log_line, output_dir):
         """匹配dmesg日志到代码位置"""
         # 示例日志: [    0.483] snd_sof: error: sof_ipc_tx_message: timeout at ops.c:215
-        parts = log_line.split(':')
-        if len(parts) < 4: 
+        parsed = parse_line(log_line)
+        if not parsed:
             return None
-            
-        module_name = parts[0].strip().split()[-1]
-        func_name = parts[-2].split()[-1]
-        location = parts[-1].strip()
+        module_name, func_name, location = parsed
         
-        # 加载符号表
+        # 日志中的模块名使用下划线，输出目录沿用 Makefile 中的连字符
         mod_dir = os.path.join(output_dir, module_name)
-        try:
-            with open(os.path.join(mod_dir, 'symbols.json'), 'r') as f:
-                symbols = json.load(f)
-        except:
-            return None
-            
-        # 查找匹配的符号
-        result = {}
-        for category in ['functions', 'structures', 'variables']:
-            for symbol in symbols.get(category, []):
-                if symbol['name'] == func_name:
-                    result = {
-                        'symbol': symbol['name'],
-                        'defined_at': f"{symbol['file']}:{symbol['line']}",
-                        'log_location': location,
-                        'code_path': os.path.join(mod_dir, 'src', symbol['file'])
-                    }
-                    return result
-        return None
+        if not os.path.isdir(mod_dir):
+            mod_dir = os.path.join(output_dir, module_name.replace('_', '-'))
+        return resolve(mod_dir, func_name, location)
 
 # 使用示例
 if __name__ == "__main__":
-    analyzer = KernelCodeAnalyzer(kernel_root="/path/to/linux-kernel")
+    import argparse
+
+    cli = argparse.ArgumentParser(description='生成内核代码单元并匹配 dmesg 日志')
+    cli.add_argument('--profile', action='store_true',
+                     help='记录各阶段和每个文件的耗时，写入 sof_modules/profile.json')
+    cli.add_argument('--trace', help='同时写出 Chrome trace-event 文件')
+    opts = cli.parse_args()
+    
+    analyzer = KernelCodeAnalyzer(kernel_root="/path/to/linux-kernel",
+                                  profile=opts.profile or bool(opts.trace))
     analyzer.build_module_map()
     analyzer.generate_code_units("sof_modules")
+    if analyzer.profiler.enabled:
+        analyzer.write_profile(os.path.join("sof_modules", 'profile.json'), opts.trace)
+        print(analyzer.profiler.summary())
     
     # 测试日志匹配
     log = "[    0.483] snd_sof: error: sof_ipc_tx_message: timeout at ops.c:215"
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+# 阶段名称
+MAKEFILE = 'makefile'        # Makefile / Kbuild 求值
+FLAGS = 'flags'              # 编译参数构建
+PARSE = 'parse'              # 单个 TU 的 libclang 解析
+TRAVERSAL = 'traversal'      # 单个 TU 的 AST 遍历和符号提取
+HEADER_COPY = 'header_copy'  # 源文件和头文件的放置
+WRITE = 'write'              # 符号表、构建信息和清单的写入
+
+_DISABLED = nullcontext()
+
+
+def now():
+    """单调时钟（Linux 上各进程共享同一时钟，worker 的时间戳可以直接合并）"""
+    return time.perf_counter()
+
+
+class Profiler:
+    """阶段计时和每个文件的计数器
+
+    phase() 记录一段计时，span() 合并在其他进程中测得的计时，count() 累加文件计数器。
+    enabled=False 时所有调用都是空操作。结果可写成 JSON 报告和 Chrome trace-event
+    文件（chrome://tracing 或 Perfetto 打开）。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.start = now()
+        self.phases = {}  # 阶段 -> {'seconds': 总耗时, 'count': 次数}
+        self.files = {}   # 文件 -> {计数器: 值}
+        self.events = []  # (阶段, 开始, 结束, pid, 文件)
+
+    def phase(self, name, file=None):
+        """计时上下文：with profiler.phase(PARSE, src_file): ..."""
+        if not self.enabled:
+            return _DISABLED
+        return self._phase(name, file)
+
+    @contextmanager
+    def _phase(self, name, file):
+        start = now()
+        try:
+            yield
+        finally:
+            self.span(name, start, now(), file)
+
+    def span(self, name, start, end, file=None, pid=None):
+        """记录一段已完成的计时；file 不为空时同时累加到该文件的 <阶段>_ms"""
+        if not self.enabled:
+            return
+        stats = self.phases.setdefault(name, {'seconds': 0.0, 'count': 0})
+        stats['seconds'] += end - start
+        stats['count'] += 1
+        self.events.append((name, start, end, pid or os.getpid(), file))
+        if file is not None:
+            self.count(file, **{name + '_ms': (end - start) * 1000})
+
+    def count(self, file, **counters):
+        if not self.enabled:
+            return
+        stats = self.files.setdefault(file, {})
+        for key, value in counters.items():
+            stats[key] = stats.get(key, 0) + value
+
+    def report(self, **extra):
+        """JSON 报告：总耗时、各阶段耗时和按耗时降序排列的文件"""
+        files = [dict(stats, file=file) for file, stats in self.files.items()]
+        files.sort(key=lambda s: -(s.get(PARSE + '_ms', 0) + s.get(TRAVERSAL + '_ms', 0)))
+        for stats in files:
+            for key, value in stats.items():
+                if key.endswith('_ms'):
+                    stats[key] = round(value, 3)
+        report = {
+            'total_seconds': round(now() - self.start, 3),
+            'phases': {name: {'seconds': round(s['seconds'], 3), 'count': s['count']}
+                       for name, s in self.phases.items()},
+            'files': files
+        }
+        report.update(extra)
+        return report
+
+    def trace_events(self):
+        events = []
+        for name, start, end, pid, file in self.events:
+            event = {'name': name, 'ph': 'X', 'pid': pid, 'tid': pid,
+                     'ts': round((start - self.start) * 1e6, 1),
+                     'dur': round((end - start) * 1e6, 1)}
+            if file is not None:
+                event['args'] = {'file': file}
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, report_path, trace_path=None, **extra):
+        """写出 JSON 报告，trace_path 不为空时同时写出 Chrome trace"""
+        with open(report_path, 'w') as f:
+            json.dump(self.report(**extra), f, indent=2)
+        if trace_path:
+            with open(trace_path, 'w') as f:
+                json.dump(self.trace_events(), f)
+
+    def summary(self, top=10):
+        """各阶段耗时和最慢的文件，用于打印"""
+        lines = [f"{name}: {s['seconds']:.3f}s ({s['count']} 次)"
+                 for name, s in self.phases.items()]
+        for stats in self.report()['files'][:top]:
+            lines.append(f"  {stats['file']}: 解析 {stats.get(PARSE + '_ms', 0):.1f} ms, "
+                         f"遍历 {stats.get(TRAVERSAL + '_ms', 0):.1f} ms, "
+                         f"游标 {stats.get('cursors', 0)}, 符号 {stats.get('symbols', 0)}")
+        return "\n".join(lines)
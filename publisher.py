@@ -0,0 +1,118 @@
+"""Batched publishing with publisher confirms"""
+
+import time
+import pika
+
+from collections import deque
+
+from codec import PUBLISH_CODEC
+
+
+class Publisher(object):
+    """Buffers messages and publishes them in batches with publisher confirms
+
+    publish() encodes the message once with `codec` (PUBLISH_CODEC by default)
+    and buffers it; the buffer is flushed when it
+    holds batch_size messages or flush_interval seconds after the first one was
+    buffered (0: once the connection has run the callbacks at hand, so everything
+    published while handling one burst of deliveries goes out together). With confirms at most max_in_flight messages are unconfirmed at a
+    time, and nacked messages are published again up to max_retries times. Must be
+    used on the connection's own thread, like the channel itself.
+
+    pika's BlockingChannel confirms every publish synchronously (basic_publish
+    returns the outcome), so there only batching and retries apply; asynchronous
+    channels (SelectConnection, LocalBroker) keep max_in_flight confirms pipelined.
+    """
+    def __init__(self, connection, channel, exchange='', codec=None,
+                 batch_size=100, flush_interval=0, max_in_flight=1000,
+                 confirms=True, max_retries=3):
+        self.connection = connection
+        self.channel = channel
+        self.exchange = exchange
+        self.codec = codec or PUBLISH_CODEC
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.buffer = deque()  # [routing_key, body, attempts, on_confirm, properties]
+        self.in_flight = {}    # delivery tag -> buffered entry
+        self.seq = 0
+        self.timer = None
+        self.sent = 0
+        self.failed = 0
+        self.confirms = confirms
+        self.sync_confirms = False
+        if confirms:
+            if isinstance(channel, pika.adapters.blocking_connection.BlockingChannel):
+                channel.confirm_delivery()
+                self.sync_confirms = True
+            else:
+                channel.confirm_delivery(self.on_confirm)
+
+    def publish(self, routing_key, message, on_confirm=None):
+        """Queue a message; on_confirm(ok) runs once the broker confirmed it or retries ran out"""
+        properties, body = self.codec.encode(message)
+        self.buffer.append([routing_key, body, 0, on_confirm, properties])
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.connection.add_timeout(self.flush_interval, self._on_timer)
+
+    def _on_timer(self):
+        self.timer = None
+        self.flush()
+
+    def flush(self):
+        """Publish buffered messages while the in-flight window has room"""
+        if self.timer is not None:
+            self.connection.remove_timeout(self.timer)
+            self.timer = None
+        while self.buffer and len(self.in_flight) < self.max_in_flight:
+            entry = self.buffer.popleft()
+            ok = self.channel.basic_publish(exchange=self.exchange, routing_key=entry[0],
+                                            properties=entry[4], body=entry[1])
+            self.sent += 1
+            if not self.confirms:
+                self._settle(entry, True)
+            elif self.sync_confirms:
+                self._settle(entry, ok)
+            else:
+                self.seq += 1
+                self.in_flight[self.seq] = entry
+
+    def on_confirm(self, method_frame):
+        """Basic.Ack / Basic.Nack from the broker, possibly covering several tags"""
+        method = method_frame.method
+        ok = method.NAME == 'Basic.Ack'
+        if method.multiple:
+            tags = sorted(t for t in self.in_flight if t <= method.delivery_tag)
+        else:
+            tags = [method.delivery_tag]
+        for tag in tags:
+            entry = self.in_flight.pop(tag, None)
+            if entry is not None:
+                self._settle(entry, ok)
+        self.flush()
+
+    def _settle(self, entry, ok):
+        if not ok and entry[2] < self.max_retries:
+            entry[2] += 1
+            self.buffer.appendleft(entry)
+            return
+        if not ok:
+            self.failed += 1
+            print "Publish to %s failed after %d retries" %(entry[0], self.max_retries)
+        if entry[3] is not None:
+            entry[3](ok)
+
+    def pending(self):
+        return len(self.buffer) + len(self.in_flight)
+
+    def drain(self, timeout=10):
+        """Flush and wait for all confirms (for publishers that do not consume)"""
+        deadline = time.time() + timeout
+        self.flush()
+        while self.pending() and time.time() < deadline:
+            self.connection.process_data_events(time_limit=0.01)
+            self.flush()
+        return not self.pending()
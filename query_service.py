@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import stat
+import time
+import errno
+import socket
+import asyncio
+import argparse
+
+from dmesg_matcher import parse_line, resolve
+from symbol_index import find_definitions, search_definitions, indexed_modules, load_module_index
+
+# 协议：每行一个 JSON 请求，每个请求按收到的顺序返回一行 JSON 响应。
+# 客户端可以连续发送多个请求而不必等待响应（流水线）。
+#   {"id": 1, "op": "find", "symbol": "sof_ipc_tx_message", "type": "functions", "module": "snd-sof"}
+#   {"id": 2, "op": "match", "lines": ["[    0.483] snd_sof: error: sof_ipc_tx_message: ..."]}
+#   {"id": 3, "op": "batch", "requests": [{"op": "find", ...}, {"op": "match", "line": "..."}]}
+#   {"id": 4, "op": "search", "query": "sof_ipc_tx_mesage.isra.0", "limit": 20, "max_distance": 2}
+#   {"id": 5, "op": "reload"}    {"id": 6, "op": "stats"}
+# 响应：{"id": 1, "ok": true, "result": ...}，出错时为 {"id": 1, "ok": false, "error": "..."}；
+# 单个请求出错不影响同一连接上的其他请求
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+DEFAULT_SOCKET = '/tmp/sof_query.sock'
+
+
+def _field(request, name, kind, default=KeyError):
+    """取请求字段并检查类型；没有默认值的字段缺失时抛出 KeyError"""
+    if name not in request or request[name] is None:
+        if default is KeyError:
+            raise KeyError(name)
+        return default
+    value = request[name]
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise TypeError(f"字段 {name} 必须是 {kind.__name__}")
+    return value
+
+
+def _remove_stale_socket(path):
+    """删除之前的服务留下的套接字文件
+
+    只删除无人监听（连接被拒绝）的套接字；path 不是套接字或已有服务在监听时抛出 OSError。
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(errno.EEXIST, "路径已存在且不是套接字", path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, "已有服务在监听该套接字", path)
+
+
+class QueryService:
+    """常驻的符号查询服务
+
+    符号表只在启动时加载一次；之后每次查询通过 symbol_index 的缓存索引完成，
+    模块输出重新生成（文件的 mtime 或大小变化）后在下一次查询时自动重新加载，
+    输出目录中新增或删除的模块在 check_interval 秒内生效。
+    """
+
+    def __init__(self, output_dir, check_interval=1.0):
+        self.output_dir = output_dir
+        self.check_interval = check_interval
+        self.requests = 0
+        self.started = time.monotonic()
+        self._dirs = {}      # 日志模块名 / 目录名 -> 目录名
+        self._modules = []   # 有符号索引的模块目录名
+        self._stamp = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def reload(self):
+        """重新扫描输出目录，并预先加载所有模块的符号索引"""
+        self._stamp = os.stat(self.output_dir).st_mtime_ns
+        self._checked_at = time.monotonic()
+        modules = indexed_modules(self.output_dir)
+        dirs = {}
+        for name in modules:
+            dirs[name] = name
+            dirs.setdefault(name.replace('-', '_'), name)
+            load_module_index(os.path.join(self.output_dir, name))
+        self._dirs = dirs
+        self._modules = modules
+        return modules
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if os.stat(self.output_dir).st_mtime_ns != self._stamp:
+            self.reload()
+
+    def find(self, symbol, symbol_type='functions', module=None):
+        modules = [self._dirs.get(module, module)] if module else self._modules
+        return find_definitions(self.output_dir, modules, symbol, symbol_type)
+
+    def search(self, query, symbol_type=None, module=None, limit=20, max_distance=2):
+        modules = [self._dirs.get(module, module)] if module else self._modules
+        types = [symbol_type] if symbol_type else None
+        return search_definitions(self.output_dir, modules, query, types, limit, max_distance)
+
+    def match(self, line):
+        parsed = parse_line(line)
+        if not parsed:
+            return None
+        module, func_name, location = parsed
+        mod_name = self._dirs.get(module)
+        if mod_name is None:
+            return None
+        match = resolve(os.path.join(self.output_dir, mod_name), func_name, location)
+        if match:
+            match['module'] = mod_name
+        return match
+
+    def handle(self, request):
+        """处理一个已解码的请求，返回结果（出错时抛出异常）"""
+        self.requests += 1
+        self._refresh()
+        op = request.get('op')
+        if op == 'find':
+            return self.find(_field(request, 'symbol', str),
+                             _field(request, 'type', str, 'functions'),
+                             _field(request, 'module', str, None))
+        if op == 'search':
+            return self.search(_field(request, 'query', str), _field(request, 'type', str, None),
+                               _field(request, 'module', str, None),
+                               _field(request, 'limit', int, 20),
+                               _field(request, 'max_distance', int, 2))
+        if op == 'match':
+            if 'lines' in request:
+                lines = _field(request, 'lines', list)
+                if not all(isinstance(line, str) for line in lines):
+                    raise TypeError("字段 lines 必须是字符串列表")
+                return [self.match(line) for line in lines]
+            return self.match(_field(request, 'line', str))
+        if op == 'batch':
+            items = _field(request, 'requests', list)
+            return [self._respond(item) if isinstance(item, dict)
+                    else {'id': None, 'ok': False, 'error': "请求必须是 JSON 对象"}
+                    for item in items]
+        if op == 'reload':
+            return self.reload()
+        if op == 'stats':
+            return {'modules': len(self._modules), 'requests': self.requests,
+                    'uptime': round(time.monotonic() - self.started, 3)}
+        raise ValueError(f"未知的操作: {op}")
+
+    def _respond(self, request):
+        response = {'id': request.get('id')}
+        try:
+            response['result'] = self.handle(request)
+            response['ok'] = True
+        except Exception as e:
+            # 任何异常都只影响这一个请求，连接和流水线中的后续请求照常处理
+            response['ok'] = False
+            response['error'] = f"{type(e).__name__}: {e}"
+        return response
+
+    def respond_line(self, line):
+        """一行请求 -> 一行响应（字节）"""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("请求必须是 JSON 对象")
+        except ValueError as e:
+            response = {'id': None, 'ok': False, 'error': f"无效的请求: {e}"}
+        else:
+            response = self._respond(request)
+        return (json.dumps(response) + '\n').encode()
+
+    async def _serve_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write((json.dumps({'id': None, 'ok': False, 'error': "请求过大"})
+                                  + '\n').encode())
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # 查询本身是同步的内存操作；流水线中的请求依次处理，
+                # 写缓冲超过高水位时才等待客户端读取
+                writer.write(self.respond_line(line))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, path=None, host='127.0.0.1', port=None):
+        """在 Unix 套接字 path 或 TCP host:port 上启动服务，返回 asyncio Server"""
+        if port is not None:
+            return await asyncio.start_server(self._serve_client, host, port,
+                                              limit=MAX_REQUEST_BYTES)
+        path = path or DEFAULT_SOCKET
+        _remove_stale_socket(path)
+        return await asyncio.start_unix_server(self._serve_client, path,
+                                               limit=MAX_REQUEST_BYTES)
+
+
+async def serve(output_dir, path=None, host='127.0.0.1', port=None):
+    service = QueryService(output_dir)
+    server = await service.start(path, host, port)
+    where = f"{host}:{port}" if port is not None else (path or DEFAULT_SOCKET)
+    print(f"查询服务已启动: {where}，{len(service._modules)} 个模块")
+    async with server:
+        await server.serve_forever()
+
+
+class QueryClient:
+    """同步客户端：requests() 按窗口连续写出请求再依次读取响应（流水线）
+
+    窗口限制未读取的响应数量，避免双方的套接字缓冲区同时写满而互相等待。
+    """
+
+    def __init__(self, path=None, host='127.0.0.1', port=None, timeout=30.0):
+        if port is not None:
+            self.sock = socket.create_connection((host, port), timeout)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(path or DEFAULT_SOCKET)
+        self.file = self.sock.makefile('rb')
+
+    def requests(self, requests, window=256):
+        responses = []
+        for i in range(0, len(requests), window):
+            chunk = requests[i:i + window]
+            self.sock.sendall(b''.join((json.dumps(r) + '\n').encode() for r in chunk))
+            responses.extend(json.loads(self.file.readline()) for _ in chunk)
+        return responses
+
+    def request(self, **request):
+        return self.requests([request])[0]
+
+    def find(self, symbol, symbol_type='functions', module=None):
+        return self.request(op='find', symbol=symbol, type=symbol_type,
+                            module=module).get('result')
+
+    def match(self, lines):
+        return self.request(op='match', lines=list(lines)).get('result')
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def main(argv=None):
+    cli = argparse.ArgumentParser(description='常驻的符号查询服务')
+    cli.add_argument('output_dir', help='generate_all_units / generate_code_units 的输出目录')
+    cli.add_argument('--socket', help=f'Unix 套接字路径（默认 {DEFAULT_SOCKET}）')
+    cli.add_argument('--host', default='127.0.0.1')
+    cli.add_argument('--port', type=int, help='使用 TCP 端口而不是 Unix 套接字')
+    args = cli.parse_args(argv)
+    try:
+        asyncio.run(serve(args.output_dir, args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Routing policies: which worker queue the dispatcher sends each job to"""
+
+
+# Queue all workers compete on when the dispatcher uses SharedQueue
+SHARED_QUEUE = 'jobs'
+
+
+class RoundRobin(object):
+    """The old go_far toggle generalized to any number of workers"""
+    queue = None
+
+    def __init__(self):
+        self.names = []
+        self.next = 0
+
+    def add(self, name):
+        if name not in self.names:
+            self.names.append(name)
+
+    def remove(self, name):
+        if name in self.names:
+            self.names.remove(name)
+
+    def route(self, job):
+        """Queue to publish the job to, None while no worker is registered"""
+        if not self.names:
+            return None
+        name = self.names[self.next % len(self.names)]
+        self.next += 1
+        return name
+
+    def done(self, name):
+        pass
+
+
+class LeastOutstanding(RoundRobin):
+    """Send each job to the worker with the fewest jobs not yet answered
+
+    With max_outstanding, jobs beyond that many per worker stay with the dispatcher
+    until a result comes back, so a long job cannot collect a queue behind it.
+    """
+    def __init__(self, max_outstanding=2):
+        RoundRobin.__init__(self)
+        self.max_outstanding = max_outstanding
+        self.outstanding = {}
+
+    def add(self, name):
+        RoundRobin.add(self, name)
+        self.outstanding.setdefault(name, 0)
+
+    def route(self, job):
+        if not self.names:
+            return None
+        name = min(self.names, key=lambda n: self.outstanding[n])
+        if self.max_outstanding and self.outstanding[name] >= self.max_outstanding:
+            return None
+        self.outstanding[name] += 1
+        return name
+
+    def remove(self, name):
+        RoundRobin.remove(self, name)
+        self.outstanding.pop(name, None)
+
+    def done(self, name):
+        if self.outstanding.get(name):
+            self.outstanding[name] -= 1
+
+
+class SharedQueue(RoundRobin):
+    """All workers compete on one queue; each worker's prefetch bounds what it holds"""
+    queue = SHARED_QUEUE
+
+    def route(self, job):
+        return self.queue
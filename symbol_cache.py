@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+import tempfile
+
+# 符号条目格式的版本，条目字段变化（如增加 usr）或键的组成变化时递增，使旧缓存失效
+CACHE_VERSION = 4
+
+
+class SymbolCache:
+    """按内容哈希索引的持久化符号缓存
+
+    键由源文件路径、源文件内容、编译参数、解析选项和变体计算（变体区分产生条目的
+    分析器、符号格式和提取范围，它们的结果形状不同，不能互相复用）；条目中记录该源文件
+    包含的所有头文件及其哈希，查询时逐一校验，任一头文件变化即视为未命中。
+    缓存总大小超过 max_bytes 时按最近使用时间淘汰。
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes = {}  # (路径, mtime_ns, size) -> sha256，同一次运行内复用
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def file_hash(self, path):
+        """计算文件内容的 sha256，按 (mtime, size) 记忆化"""
+        st = os.stat(path)
+        memo_key = (path, st.st_mtime_ns, st.st_size)
+        digest = self._file_hashes.get(memo_key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._file_hashes[memo_key] = digest
+        return digest
+
+    def _key(self, src_file, compile_args, options, variant):
+        h = hashlib.sha256()
+        h.update(f"{CACHE_VERSION}:{options}:{variant}".encode())
+        h.update(b'\0')
+        h.update(os.path.abspath(src_file).encode())
+        h.update(b'\0')
+        h.update(self.file_hash(src_file).encode())
+        for arg in compile_args:
+            h.update(b'\0')
+            h.update(arg.encode())
+        return h.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def lookup(self, src_file, compile_args, options=0, variant=''):
+        """查询缓存，命中时返回 {'symbols': ..., 'includes': [...], 'links': ...}，否则返回 None"""
+        path = self._entry_path(self._key(src_file, compile_args, options, variant))
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # 校验所有包含的头文件
+        for header, digest in entry['includes'].items():
+            try:
+                if self.file_hash(header) != digest:
+                    break
+            except OSError:
+                break
+        else:
+            os.utime(path)  # 更新最近使用时间，供淘汰使用
+            self.hits += 1
+            return {'symbols': entry['symbols'], 'includes': list(entry['includes']),
+                    'links': entry.get('links')}
+
+        self.misses += 1
+        return None
+
+    def store(self, src_file, compile_args, includes, symbols, options=0, links=None,
+              variant=''):
+        """写入缓存条目（原子替换，可被多个进程同时调用）
+
+        links: 可选的链接信息（导出、定义和外部引用的符号名）
+        variant: 与 lookup 相同的变体字符串
+        """
+        entry = {
+            'source': os.path.abspath(src_file),
+            'includes': {},
+            'symbols': symbols,
+            'links': links
+        }
+        for header in includes:
+            try:
+                entry['includes'][header] = self.file_hash(header)
+            except OSError:
+                return  # 头文件已不可读，不缓存该结果
+
+        path = self._entry_path(self._key(src_file, compile_args, options, variant))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """淘汰最久未使用的条目，直到缓存总大小不超过 max_bytes"""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,267 @@
+import os
+import json
+import time
+
+from symbol_store import SymbolStore, file_stamp
+from symbol_table import REFS_NAME, read_refs
+from symbol_search import search_index
+
+# 模块目录中的符号表文件，按优先级排列
+SYMBOL_FILES = ('symbols.bin', 'symbols.json')
+
+
+class SymbolIndex:
+    """常驻内存的符号索引
+
+    对一个模块的 symbols.json 只加载一次，建立按名称和按 (文件, 行号)
+    的字典索引。文件在磁盘上变化（mtime 或大小改变）时自动重新加载。
+    """
+
+    def __init__(self, symbols_path, check_interval=1.0):
+        self.symbols_path = symbols_path
+        self.check_interval = check_interval  # 两次检查磁盘文件之间的最短间隔（秒）
+        self.entries = []      # 按记录下标排列的 (类别, 条目)，与 symbols.bin 的记录顺序一致
+        self.by_name = {}      # 名称 -> [记录下标, ...]
+        self.by_location = {}  # (文件, 行号) -> [记录下标, ...]，文件也可以是文件名
+        self._stamp = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def reload(self):
+        """从磁盘重新加载符号表并重建索引"""
+        stamp = file_stamp(self.symbols_path)
+        with open(self.symbols_path, 'r') as f:
+            symbols = json.load(f)
+
+        entries = []
+        by_name = {}
+        by_location = {}
+        for category, items in symbols.items():
+            for item in items:
+                i = len(entries)
+                entries.append((category, item))
+                by_name.setdefault(item['name'], []).append(i)
+                by_location.setdefault((item['file'], item['line']), []).append(i)
+                basename = os.path.basename(item['file'])
+                if basename != item['file']:
+                    by_location.setdefault((basename, item['line']), []).append(i)
+
+        self.entries = entries
+        self.by_name = by_name
+        self.by_location = by_location
+        self._stamp = stamp
+        self._checked_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """symbols.json 在磁盘上变化时重新加载；文件被删除时返回 False
+
+        force: 不等待 check_interval，立即检查
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return True
+        self._checked_at = now
+        try:
+            stamp = file_stamp(self.symbols_path)
+        except OSError:
+            return False
+        if stamp != self._stamp:
+            self.reload()
+        return True
+
+    def entry(self, i):
+        """第 i 条记录，(类别, 符号条目)"""
+        return self.entries[i]
+
+    def names(self):
+        """生成 (名称, 记录下标)"""
+        for i, (_, item) in enumerate(self.entries):
+            yield item['name'], i
+
+    def lookup(self, name, categories=None, ids=None):
+        """按名称查找符号，可限定类别，按类别顺序返回 [(类别, 条目), ...]
+
+        ids: 可选的记录下标集合，只返回其中的记录（模块视图使用）
+        """
+        entries = [self.entries[i] for i in self.by_name.get(name, [])
+                   if ids is None or i in ids]
+        if categories is None:
+            return entries
+        return [e for c in categories for e in entries if e[0] == c]
+
+    def at(self, file, line, ids=None):
+        """按 (文件, 行号) 查找符号，文件可以是相对路径或文件名"""
+        return [self.entries[i] for i in self.by_location.get((file, line), [])
+                if ids is None or i in ids]
+
+    def to_dict(self):
+        """还原为 {类别: [符号条目]}"""
+        symbols = {}
+        for category, item in self.entries:
+            symbols.setdefault(category, []).append(item)
+        return symbols
+
+
+class ModuleView:
+    """全局符号表中一个模块引用的部分
+
+    模块目录只保存 refs.bin（全局表的记录下标），查询委托给上级目录的全局符号表。
+    引用只在全局表重新加载（生成标记变化）时随之重新读取，不单独检查。
+    接口与 SymbolIndex 一致：lookup / at / refresh。
+    """
+
+    def __init__(self, table, refs_path):
+        self.table = table
+        self.refs_path = refs_path
+        self._stamp = None
+        self.reload()
+
+    def reload(self):
+        # 先让全局表对齐到磁盘上的当前生成，再读取同一生成的引用
+        self.table.refresh(force=True)
+        self.refs = frozenset(read_refs(self.refs_path))
+        self._stamp = self.table._stamp
+
+    def refresh(self):
+        """全局表重新加载时（生成标记变化）一起重新读取引用，两者不会错配；
+        任一文件被删除时返回 False"""
+        if not self.table.refresh():
+            return False
+        if self.table._stamp != self._stamp:
+            try:
+                self.reload()
+            except OSError:
+                return False
+        return True
+
+    def lookup(self, name, categories=None):
+        return self.table.lookup(name, categories, self.refs)
+
+    def at(self, file, line):
+        return self.table.at(file, line, self.refs)
+
+    def to_dict(self):
+        """还原为模块自己的 {类别: [符号条目]}"""
+        symbols = {}
+        for i in sorted(self.refs):
+            category, item = self.table.entry(i)
+            symbols.setdefault(category, []).append(item)
+        return symbols
+
+
+_indexes = {}
+
+
+def load_index(symbols_path):
+    """获取符号表文件对应的索引，进程内只加载一次；文件不存在时返回 None
+
+    symbols.bin 以内存映射方式打开，symbols.json 加载到内存字典中。
+    """
+    index = _indexes.get(symbols_path)
+    if index is not None:
+        if index.refresh():
+            return index
+        del _indexes[symbols_path]
+        return None
+
+    cls = SymbolStore if symbols_path.endswith('.bin') else SymbolIndex
+    try:
+        index = cls(symbols_path)
+    except (OSError, ValueError):
+        return None
+    _indexes[symbols_path] = index
+    return index
+
+
+def load_module_index(mod_dir):
+    """获取模块目录的符号索引
+
+    模块目录中有 refs.bin 时返回全局符号表上的模块视图，否则使用模块自己的符号表
+    （优先二进制格式）。
+    """
+    refs_path = os.path.join(mod_dir, REFS_NAME)
+    view = _indexes.get(refs_path)
+    if view is not None:
+        if view.refresh():
+            return view
+        del _indexes[refs_path]
+    if os.path.exists(refs_path):
+        table = load_symbol_file(os.path.dirname(os.path.abspath(mod_dir)))
+        if table is not None:
+            try:
+                view = ModuleView(table, refs_path)
+            except OSError:
+                return None
+            _indexes[refs_path] = view
+            return view
+    return load_symbol_file(mod_dir)
+
+
+def load_symbol_file(directory):
+    """获取目录中的符号表索引，优先使用二进制符号表"""
+    paths = [os.path.join(directory, name) for name in SYMBOL_FILES]
+    for path in paths:
+        if path in _indexes:
+            index = load_index(path)
+            if index is not None:
+                return index
+    for path in paths:
+        index = load_index(path)
+        if index is not None:
+            return index
+    return None
+
+
+def indexed_modules(output_dir):
+    """输出目录中带符号索引（refs.bin 或模块自己的符号表）的模块目录名，按名称排序"""
+    modules = []
+    for name in sorted(os.listdir(output_dir)):
+        mod_dir = os.path.join(output_dir, name)
+        if any(os.path.exists(os.path.join(mod_dir, f)) for f in (REFS_NAME,) + SYMBOL_FILES):
+            modules.append(name)
+    return modules
+
+
+def find_definitions(output_dir, modules, symbol_name, symbol_type):
+    """在各模块的符号索引中查找符号定义，返回 [{'module', 'file', 'line', 'symbol', 'type'}]"""
+    results = []
+    for mod in modules:
+        index = load_module_index(os.path.join(output_dir, mod))
+        if index is None:
+            continue
+        for _, item in index.lookup(symbol_name, [symbol_type]):
+            results.append({
+                'module': mod,
+                'file': item['file'],
+                'line': item['line'],
+                'symbol': symbol_name,
+                'type': symbol_type
+            })
+    return results
+
+
+def search_definitions(output_dir, modules, query, symbol_types=None, limit=20, max_distance=2):
+    """在各模块中按前缀 / 编译器后缀 / 编辑距离搜索符号，精确匹配排在前面
+
+    返回 [{'module', 'file', 'line', 'symbol', 'type', 'match', 'distance'}]，最多 limit 条。
+    """
+    results = []
+    for mod in modules:
+        index = load_module_index(os.path.join(output_dir, mod))
+        if index is None:
+            continue
+        search, ids = search_index(index)
+        for hit in search.search(query, limit, max_distance, symbol_types, ids):
+            item = hit['item']
+            results.append({
+                'module': mod,
+                'file': item['file'],
+                'line': item['line'],
+                'symbol': hit['name'],
+                'type': hit['category'],
+                'match': hit['match'],
+                'distance': hit['distance']
+            })
+    order = {'exact': 0, 'stripped': 1, 'prefix': 2, 'fuzzy': 3}
+    results.sort(key=lambda r: (order[r['match']], r['distance'], r['symbol']))
+    return results[:limit]
@@ -0,0 +1,222 @@
+import re
+from bisect import bisect_left
+
+# 编译器在克隆或拆分函数时附加的后缀：foo.isra.0、foo.constprop.0、foo.part.3、foo.cold、
+# foo.lto_priv.0、foo.llvm.123456，可以连续出现（foo.constprop.0.isra.0）
+SUFFIX_PATTERN = re.compile(
+    r'(?:\.(?:isra|constprop|part|cold|lto_priv|llvm|localalias|\d+)(?:\.\d+)*)+$')
+
+GRAM = 3
+_PAD = '\0' * (GRAM - 1)
+
+
+def strip_suffix(name):
+    """去掉编译器附加的后缀，foo.isra.0 -> foo"""
+    return SUFFIX_PATTERN.sub('', name)
+
+
+def grams(name):
+    """名称的 3-gram 集合（首尾填充，短名称也至少有一个 gram）"""
+    padded = _PAD + name + _PAD
+    return {padded[i:i + GRAM] for i in range(len(padded) - GRAM + 1)}
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein 距离（Hyyrö 的位并行算法，每个字符几次整数运算），超过 limit 时返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a:
+        return len(b)
+    peq = {}
+    for i, c in enumerate(a):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    mask = (1 << len(a)) - 1
+    high = 1 << (len(a) - 1)
+    pv, mv, score = mask, 0, len(a)
+    for c in b:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return min(score, limit + 1)
+
+
+def _bitset(positions, size):
+    bits = bytearray((size + 7) // 8)
+    for n in positions:
+        bits[n >> 3] |= 1 << (n & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _at_least(masks, threshold, full):
+    """各位置上为 1 的掩码个数 >= threshold 的位置（按位切片的计数器加比较）"""
+    counter = []  # counter[j]：计数的第 j 位
+    for carry in masks:
+        for j in range(len(counter)):
+            if not carry:
+                break
+            counter[j], carry = counter[j] ^ carry, counter[j] & carry
+        else:
+            if carry:
+                counter.append(carry)
+    if threshold >= 1 << len(counter):
+        return 0
+    result, equal = 0, full
+    for j in reversed(range(len(counter))):
+        if (threshold >> j) & 1:
+            equal &= counter[j]
+        else:
+            result |= equal & counter[j]
+            equal &= ~counter[j]
+    return result | equal
+
+
+def _bits(mask):
+    n = 0
+    while mask:
+        low = mask & -mask
+        n = low.bit_length() - 1
+        yield n
+        mask ^= low
+
+
+class SymbolSearch:
+    """符号表上的前缀和模糊搜索索引
+
+    对去掉编译器后缀的名称建立有序列表（前缀查询用二分查找）和 3-gram 倒排表
+    （模糊查询）。编辑距离为 k 时，两个名称至少共享 |gram(查询)| - 3k 个 gram。
+    内核符号名的词汇很少，常见 gram 的倒排表很长，所以倒排表按名称长度分桶，
+    常见 gram 保存为整数位图：查询只涉及长度相差不超过 k 的几个桶，用按位切片的
+    计数器一次算出满足 gram 数条件的候选，只对这些候选计算编辑距离。
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.stamp = getattr(table, '_stamp', None)
+        records = {}
+        for name, i in table.names():
+            records.setdefault(strip_suffix(name), []).append(i)
+        self.names = sorted(records)
+        self.records = [records[name] for name in self.names]
+        by_length = {}
+        for n, name in enumerate(self.names):
+            by_length.setdefault(len(name), []).append(n)
+        # 长度 -> (桶内名称下标, {gram: 位图或桶内位置列表}, 全 1 掩码)
+        self.buckets = {length: self._bucket(ids) for length, ids in by_length.items()}
+
+    def _bucket(self, ids):
+        postings = {}
+        for local, n in enumerate(ids):
+            for gram in grams(self.names[n]):
+                postings.setdefault(gram, []).append(local)
+        # 位图按桶大小占用空间，只为常见 gram 预先建立；罕见的在查询时转换
+        dense = max(8, len(ids) // 64)
+        postings = {g: _bitset(p, len(ids)) if len(p) >= dense else p
+                    for g, p in postings.items()}
+        return ids, postings, (1 << len(ids)) - 1
+
+    def _exact(self, name):
+        n = bisect_left(self.names, name)
+        if n < len(self.names) and self.names[n] == name:
+            return n
+        return None
+
+    def _prefix(self, prefix):
+        """按名称顺序生成以 prefix 开头的名称下标"""
+        n = bisect_left(self.names, prefix)
+        while n < len(self.names) and self.names[n].startswith(prefix):
+            yield n
+            n += 1
+
+    def _fuzzy(self, name, max_distance):
+        """编辑距离不超过 max_distance（短名称更小）的名称，返回按距离排序的 [(距离, 名称下标)]"""
+        query = grams(name)
+        # 短名称允许的编辑距离更小，否则几乎任何名称都能匹配
+        k = min(max_distance, len(name) // 4)
+        needed = len(query) - GRAM * k
+        if k == 0 or needed <= 0:
+            return []
+        found = []
+        for length in range(len(name) - k, len(name) + k + 1):
+            if length not in self.buckets:
+                continue
+            ids, postings, full = self.buckets[length]
+            masks = []
+            for gram in query:
+                mask = postings.get(gram, 0)
+                masks.append(_bitset(mask, len(ids)) if isinstance(mask, list) else mask)
+            for local in _bits(_at_least(masks, needed, full)):
+                other = self.names[ids[local]]
+                d = edit_distance(name, other, k)
+                if d <= k:
+                    found.append((d, other, ids[local]))
+        found.sort()
+        return [(d, n) for d, _, n in found]
+
+    def search(self, query, limit=20, max_distance=2, categories=None, ids=None):
+        """按名称搜索：精确（忽略编译器后缀）、前缀、编辑距离，依次排列
+
+        返回 [{'name', 'match', 'distance', 'category', 'item'}]，match 为
+        'exact' / 'stripped' / 'prefix' / 'fuzzy'。ids 为可选的记录下标集合（模块视图使用）。
+        ids 和 categories 在扫描候选时过滤，一直扫描到有 limit 条通过过滤的结果，
+        全局表中排在前面的其他模块或类别的名称不占名额。
+        """
+        name = strip_suffix(query)
+        results = []
+        seen = set()
+
+        def add(match, distance, n):
+            """加入名称 n 下通过过滤的记录，结果已够 limit 条时返回 True"""
+            seen.add(n)
+            for i in self.records[n]:
+                if ids is not None and i not in ids:
+                    continue
+                category, item = self.table.entry(i)
+                if categories is not None and category not in categories:
+                    continue
+                results.append({'name': item['name'], 'match': match, 'distance': distance,
+                                'category': category, 'item': item})
+                if len(results) >= limit:
+                    return True
+            return False
+
+        exact = self._exact(name)
+        if exact is not None and add('exact' if name == query else 'stripped', 0, exact):
+            return results
+        for n in self._prefix(name):
+            if n not in seen and add('prefix', len(self.names[n]) - len(name), n):
+                return results
+        # 已有精确匹配或过滤后的结果已够 limit 条时不再做模糊查询
+        if exact is None and len(results) < limit:
+            for d, n in self._fuzzy(name, max_distance):
+                if n not in seen and add('fuzzy', d, n):
+                    return results
+        return results
+
+
+_searches = {}
+
+
+def search_index(index):
+    """符号索引对应的搜索索引，首次使用时建立；符号表重新加载后自动重建
+
+    index 可以是 SymbolIndex、SymbolStore，或全局表上的 ModuleView（搜索限定在模块引用的记录）。
+    返回 (SymbolSearch, 记录下标集合或 None)。
+    """
+    table = getattr(index, 'table', index)
+    ids = index.refs if table is not index else None
+    search = _searches.get(id(table))
+    stamp = getattr(table, '_stamp', None)
+    if search is None or search.table is not table or search.stamp != stamp:
+        search = SymbolSearch(table)
+        _searches[id(table)] = search
+    return search, ids
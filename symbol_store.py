@@ -0,0 +1,267 @@
+import os
+import mmap
+import json
+import time
+import struct
+from bisect import bisect_left, bisect_right
+
+# 二进制符号表格式（小端）：
+#   文件头   MAGIC, 版本, 字符串数, 记录数, 元数据长度
+#   元数据   JSON：各类别名称、类型字段名、是否带列号
+#   字符串表 (字符串数 + 1) 个 u32 偏移 + UTF-8 数据；名称、文件、类型统一驻留，
+#            按字节序排序，因此字符串 id 的大小顺序与字符串顺序一致
+#   记录     定长 (name_id, file_id, type_id, line, column, kind)，保持原始顺序
+#   名称索引 按 name_id 排序的 (name_id, 记录下标)，用于二分查找
+#   行号索引 按行号排序的 (line, 记录下标)，用于 (文件, 行号) 查找
+MAGIC = b'SYMS'
+VERSION = 1
+HEADER = struct.Struct('<4sIIII')
+RECORD = struct.Struct('<IIIIIH2x')
+PAIR = struct.Struct('<II')
+U32 = struct.Struct('<I')
+
+TYPE_KEYS = ('return_type', 'type')
+
+# 输出目录中的生成标记：SymbolTable.write 写完全局符号表和所有 refs.bin 后最后写入。
+# 读取方按它判断是否重新加载，全局表和各模块的引用总是对应同一次生成
+GENERATION_NAME = 'generation'
+
+
+def write_generation(directory):
+    """写入新的生成标记（原子替换）"""
+    import tempfile  # 写入路径才用到，查询方不导入
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(f"{time.time_ns()}.{os.getpid()}")
+    os.replace(tmp_path, os.path.join(directory, GENERATION_NAME))
+
+
+def file_stamp(path):
+    """符号表文件的版本戳：同目录有生成标记时为标记内容，否则为 (mtime, size)
+
+    文件不存在时抛出 OSError。
+    """
+    st = os.stat(path)
+    try:
+        with open(os.path.join(os.path.dirname(path), GENERATION_NAME), 'r') as f:
+            return f.read()
+    except FileNotFoundError:
+        return st.st_mtime_ns, st.st_size
+
+
+def write_store(path, symbols):
+    """把 {类别: [符号条目]} 写成紧凑的二进制符号表（原子替换）"""
+    kinds = []
+    rows = []
+    strings = set()
+    for kind_id, (category, items) in enumerate(symbols.items()):
+        type_key = None
+        has_column = False
+        for item in items:
+            type_key = type_key or next((k for k in TYPE_KEYS if k in item), None)
+            has_column = has_column or 'column' in item
+        kinds.append({'name': category, 'type_key': type_key, 'column': has_column})
+        for item in items:
+            row = (item['name'], item['file'], item.get(type_key, '') if type_key else '',
+                   item['line'], item.get('column', 0), kind_id)
+            strings.update(row[:3])
+            rows.append(row)
+
+    # 字符串按字节序驻留
+    encoded = sorted(s.encode() for s in strings)
+    string_ids = {data.decode(): sid for sid, data in enumerate(encoded)}
+    records = [(string_ids[name], string_ids[file], string_ids[type_], line, column, kind_id)
+               for name, file, type_, line, column, kind_id in rows]
+    by_name = sorted((r[0], i) for i, r in enumerate(records))
+    by_line = sorted((r[3], i) for i, r in enumerate(records))
+    meta = json.dumps({'kinds': kinds}).encode()
+
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(encoded), len(records), len(meta)))
+        f.write(meta)
+        offset = 0
+        offsets = bytearray()
+        for data in encoded:
+            offsets += U32.pack(offset)
+            offset += len(data)
+        offsets += U32.pack(offset)
+        f.write(offsets)
+        f.write(b''.join(encoded))
+        f.write(b''.join(RECORD.pack(*r) for r in records))
+        f.write(b''.join(PAIR.pack(*p) for p in by_name))
+        f.write(b''.join(PAIR.pack(*p) for p in by_line))
+    os.replace(tmp_path, path)
+
+
+class _Column:
+    """内存映射数组的只读序列视图，供 bisect 直接二分查找"""
+
+    def __init__(self, n, getter):
+        self._n = n
+        self._getter = getter
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        return self._getter(i)
+
+
+class SymbolStore:
+    """内存映射的二进制符号表
+
+    查询时只解码用到的记录和字符串，不会反序列化整个文件。
+    接口与 SymbolIndex 一致：lookup / at / refresh。
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._mm = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def reload(self):
+        stamp = file_stamp(self.path)
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_strings, n_records, meta_len = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            mm.close()
+            raise ValueError(f"不是有效的符号表文件: {self.path}")
+
+        pos = HEADER.size
+        self.kinds = json.loads(mm[pos:pos + meta_len])['kinds']
+        pos += meta_len
+        self._offsets_pos = pos
+        pos += (n_strings + 1) * 4
+        self._strings_pos = pos
+        pos += U32.unpack_from(mm, self._offsets_pos + n_strings * 4)[0]
+        self._records_pos = pos
+        pos += n_records * RECORD.size
+        self._by_name_pos = pos
+        pos += n_records * PAIR.size
+        self._by_line_pos = pos
+
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mm
+        self.n_strings = n_strings
+        self.n_records = n_records
+        self._strings = _Column(n_strings, self._string_bytes)
+        self._name_keys = _Column(n_records, lambda k: self._pair(self._by_name_pos, k)[0])
+        self._line_keys = _Column(n_records, lambda k: self._pair(self._by_line_pos, k)[0])
+        self._stamp = stamp
+        self._checked_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """文件在磁盘上变化时重新映射；文件被删除时返回 False
+
+        force: 不等待 check_interval，立即检查
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return True
+        self._checked_at = now
+        try:
+            stamp = file_stamp(self.path)
+        except OSError:
+            return False
+        if stamp != self._stamp:
+            self.reload()
+        return True
+
+    def _string_bytes(self, sid):
+        start, end = struct.unpack_from('<II', self._mm, self._offsets_pos + sid * 4)
+        return self._mm[self._strings_pos + start:self._strings_pos + end]
+
+    def _string(self, sid):
+        return self._string_bytes(sid).decode()
+
+    def _record(self, i):
+        return RECORD.unpack_from(self._mm, self._records_pos + i * RECORD.size)
+
+    def _entry(self, record):
+        """把一条记录还原为 (类别, 符号条目)，字段与 JSON 输出一致"""
+        name_id, file_id, type_id, line, column, kind_id = record
+        kind = self.kinds[kind_id]
+        item = {'name': self._string(name_id), 'file': self._string(file_id), 'line': line}
+        if kind['column']:
+            item['column'] = column
+        if kind['type_key']:
+            item[kind['type_key']] = self._string(type_id)
+        return kind['name'], item
+
+    def _pair(self, base, k):
+        return PAIR.unpack_from(self._mm, base + k * PAIR.size)
+
+    def string_id(self, s):
+        """字符串在字符串表中的 id，不存在时返回 None"""
+        target = s.encode()
+        sid = bisect_left(self._strings, target)
+        if sid < self.n_strings and self._strings[sid] == target:
+            return sid
+        return None
+
+    def entry(self, i):
+        """第 i 条记录，(类别, 符号条目)"""
+        return self._entry(self._record(i))
+
+    def names(self):
+        """按名称顺序生成 (名称, 记录下标)，每个名称只解码一次"""
+        name = last_id = None
+        for k in range(self.n_records):
+            name_id, i = self._pair(self._by_name_pos, k)
+            if name_id != last_id:
+                name, last_id = self._string(name_id), name_id
+            yield name, i
+
+    def lookup(self, name, categories=None, ids=None):
+        """按名称二分查找，可限定类别，按类别顺序返回 [(类别, 条目), ...]
+
+        ids: 可选的记录下标集合，只返回其中的记录（模块视图使用）
+        """
+        sid = self.string_id(name)
+        if sid is None:
+            return []
+        lo = bisect_left(self._name_keys, sid)
+        hi = bisect_right(self._name_keys, sid, lo)
+        records = [self._pair(self._by_name_pos, k)[1] for k in range(lo, hi)]
+        if ids is not None:
+            records = [i for i in records if i in ids]
+        entries = [self.entry(i) for i in records]
+        if categories is None:
+            return entries
+        return [e for c in categories for e in entries if e[0] == c]
+
+    def at(self, file, line, ids=None):
+        """按 (文件, 行号) 查找符号，文件可以是相对路径或文件名"""
+        lo = bisect_left(self._line_keys, line)
+        hi = bisect_right(self._line_keys, line, lo)
+        entries = []
+        for k in range(lo, hi):
+            i = self._pair(self._by_line_pos, k)[1]
+            if ids is not None and i not in ids:
+                continue
+            record = self._record(i)
+            path = self._string(record[1])
+            if path == file or os.path.basename(path) == file:
+                entries.append(self._entry(record))
+        return entries
+
+    def to_dict(self):
+        """还原为 {类别: [符号条目]}，用于导出 JSON"""
+        symbols = {kind['name']: [] for kind in self.kinds}
+        for i in range(self.n_records):
+            category, item = self._entry(self._record(i))
+            symbols[category].append(item)
+        return symbols
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
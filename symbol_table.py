@@ -0,0 +1,118 @@
+import os
+import json
+import struct
+
+from symbol_store import write_store, write_generation
+
+# 模块目录中的引用文件：全局符号表记录下标的 u32 数组（小端）
+REFS_NAME = 'refs.bin'
+# 符号表文件名：全局符号表使用其中选定的格式；旧版本每个模块也各自保存一份完整符号表
+MODULE_SYMBOL_FILES = ('symbols.bin', 'symbols.json')
+
+
+def symbol_key(item):
+    """符号的去重键：USR（没有时用名称）加定义位置"""
+    return item.get('usr') or item['name'], item['file'], item['line']
+
+
+def dedupe_symbols(symbols, into=None):
+    """按 symbol_key 去重合并 {类别: [符号条目]}，保持首次出现的顺序"""
+    merged = into if into is not None else {}
+    seen = {category: {symbol_key(item) for item in items} for category, items in merged.items()}
+    for category, items in symbols.items():
+        keys = seen.setdefault(category, set())
+        target = merged.setdefault(category, [])
+        for item in items:
+            key = symbol_key(item)
+            if key not in keys:
+                keys.add(key)
+                target.append(item)
+    return merged
+
+
+def write_refs(path, ids):
+    import tempfile  # 写入路径才用到，查询方不导入
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(struct.pack(f'<{len(ids)}I', *ids))
+    os.replace(tmp_path, path)
+
+
+def read_refs(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return struct.unpack(f'<{len(data) // 4}I', data)
+
+
+class SymbolTable:
+    """所有模块共用的全局符号表
+
+    共享头文件中的声明在每个 TU 中都会被提取一次；这里按 USR 加位置只保留一份，
+    并记录引用它的模块。各模块目录只保存指向全局表记录的下标（refs.bin）。
+    """
+
+    def __init__(self):
+        self.entries = {}  # 类别 -> {去重键: 符号条目}，保持插入顺序
+        self.modules = {}  # (类别, 去重键) -> [模块]
+
+    def add(self, module, symbols):
+        for category, items in symbols.items():
+            entries = self.entries.setdefault(category, {})
+            for item in items:
+                key = symbol_key(item)
+                entries.setdefault(key, item)
+                users = self.modules.setdefault((category, key), [])
+                if module not in users:
+                    users.append(module)
+
+    def symbols(self):
+        """{类别: [符号条目]}，记录顺序与 write_store 的记录下标一致"""
+        return {category: list(entries.values()) for category, entries in self.entries.items()}
+
+    def refs(self):
+        """{模块: [记录下标]}"""
+        refs = {}
+        record = 0
+        for category, entries in self.entries.items():
+            for key in entries:
+                for module in self.modules[(category, key)]:
+                    refs.setdefault(module, []).append(record)
+                record += 1
+        return refs
+
+    def write(self, output_dir, formats=('symbols.bin',), modules=()):
+        """保存全局符号表和各模块的引用
+
+        formats: 全局符号表文件名（symbols.bin / symbols.json），
+                 其他格式的旧全局表会被删除，避免读取方把新的引用用在旧表上。
+        modules: 需要写入引用的模块，没有符号的模块写入空引用。
+        """
+        symbols = self.symbols()
+        for name in formats:
+            path = os.path.join(output_dir, name)
+            if name == 'symbols.bin':
+                write_store(path, symbols)
+            else:
+                annotated = {
+                    category: [dict(item, modules=self.modules[(category, key)])
+                               for key, item in entries.items()]
+                    for category, entries in self.entries.items()
+                }
+                with open(path, 'w') as f:
+                    json.dump(annotated, f, indent=2)
+        for name in MODULE_SYMBOL_FILES:
+            stale = os.path.join(output_dir, name)
+            if name not in formats and os.path.exists(stale):
+                os.remove(stale)
+
+        refs = self.refs()
+        for module in set(modules) | set(refs):
+            mod_dir = os.path.join(output_dir, module)
+            os.makedirs(mod_dir, exist_ok=True)
+            write_refs(os.path.join(mod_dir, REFS_NAME), refs.get(module, []))
+            for name in MODULE_SYMBOL_FILES:
+                stale = os.path.join(mod_dir, name)
+                if os.path.exists(stale):
+                    os.remove(stale)
+        # 最后写入生成标记，读取方据此把全局表和引用一起重新加载
+        write_generation(output_dir)
@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+import tempfile
+
+MANIFEST_NAME = 'manifest.json'
+# 清单格式版本，版本不同的清单视为不存在（模块全部重新生成）
+MANIFEST_VERSION = 3
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def args_hash(args):
+    """编译参数的哈希，参数变化时源文件需要重新解析"""
+    return hashlib.sha256('\0'.join(args).encode()).hexdigest()
+
+
+class UnitManifest:
+    """模块单元目录中的输入/输出清单
+
+    inputs:  {路径: {'mtime': ns, 'size': 字节, 'sha256': 哈希}}，源文件及其包含的头文件
+    files:   {源文件: {'args': 参数哈希, 'deps': [头文件], 'symbols': {...}, 'links': {...}}}
+             参数包括编译参数和影响结果的解析设置（解析选项、宏提取、符号和头文件范围）
+    outputs: [相对模块目录的输出文件]
+    build_hash: 构建信息（模块配置、源文件列表、参数、解析设置）的哈希
+    检查输入时先比较 (mtime, size)，不同时再比较哈希，只被 touch 过的文件不算变化。
+    """
+
+    def __init__(self, mod_dir):
+        self.mod_dir = mod_dir
+        self.path = os.path.join(mod_dir, MANIFEST_NAME)
+        self.inputs = {}
+        self.files = {}
+        self.outputs = []
+        self.build_hash = None
+        self._checked = {}  # 本次运行中已检查过的输入：路径 -> 是否未变化
+
+    @classmethod
+    def load(cls, mod_dir):
+        manifest = cls(mod_dir)
+        try:
+            with open(manifest.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if data.get('version') != MANIFEST_VERSION:
+            return manifest
+        manifest.inputs = data.get('inputs', {})
+        manifest.files = data.get('files', {})
+        manifest.outputs = data.get('outputs', [])
+        manifest.build_hash = data.get('build_hash')
+        return manifest
+
+    def save(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.mod_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'inputs': self.inputs, 'files': self.files,
+                       'outputs': self.outputs, 'build_hash': self.build_hash}, f)
+        os.replace(tmp_path, self.path)
+
+    def input_unchanged(self, path):
+        """输入文件与清单记录一致时返回 True"""
+        if path in self._checked:
+            return self._checked[path]
+        record = self.inputs.get(path)
+        unchanged = False
+        try:
+            st = os.stat(path)
+            if record is not None:
+                if record['mtime'] == st.st_mtime_ns and record['size'] == st.st_size:
+                    unchanged = True
+                elif record['size'] == st.st_size and record['sha256'] == _sha256(path):
+                    record['mtime'] = st.st_mtime_ns  # 内容未变，只更新时间戳
+                    unchanged = True
+        except OSError:
+            pass
+        self._checked[path] = unchanged
+        return unchanged
+
+    def is_stale(self, src_file, args):
+        """源文件、编译参数或任一包含的头文件变化时返回 True"""
+        entry = self.files.get(src_file)
+        if entry is None or entry['args'] != args_hash(args):
+            return True
+        return not all(self.input_unchanged(p) for p in [src_file] + entry['deps'])
+
+    def outputs_present(self):
+        return bool(self.outputs) and all(
+            os.path.exists(os.path.join(self.mod_dir, out)) for out in self.outputs)
+
+    def record_input(self, path):
+        st = os.stat(path)
+        self.inputs[path] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'sha256': _sha256(path)}
+        self._checked[path] = True
+
+    def record_file(self, src_file, args, deps, symbols, links=None):
+        """记录一个重新处理过的源文件及其依赖"""
+        for path in [src_file] + list(deps):
+            if not self._checked.get(path):
+                try:
+                    self.record_input(path)
+                except OSError:
+                    pass
+        self.files[src_file] = {'args': args_hash(args), 'deps': list(deps), 'symbols': symbols,
+                                'links': links}
+
+    def prune(self, source_files):
+        """删除已不属于模块或已从磁盘删除的源文件，返回是否有删除
+
+        Makefile 中仍列出但文件已删除时同样视为变化，模块随之重新生成，不再提供其旧符号。
+        """
+        source_files = set(source_files)
+        removed = [f for f in self.files if f not in source_files or not os.path.exists(f)]
+        for f in removed:
+            del self.files[f]
+        live = set()
+        for src_file, entry in self.files.items():
+            live.add(src_file)
+            live.update(entry['deps'])
+        self.inputs = {p: r for p, r in self.inputs.items() if p in live}
+        return bool(removed)